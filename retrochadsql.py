@@ -1,24 +1,56 @@
 #!/usr/bin/python2
 
 
-"""RetroChadSql uses Tk and takes no command arguments. It has three
+"""RetroChadSql uses Tk and normally takes no command arguments. Given
+--watch PATH, where PATH is the watch.json that watch mode saves in the
+Download folder, it watches without Tk, as from cron or a service.
+Given --run PATH, it does one run of such a file without Tk, and given
+--plan PATH, it reports what such a run would do and cost, without
+doing any of it. Given --coordinate PATH, it hands the file's years out
+to workers, each started, on any machine, with --work PATH, where PATH
+is a JSON file of the worker's settings (see Worker). Given --restore
+FOLDER PATH, it checks the season snapshots saved in FOLDER and merges
+them into the SQLite database at PATH. It has four
 public constants, in case someone chooses to inspect it from elsewhere:
 
 LICENSE is the terms under which RetroChadSQL is liceensed.
 VERSION is the RetroChadSQL version number.
 AVAILABLE_YEARS is a string indicating the years Retrosheet is known to
 provide.
+SOURCE_URL is where each year's zip file is downloaded from.
+
+It also has functions for using Retrosheet data straight from Python,
+without a database:
+
+read_rows() generates the typed rows of one table for one year, as
+Chadwick makes them.
+read_batches() does the same, a list of rows at a time.
+read_chunks() generates a loaded table's rows in compactly typed
+DataFrames or NumPy record arrays, a fixed number of rows at a time.
+BaseOutMatrices computes a year's run expectancy and base-out
+transitions from its assembled events file (NumPy required).
+GameStateIndex looks up the game state before any event of a year,
+from a memory-mapped file made from its assembled events file.
+Snapshots checks and restores the per-season SQLite files saved after
+loading.
+QueryCache answers repeated queries of a loaded database from results
+kept on disk, until a year they read is loaded again.
 
 Required: Python 2.7 (or possibly Python 3 and automatic conversion) and
 the Tk librarires that are usually but not always installed with Python.
 
 RetroChadSql can perform all or some of its tasks, which it will do for
 each year the user selects. Those tasks are:
--- downloading zipped play by play data from Retrosheet
+-- downloading zipped play by play data from Retrosheet, optionally
+   watching for changed years and redoing the other tasks for those
 -- unzipping those files
--- using Chadwick to assemble the data into CSV files
+-- using Chadwick to assemble the data into CSV files, optionally
+   computing run expectancy from the events or deriving a pitches
+   table, one row per pitch, from their pitch sequences
 -- writing SQL data definitions, using the structure of the data
--- loading the data into an SQL database
+-- loading the data into an SQL database, optionally refreshing the
+   season totals of each year loaded, and into SQLite or Parquet files,
+   optionally saving a checksummed snapshot of each year loaded
 
 Licensing information may be read in the code directly following the
 import statements and is visible in the Tk window.
@@ -46,10 +78,34 @@ import collections
 import sys
 import urllib2
 from BaseHTTPServer import BaseHTTPRequestHandler as BHRH
+from BaseHTTPServer import HTTPServer
+from SocketServer import ThreadingMixIn
 from contextlib import closing
 from zipfile import ZipFile, BadZipfile
 import subprocess
 import re
+import signal
+import threading
+import Queue
+import csv
+import datetime
+import itertools
+import time
+import glob
+import json
+import heapq
+import socket
+import mmap
+import struct
+import zlib
+import hashlib
+import hmac
+import binascii
+import cPickle
+import tempfile
+import sqlite3
+import random
+import warnings
 
 
 LICENSE = """Copyright (c) 2014, All Timer Sports and Dvd Avins
@@ -91,6 +147,39 @@ range ::= 'nnnn-mmmm' where mmmm > nnnn; range is inclusive.
 
 """
 
+_LOAD_PROFILES = collections.OrderedDict([  # {name: {key: value}}
+    ('default', {
+        'description': 'Load with the server\'s session settings.',
+        'settings': [],
+        'transaction': False}),
+    ('relaxed checks', {
+        'description': 'Skip unique and foreign key checks while loading.',
+        'settings': [('unique_checks', '0'), ('foreign_key_checks', '0')],
+        'transaction': False}),
+    ('one transaction', {
+        'description': 'Load each year in a single transaction.',
+        'settings': [],
+        'transaction': True}),
+    ('bulk', {
+        'description': ('Skip unique and foreign key checks, use a 256 MB '
+                        'bulk insert buffer, and load each year in a single '
+                        'transaction.'),
+        'settings': [('unique_checks', '0'), ('foreign_key_checks', '0'),
+                     ('bulk_insert_buffer_size', '268435456')],
+        'transaction': True})])
+"""Session settings that can wrap each year's loading statements.
+
+settings are (variable, value) pairs. Each variable's value is saved
+before loading and restored afterwards.
+
+"""
+
+SOURCE_URL = 'http://www.retrosheet.org/events/{year}eve.zip'
+"""Where a year's zip file is downloaded from, unless the config gives
+a source_url of its own, such as a local stand-in for testing.
+
+"""
+
 
 class Environment(object):
     """Information about and methods for investigating the user's
@@ -178,14 +267,681 @@ class Environment(object):
         return (False, None)
 
 
+class Cancelled(Exception):
+    """Raised inside a run when the user has clicked Cancel."""
+
+
+class Shell(object):
+    """Runs shell commands in a way that lets a run be cancelled.
+
+    Any number of worker threads may share one Shell. cancel() stops
+    every command still in flight, along with its children, and makes
+    all later calls raise Cancelled. check() raises Cancelled if the
+    run has been cancelled, so long pure-Python loops can stop too.
+
+    """
+    """If this file is made into a package, this class and Cancelled
+    should get their own file.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._procs = set()
+        self._cancelled = threading.Event()
+
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def check(self):
+        """Raise Cancelled if cancel() has been called."""
+        if self._cancelled.is_set():
+            raise Cancelled()
+
+    def wait(self, seconds):
+        """Sleep for seconds, or until cancel(), then check()."""
+        self._cancelled.wait(seconds)
+        self.check()
+
+    def _start(self, command, **kwargs):
+        # Start command in its own process group so it can be killed...
+        # along with anything it starts, such as a redirecting shell.
+        self.check()
+        if os.name == 'posix':
+            kwargs['preexec_fn'] = os.setsid
+        proc = subprocess.Popen(command, shell=True, **kwargs)
+        with self._lock:
+            self._procs.add(proc)
+        if self._cancelled.is_set():  # Cancelled while starting.
+            self._kill(proc)
+        return proc
+
+    def _finish(self, proc):
+        with self._lock:
+            self._procs.discard(proc)
+        self.check()
+
+    def _kill(self, proc):
+        if proc.poll() is not None:
+            return
+        try:
+            if os.name == 'posix':
+                os.killpg(proc.pid, signal.SIGTERM)
+            else:
+                subprocess.call('taskkill /F /T /PID {pid}'.format(
+                    pid=proc.pid), shell=True)
+        except OSError: pass  # Finished on its own in the meantime.
+
+    def call(self, command, **kwargs):
+        """Run command and return its exit status."""
+        proc = self._start(command, **kwargs)
+        try:
+            return proc.wait()
+        finally:
+            self._finish(proc)
+
+    def check_output(self, command, **kwargs):
+        """Run command and return its output, like the subprocess
+        function of the same name.
+
+        """
+        proc = self._start(command, stdout=subprocess.PIPE, **kwargs)
+        try:
+            output = proc.communicate()[0]
+        finally:
+            self._finish(proc)
+        if proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, command,
+                                                output=output)
+        return output
+
+    def lines(self, command, **kwargs):
+        """Generate command's output a line at a time, as it is written.
+
+        If the generator is closed early, the command is killed.
+
+        """
+        kwargs.setdefault('bufsize', -1)
+        proc = self._start(command, stdout=subprocess.PIPE, **kwargs)
+        try:
+            for line in iter(proc.stdout.readline, ''):
+                yield line
+            proc.stdout.close()
+            proc.wait()
+        finally:
+            self._kill(proc)
+            self._finish(proc)
+        if proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, command)
+
+    def feed(self, command, chunks, **kwargs):
+        """Run command, writing each string of chunks to its standard
+        input as the chunks are made. Raise CalledProcessError, with
+        what the command wrote to standard error, if it fails.
+
+        """
+        proc = self._start(command, stdin=subprocess.PIPE,
+                           stderr=subprocess.PIPE, **kwargs)
+        try:
+            try:
+                for chunk in chunks:
+                    proc.stdin.write(chunk)
+            except IOError: pass  # The command quit. Its status says why.
+            try:
+                proc.stdin.close()
+            except IOError: pass
+            errors = proc.stderr.read()
+            proc.wait()
+        finally:
+            self._kill(proc)
+            self._finish(proc)
+        if proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, command,
+                                                output=errors)
+
+    def session(self, command, **kwargs):
+        """Start command with pipes to its standard input and output,
+        returning its process, for a conversation with it. Pass the
+        process to end() when done.
+
+        """
+        return self._start(command, stdin=subprocess.PIPE,
+                           stdout=subprocess.PIPE, **kwargs)
+
+    def end(self, proc):
+        """Close the input of a process from session(), and stop it."""
+        try:
+            proc.stdin.close()
+        except IOError: pass
+        try:
+            proc.stdout.read()
+            proc.wait()
+        finally:
+            self._kill(proc)
+            self._finish(proc)
+
+    def cancel(self):
+        """Stop all commands in flight and refuse to start others."""
+        self._cancelled.set()
+        with self._lock:
+            procs = list(self._procs)
+        for proc in procs:
+            self._kill(proc)
+
+
+def _sql_number(text):
+    # Return text's value the way MySQL reads a string as a number:
+    # its longest numeric prefix, or 0.
+    match = re.match(r'\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?', text)
+    if not match:
+        return 0
+    number = float(match.group(0))
+    return int(number) if number.is_integer() else number
+
+
+def _tweak_am_pm(values, raw):
+    # IF(t, STR_TO_DATE(t, "%Y/%m/%d %h:%i%p"), NULL)
+    def convert(value):
+        if not _sql_number(value):
+            return None
+        try:
+            return datetime.datetime.strptime(value.strip(),
+                                              '%Y/%m/%d %I:%M%p')
+        except ValueError:
+            return None
+    return [convert(value) for value in values]
+
+
+def _tweak_blank_null(values, raw):
+    # NULLIF(t, "")
+    return [None if value == '' else value for value in values]
+
+
+def _tweak_t_f(values, raw):
+    # CASE t WHEN "T" THEN TRUE WHEN "F" THEN FALSE END
+    flags = {'T': True, 'F': False}
+    return [flags.get(value.strip().upper()) for value in values]
+
+
+def _tweak_start_game_tm(values, raw):
+    # CASE WHEN t = 0 THEN NULL
+    #   WHEN DAYNIGHT_PARK_CD = "D" AND t > 800 THEN t * 100
+    #   ELSE (t + 1200) * 100 END
+    def convert(value, day_night):
+        number = _sql_number(value)
+        if number == 0:
+            return None
+        if day_night.strip().upper() == 'D' and number > 800:
+            return number * 100
+        return (number + 1200) * 100
+    return map(convert, values, raw['DAYNIGHT_PARK_CD'])
+
+
+def _tweak_wind_speed_park_ct(values, raw):
+    # NULLIF(t, -1)
+    return [None if _sql_number(value) == -1 else value for value in values]
+
+
+def _tweak_year_ct(values, raw):
+    # SUBSTRING(GAME_ID FROM 4 FOR 4)
+    return [game_id[3:7] for game_id in raw['GAME_ID']]
+
+
+def _tweak_zero_null(values, raw):
+    # NULLIF(t, 0)
+    return [None if _sql_number(value) == 0 else value for value in values]
+
+
+def _load_text(value):
+    # Write a tweaked value the way LOAD DATA would have stored it.
+    if value is None:
+        return r'\N'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(' ')
+    return str(value)
+
+
+def _batch_text(value):
+    # Return a value as the MySQL client's batch mode writes it, with...
+    # tabs, newlines, backslashes and NULs escaped, unescaped.
+    escapes = {'t': '\t', 'n': '\n', '0': '\0'}
+    return re.sub(r'\\(.)',
+                  lambda match: escapes.get(match.group(1), match.group(1)),
+                  value)
+
+
+def _batches(iterable, size):
+    # Generate lists of up to size items of iterable.
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _sized_batches(rows, max_bytes):
+    # Generate lists of CSV rows whose text, counted as the lengths of...
+    # their values and separators, comes to about max_bytes or less.
+    batch = []
+    size = 0
+    for row in rows:
+        batch.append(row)
+        size += sum(len(value) for value in row) + len(row)
+        if size >= max_bytes:
+            yield batch
+            batch = []
+            size = 0
+    if batch:
+        yield batch
+
+
+def _sql_literal(value):
+    # Return a typed value as a MySQL literal.
+    if value is None:
+        return 'NULL'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, (int, long, float)):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat(' ')
+    elif isinstance(value, (datetime.date, datetime.time)):
+        value = value.isoformat()
+    for char, escaped in (('\\', '\\\\'), ("'", "\\'"), ('\n', '\\n'),
+                          ('\r', '\\r'), ('\0', '\\0')):
+        value = value.replace(char, escaped)
+    return "'" + value + "'"
+
+
+_INT_TYPES = ['tinyint', 'smallint', 'mediumint', 'int', 'bigint']
+
+
+def _widens(new_type, old_type):
+    # Return True if new_type is a wider MySQL type of the same kind...
+    # as old_type, as information_schema gives it, such as...
+    # 'mediumint(8) unsigned' or 'varchar(100)'.
+    def parts(sql_type):
+        match = re.match(r'(\w+)(?:\((\d+)\))?( unsigned)?$',
+                         sql_type.strip().lower())
+        return match.groups() if match else (sql_type, None, None)
+    new_base, new_size, new_unsigned = parts(new_type)
+    old_base, old_size, old_unsigned = parts(old_type)
+    if new_base in _INT_TYPES and old_base in _INT_TYPES:
+        return (new_unsigned == old_unsigned and
+                _INT_TYPES.index(new_base) > _INT_TYPES.index(old_base))
+    if new_base == old_base == 'varchar':
+        return int(new_size) > int(old_size)
+    return False
+
+
+def _ansi_literal(value):
+    # Return a typed value as a standard SQL literal. Dates and times...
+    # are plain strings, which more engines accept than DATE '...'.
+    if value is None:
+        return 'NULL'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, (int, long, float)):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat(' ')
+    elif isinstance(value, (datetime.date, datetime.time)):
+        value = value.isoformat()
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _strptime_format(values, forms):
+    # Return the first of forms in which strptime() reads each of...
+    # values and strftime() writes it back the same, leaving out...
+    # blanks and NULLs. If none does, return the first.
+    values = [value for value in values if value not in ('', r'\N')]
+    for form in forms:
+        try:
+            if all(datetime.datetime.strptime(value, form).strftime(form) ==
+                   value for value in values):
+                return form
+        except ValueError: pass
+    return forms[0]
+
+
+def _duckdb_copy(table, columns, selected, path, names, null=None):
+    # Return DuckDB statements inserting into table's columns the...
+    # selected expressions over a CSV file's rows, having copied them...
+    # as text into a table of the file's header names. Blank...
+    # fields, and any that are null, are read as NULL. duckdb 0.1.x...
+    # has no read_csv() to select from the file itself, and can't...
+    # replay its log over a table made and dropped in one...
+    # transaction, so the table is emptied and left to be dropped...
+    # by the next load instead.
+    staged = table + '_csv'
+    options = 'HEADER'
+    if null is not None:
+        options += ', NULL ' + _ansi_literal(null)
+    return [
+        'DROP TABLE IF EXISTS {staged};'.format(staged=staged),
+        'CREATE TABLE {staged} (\n  {specs});'.format(
+            staged=staged, specs=',\n  '.join(name + ' VARCHAR'
+                                              for name in names)),
+        'COPY {staged} FROM {path} ({options});'.format(
+            staged=staged, path=_ansi_literal(path.replace('\\', '/')),
+            options=options),
+        ('INSERT INTO {table} ({columns})\n'
+         '  SELECT {selected}\n'
+         '  FROM {staged};').format(
+             table=table, staged=staged, columns=', '.join(columns),
+             selected=',\n    '.join(selected)),
+        'DELETE FROM {staged};'.format(staged=staged)]
+
+
+def _replace_file(temp_path, path):
+    # Rename a finished temporary file over path. Windows can't rename...
+    # over an existing file, so it's removed first there.
+    try:
+        os.rename(temp_path, path)
+    except OSError:
+        os.remove(path)
+        os.rename(temp_path, path)
+
+
+def _save_response(response, path, shell, progress=None):
+    # Write an HTTP response's body to path a block at a time, via a...
+    # temporary file so an interrupted download leaves no partial file.
+    # progress, if given, is called with the size of each block.
+    temp_path = path + '.part'
+    with closing(response), closing(open(temp_path, 'wb')) as out_file:
+        while True:
+            shell.check()
+            block = response.read(64 * 1024)
+            if not block:
+                break
+            out_file.write(block)
+            if progress is not None:
+                progress(len(block))
+    _replace_file(temp_path, path)
+    return {header: response.info().getheader(header)
+            for header in ('ETag', 'Last-Modified')
+            if response.info().getheader(header)}
+
+
+def _count_rows(path):
+    # Return the number of rows in a CSV file, not counting its header.
+    lines = 0
+    with closing(open(path, 'rb')) as csv_file:
+        for block in iter(lambda: csv_file.read(1024 * 1024), ''):
+            lines += block.count('\n')
+    return max(lines - 1, 0)
+
+
+def _file_digest(path):
+    # Return the SHA-1 digest of a file's contents, in hex.
+    sha = hashlib.sha1()
+    with closing(open(path, 'rb')) as in_file:
+        for block in iter(lambda: in_file.read(1024 * 1024), ''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _duration(seconds):
+    # Format a number of seconds, such as '1 h 5 min' or '40 s'.
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return '{0} h {1} min'.format(hours, minutes)
+    if minutes:
+        return '{0} min {1} s'.format(minutes, seconds)
+    return '{0} s'.format(seconds)
+
+
+def _conditional_request(url, path, validators):
+    # Return a Request for url that gets a 304 response if the file at...
+    # path, downloaded with validators, hasn't changed since.
+    request = urllib2.Request(url)
+    if os.path.exists(path):
+        if 'ETag' in validators:
+            request.add_header('If-None-Match', validators['ETag'])
+        if 'Last-Modified' in validators:
+            request.add_header('If-Modified-Since',
+                               validators['Last-Modified'])
+    return request
+
+
+def _read_validators(download_dir):
+    # Return {year: {header: value}} of the ETag and Last-Modified...
+    # headers each year's zip file was last downloaded with.
+    try:
+        with closing(open(os.path.join(download_dir,
+                                       'validators.json'))) as json_file:
+            return json.load(json_file)
+    except (IOError, ValueError):
+        return {}
+
+
+def _write_validators(download_dir, validators):
+    with closing(open(os.path.join(download_dir, 'validators.json'),
+                      'w')) as json_file:
+        json.dump(validators, json_file, indent=1, sort_keys=True)
+
+
+def _save_config(config, path):
+    # Write a run's config as JSON, which _load_config() reads back....
+    # Its connect string may hold a password, so the file is made...
+    # readable by its owner alone, as a new file that is renamed over...
+    # any old one.
+    temp_path = '{path}.{pid}.tmp'.format(path=path, pid=os.getpid())
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    with closing(os.fdopen(os.open(temp_path, os.O_WRONLY | os.O_CREAT |
+                                   os.O_EXCL, 0600), 'w')) as json_file:
+        json.dump(_config_json(config), json_file, indent=1)
+    _replace_file(temp_path, path)
+
+
+def _load_config(path):
+    # Return a config written by _save_config().
+    with closing(open(path)) as json_file:
+        return _config_from_json(json.load(
+            json_file, object_pairs_hook=collections.OrderedDict))
+
+
+def _config_json(config):
+    # Return a copy of a run's config that JSON can hold.
+    return dict(config, tables=sorted(config['tables']))
+
+
+def _config_from_json(config):
+    # Return a config loaded from JSON, in the types Input makes, so...
+    # tasks keep their order and strings are str.
+    config = _encoded(config)
+    config['tables'] = set(config['tables'])
+    return config
+
+
+def _year_config(config, year, mode):
+    # Return a copy of config for doing one year alone, outside the...
+    # Watcher or Coordinator whose settings mode names. All folders...
+    # are kept, as other years being done at the same time need them.
+    tasks = collections.OrderedDict()
+    for name, dic in config['tasks'].items():
+        tasks[name] = dict(dic, keep=True) if name != 'Load' else dict(dic)
+    config = dict(config, tasks=tasks, years=[year])
+    del config[mode]
+    if 'Chadwick' in config:
+        config['Chadwick'] = dict(config['Chadwick'], keep=True)
+    return config
+
+
+def _encoded(value):
+    # Return a value loaded from JSON with its unicode strings encoded.
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, list):
+        return map(_encoded, value)
+    if isinstance(value, dict):
+        return type(value)((_encoded(k), _encoded(v))
+                           for k, v in value.items())
+    return value
+
+
+def _import_pyarrow():
+    # Return the pyarrow module, with its parquet module imported, or...
+    # None if it isn't installed. Only ParquetSink needs it.
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def _import_duckdb():
+    # Return the duckdb module, or None if it isn't installed. Only...
+    # DuckDB targets need it. The builds for Python 2, 0.1.x and 0.2.0,...
+    # lack much of newer DuckDB SQL, so only what they have is used.
+    try:
+        import duckdb
+    except ImportError:
+        return None
+    return duckdb
+
+
+def _import_numpy():
+    # Return the numpy module, or None if it isn't installed. NumPy...
+    # is optional; only BaseOutMatrices needs it.
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _import_pandas():
+    # Return the pandas module, or None if it isn't installed. Only...
+    # read_chunks() uses it, and only when asked for DataFrames.
+    try:
+        import pandas
+    except ImportError:
+        return None
+    return pandas
+
+
+def _field_list(indexes):
+    # Return a Chadwick field list, such as '0-3,7,9-10', for a sorted...
+    # list of field indexes.
+    ranges = []
+    for index in indexes:
+        if ranges and ranges[-1][1] == index - 1:
+            ranges[-1][1] = index
+        else:
+            ranges.append([index, index])
+    return ','.join(str(first) if first == last else
+                    '{0}-{1}'.format(first, last) for first, last in ranges)
+
+
+def _in_scope(scope, file_name):
+    # Return whether a Retrosheet file may hold games within scope...
+    # (a dict as made by Input._parse_scope). Files other than event...
+    # files, such as rosters, are always in scope.
+    match = re.match(r'(\d{4})(\w{3})\.EV(\w)$', os.path.basename(file_name),
+                     re.IGNORECASE)
+    if not match:
+        return True
+    year, team, league = [part.upper() for part in match.groups()]
+    if scope['teams'] and team not in scope['teams']:
+        return False
+    if scope['leagues'] and league not in scope['leagues']:
+        return False
+    if scope['games'] and not [game for game in scope['games']
+                               if game[:3] == team and game[3:7] == year]:
+        return False
+    return True
+
+
+def _typed_count(value):
+    if value is None or value == '':
+        return None
+    return int(_sql_number(value)) if isinstance(value, str) else int(value)
+
+
+def _typed_date(value):
+    if not value:
+        return None
+    for form in ('%Y/%m/%d', '%Y-%m-%d', '%Y%m%d', '%y%m%d', '%m/%d/%Y'):
+        try:
+            return datetime.datetime.strptime(value, form).date()
+        except ValueError: pass
+    return None
+
+
+def _typed_datetime(value):
+    if not value or isinstance(value, datetime.datetime):
+        return value or None
+    for form in ('%Y/%m/%d %I:%M%p', '%Y-%m-%d %H:%M:%S'):
+        try:
+            return datetime.datetime.strptime(value, form)
+        except ValueError: pass
+    return None
+
+
+def _typed_flag(value):
+    if value is None or value == '':
+        return None
+    return value if isinstance(value, bool) else bool(_sql_number(value))
+
+
+def _typed_text(value):
+    return value
+
+
+def _typed_time(value):
+    if not value:
+        return None
+    for form in ('%H:%M:%S', '%H:%M', '%H%M'):
+        try:
+            return datetime.datetime.strptime(value, form).time()
+        except ValueError: pass
+    return None
+
+
 class Table:
 
-    _sql_data_types = {'count': {'MySQL': 'MEDIUMINT UNSIGNED'},
-                       'date': {'MySQL': 'DATE'},
-                       'datetime': {'MySQL': 'DATETIME'},
-                       'flag': {'MySQL': 'TINYINT UNSIGNED'},
-                       'text': {'MySQL': 'VARCHAR(200)'},
-                       'time': {'MySQL': 'TIME'}}
+    _sql_data_types = {
+        'count': {'MySQL': 'MEDIUMINT UNSIGNED', 'SQLite': 'INTEGER',
+                  'DuckDB': 'INTEGER'},
+        'date': {'MySQL': 'DATE', 'SQLite': 'TEXT',
+                 'DuckDB': 'DATE'},
+        'datetime': {'MySQL': 'DATETIME', 'SQLite': 'TEXT',
+                     'DuckDB': 'TIMESTAMP'},
+        'flag': {'MySQL': 'TINYINT UNSIGNED', 'SQLite': 'INTEGER',
+                 'DuckDB': 'TINYINT'},
+        'player': {'MySQL': 'MEDIUMINT UNSIGNED', 'SQLite': 'INTEGER',
+                   'DuckDB': 'INTEGER'},
+        'team': {'MySQL': 'SMALLINT UNSIGNED', 'SQLite': 'INTEGER',
+                 'DuckDB': 'SMALLINT'},
+        'text': {'MySQL': 'VARCHAR(200)', 'SQLite': 'TEXT',
+                 'DuckDB': 'VARCHAR'},
+        'time': {'MySQL': 'TIME', 'SQLite': 'TEXT',
+                 'DuckDB': 'TIME'}}
+
+    _python_types = {'count': _typed_count,
+                     'date': _typed_date,
+                     'datetime': _typed_datetime,
+                     'flag': _typed_flag,
+                     'player': _typed_count,
+                     'team': _typed_count,
+                     'text': _typed_text,
+                     'time': _typed_time}
+
+    _numpy_types = {'count': ('i4', -1),  # {data_type: (dtype, null)}
+                    'date': ('M8[D]', 'NaT'),
+                    'datetime': ('M8[s]', 'NaT'),
+                    'flag': ('?', False),
+                    'player': ('u4', 0),
+                    'team': ('u2', 0),
+                    'text': ('O', None),
+                    'time': ('m8[s]', 'NaT')}
 
     _column_types_literal = {  # {data_type: {table: [columns]}}
         'count': {
@@ -264,6 +1020,29 @@ class Table:
             'games': ['DH_FL'],
             'subs': ['BAT_HOME_ID']}}
 
+    _key_columns_literal = {  # {kind: {table: [columns]}}, see use_keys()
+        'player': {
+            'events': [
+                'BAT_ID', 'RESP_BAT_ID', 'PIT_ID', 'RESP_PIT_ID',
+                'POS2_FLD_ID', 'POS3_FLD_ID', 'POS4_FLD_ID', 'POS5_FLD_ID',
+                'POS6_FLD_ID', 'POS7_FLD_ID', 'POS8_FLD_ID', 'POS9_FLD_ID',
+                'BASE1_RUN_ID', 'BASE2_RUN_ID', 'BASE3_RUN_ID',
+                'RUN1_RESP_PIT_ID', 'RUN2_RESP_PIT_ID', 'RUN3_RESP_PIT_ID',
+                'REMOVED_FOR_PR_RUN1_ID', 'REMOVED_FOR_PR_RUN2_ID',
+                'REMOVED_FOR_PR_RUN3_ID', 'REMOVED_FOR_PH_BAT_ID',
+                'RUN1_RESP_CAT_ID', 'RUN2_RESP_CAT_ID', 'RUN3_RESP_CAT_ID'],
+            'games': [
+                'AWAY_START_PIT_ID', 'HOME_START_PIT_ID', 'WIN_PIT_ID',
+                'LOSE_PIT_ID', 'SAVE_PIT_ID', 'GWRBI_BAT_ID',
+                'AWAY_FINISH_PIT_ID', 'HOME_FINISH_PIT_ID'] + [
+                    '{side}_LINEUP{n}_BAT_ID'.format(side=side, n=n)
+                    for side in ('AWAY', 'HOME') for n in range(1, 10)],
+            'subs': ['SUB_ID', 'REMOVED_ID']},
+        'team': {
+            'events': ['AWAY_TEAM_ID', 'HOME_TEAM_ID', 'BAT_TEAM_ID',
+                       'FLD_TEAM_ID'],
+            'games': ['AWAY_TEAM_ID', 'HOME_TEAM_ID']}}
+
     _field_tweaks = {  # {tweak: (formula, {table: [fields]})}
         'AM_PM': (
             'IF({temp}, STR_TO_DATE({temp}, "%Y/%m/%d %h:%i%p"), NULL)',
@@ -303,40 +1082,147 @@ class Table:
         'zero_null': (
             'NULLIF({temp}, 0)',
             {'games': ['START_GAME_TM']})}
+
+    # DuckDB SQL reading a value such as '2004/05/13 02:05PM', as...
+    # STR_TO_DATE() does, with only what duckdb 0.1.x has. The hour,...
+    # which may be unpadded, is found from the value's end, counted...
+    # on 24 hours and padded with a zero by way of a 3-digit number.
+    _duckdb_am_pm = (
+        'CAST(SUBSTRING({value}, 1, 11) ||\n      '
+        'SUBSTRING(CAST(CAST(SUBSTRING({value}, 12, '
+        'CAST(LENGTH({value}) AS INTEGER) - 16)\n      '
+        'AS INTEGER) % 12 + 100 +\n      '
+        'CASE WHEN SUBSTRING({value}, '
+        'CAST(LENGTH({value}) AS INTEGER) - 1, 1)\n      '
+        'IN (\'P\', \'p\') THEN 12 ELSE 0 END AS VARCHAR), 2, 2) ||\n      '
+        'SUBSTRING({value}, CAST(LENGTH({value}) AS INTEGER) - 4, 3)\n      '
+        '|| \':00\' AS TIMESTAMP)')
+
+    _duckdb_tweaks = {  # {tweak: DuckDB equivalent of formula}
+        'AM_PM': ('CASE WHEN COALESCE({temp}, \'0\') IN (\'\', \'0\') '
+                  'THEN NULL\n      '
+                  'ELSE ' + _duckdb_am_pm.format(value='{temp}') + ' END'),
+        'blank_null': 'NULLIF({temp}, \'\')',
+        'T_F': 'CASE {temp} WHEN \'T\' THEN 1 WHEN \'F\' THEN 0 END',
+        'START_GAME_TM': (
+            'CASE WHEN CAST({temp} AS INTEGER) = 0 THEN NULL\n      '
+            'WHEN DAYNIGHT_PARK_CD = \'D\' AND CAST({temp} AS INTEGER) > 800 '
+            'THEN CAST({temp} AS INTEGER) * 100\n      '
+            'ELSE (CAST({temp} AS INTEGER) + 1200) * 100 END'),
+        'WIND_SPEED_PARK_CT': 'NULLIF(CAST({temp} AS INTEGER), -1)',
+        'year_ct': 'SUBSTRING(GAME_ID, 4, 4)',
+        'zero_null': 'NULLIF(CAST({temp} AS INTEGER), 0)'}
+
+    # {column type: [(strptime() format, DuckDB SQL reading it)], in...
+    # order}. CAST reads only ISO forms, unpadded or with slashes, so...
+    # the others are rearranged into one.
+    _duckdb_formats = {
+        'date': [
+            ('%Y/%m/%d', 'CAST({value} AS DATE)'),
+            ('%Y-%m-%d', 'CAST({value} AS DATE)'),
+            ('%Y%m%d', ('CAST(SUBSTRING({value}, 1, 4) || \'-\' || '
+                        'SUBSTRING({value}, 5, 2) || \'-\' || '
+                        'SUBSTRING({value}, 7, 2) AS DATE)')),
+            ('%y%m%d', ('CAST(CASE WHEN SUBSTRING({value}, 1, 2) < \'69\' '
+                        'THEN \'20\' ELSE \'19\' END || '
+                        'SUBSTRING({value}, 1, 2) || \'-\' || '
+                        'SUBSTRING({value}, 3, 2) || \'-\' || '
+                        'SUBSTRING({value}, 5, 2) AS DATE)')),
+            ('%m/%d/%Y', ('CAST(SUBSTRING({value}, 7, 4) || \'-\' || '
+                          'SUBSTRING({value}, 1, 2) || \'-\' || '
+                          'SUBSTRING({value}, 4, 2) AS DATE)'))],
+        'datetime': [
+            ('%Y-%m-%d %H:%M:%S', 'CAST({value} AS TIMESTAMP)'),
+            ('%Y/%m/%d %I:%M%p', _duckdb_am_pm)]}
+    _format_sample = 1000  # Rows read to find a column's format.
+
+    _tweak_functions = {  # {tweak: Python equivalent of formula}
+        'AM_PM': _tweak_am_pm,
+        'blank_null': _tweak_blank_null,
+        'T_F': _tweak_t_f,
+        'START_GAME_TM': _tweak_start_game_tm,
+        'WIND_SPEED_PARK_CT': _tweak_wind_speed_park_ct,
+        'year_ct': _tweak_year_ct,
+        'zero_null': _tweak_zero_null}
+
+    _computed_fields = ['year_ct']  # Not made by Chadwick.
+
+    _tweak_requires = {  # {tweak: [fields its formula reads]}
+        'START_GAME_TM': ['DAYNIGHT_PARK_CD'],
+        'year_ct': ['GAME_ID']}
+
+    _batch_size = 10000  # Rows per batch when transforming CSV files.
+
+    _natural_keys = {  # {table: [fields]}, see use_natural_key()
+        'events': ['GAME_ID', 'EVENT_ID'],
+        'games': ['GAME_ID'],
+        'subs': ['GAME_ID', 'EVENT_ID', 'SUB_ID', 'SUB_FLD_CD']}
+
+    _sort_run_bytes = 32 << 20  # Row text sorted in memory by sort_year().
+    _variant = ''  # Added to CSV file names, as for backfills.
             
     @classmethod
-    def set_class_attributes(cls, paths):
+    def set_class_attributes(cls, paths, shell):
         cls._paths = paths.copy()
+        cls._shell = shell
 
-    def __init__(self, name, envir):
+    def __init__(self, name, envir, paths=None, shell=None):
+        # paths and shell override set_class_attributes(), for use...
+        # outside of a Processer.
         self._name = name
         self._envir = envir
         self._field_counts = {}
-
-    def _chadwick_command(self, part_keys, year=None):
-        # Create a command string for Chadwick.
+        self._fields = {}
+        self._selected = None
+        self._required = set()
+        self._projected = False
+        self._keyed = False
+        self._natural = False
+        self._scope = {'teams': [], 'leagues': [], 'games': [], 'dates': None}
+        if paths is not None:
+            self._paths = paths.copy()
+        if shell is not None:
+            self._shell = shell
+
+    def _chadwick_command(self, part_keys, year=None, files=None,
+                          game=None):
+        # Create a command string for Chadwick. files, if given, are...
+        # the event files to read instead of all of the year's.
         command_parts = {'program': '"{chad_path}cw{tool}"',
-                         'switches': '-q -n -f 0-{standard_max} -y {year}',
-                         'extended': '-x 0-{extended_max}',
-                         'arg': '{year}*.EV*',
-                         'redirect': ' > "{csv_path}{year} {tool}.csv"',
+                         'switches': '-q -f {standard} -y {year}',
+                         'header': '-n',
+                         'extended': '-x {extended}',
+                         'dates': '-s {start} -e {end}',
+                         'game': '-i {game}',
+                         'arg': '{files}',
+                         'redirect': (' > "{csv_path}{year} {tool}{variant}'
+                                      '.csv"'),
+                         'append': (' >> "{csv_path}{year} {tool}{variant}'
+                                    '.csv"'),
                          'for_names': '-i 0',
                          'for_description': '-d'}
+        dates = self._scope['dates'] or (None, None)
         assembled = ' '.join([command_parts[key] for key in part_keys])
         dic = {'tool': self._name[:-1],
+               'variant': self._variant,
                'chad_path': self._paths['Chadwick'],
                'csv_path': self._paths['Assemble'],
                'year': year,
-               'standard_max': self._field_counts.get('standard', None),
-               'extended_max': self._field_counts.get('extended', None)}
+               'standard': self._fields.get('standard', None),
+               'extended': self._fields.get('extended', None),
+               'start': dates[0],
+               'end': dates[1],
+               'game': game,
+               'files': (' '.join('"{0}"'.format(name) for name in files)
+                         if files else '{0}*.EV*'.format(year))}
         return assembled.format(**dic)
 
     def parse_description(self):
         # Use Chadwick to make a table's column description dictionary.
         # Also, store the number of standard and extended columns.
         command = self._chadwick_command(['program', 'for_description'])
-        description = subprocess.check_output(command, shell=True,
-                                              stderr=subprocess.STDOUT)
+        description = self._shell.check_output(command,
+                                               stderr=subprocess.STDOUT)
         reg_exp = r'^(\d+)\s+(.+[^*])\*?$'
         field_index = re.finditer(reg_exp, description, re.MULTILINE)
         
@@ -349,20 +1235,129 @@ class Table:
             self._field_counts[field_block] = index
             comment = field.group(2).rstrip()
             self._field_comments += [comment]
+        self._fields = {block: '0-' + index
+                        for block, index in self._field_counts.items()}
+
+    def select_columns(self, names):
+        """Have Chadwick make only the named fields, plus any that the
+        table's tweaks or other features need.
+
+        """
+        self._selected = {name.upper() for name in names}
+
+    def use_keys(self):
+        """Store player and team IDs as KeyMap keys. Only CSV files
+        made by transform_year() with a KeyMap can then be loaded.
+
+        """
+        self._keyed = True
+
+    def use_natural_key(self):
+        """Make the table's primary key its natural key, such as
+        (game_id, event_id), instead of an auto-increment id. Use
+        sort_year() to sort each year's file on that key before it is
+        loaded.
+
+        """
+        self._natural = True
+        self.require_columns(self._natural_keys[self._name])
+
+    def require_columns(self, names):
+        """Make sure the named fields are made, even if not selected."""
+        self._required.update(name.upper() for name in names)
+
+    def _project(self, year, cwd=None):
+        # Narrow Chadwick's field lists to the selected fields. Only...
+        # the first call does anything. cwd is where the event files are.
+        if self._selected is None or self._projected:
+            return
+        self._set_field_names(year, cwd)
+        all_names = self._field_names
+        self._set_column_types()
+        wanted = self._selected | self._required
+        for column, tweak in self._tweaked_fields.items():
+            if column in wanted or column in self._computed_fields:
+                wanted.update(self._tweak_requires.get(tweak, []))
+        unknown = wanted - set(all_names)
+        if unknown:
+            raise ValueError('Chadwick makes no {names} field for {table}.'
+                             .format(names=', '.join(sorted(unknown)),
+                                     table=self._name))
+        indexes = [i for i, name in enumerate(all_names) if name in wanted]
+        standard_count = int(self._field_counts['standard']) + 1
+        self._fields = {'standard': _field_list(
+            [i for i in indexes if i < standard_count])}
+        extended = [i - standard_count for i in indexes
+                    if i >= standard_count]
+        if extended:
+            self._fields['extended'] = _field_list(extended)
+        self._field_comments = [self._field_comments[i] for i in indexes]
+        self._projected = True
             
+    def set_scope(self, scope):
+        """Limit the games assembled to those within scope, a dict as
+        made by Input._parse_scope().
+
+        """
+        self._scope = scope
+
+    def _event_files(self, year):
+        # Return the names of the year's event files within scope, or...
+        # None if the scope is not limited by team, league or game.
+        scope = self._scope
+        if not (scope['teams'] or scope['leagues'] or scope['games']):
+            return None
+        return [name for name in sorted(glob.glob(year + '*.EV*'))
+                if _in_scope(scope, name)]
+
+    def _scope_games(self, year):
+        # Return the chosen games of the year within the chosen dates.
+        start, end = self._scope['dates'] or ('0000', '9999')
+        return [game for game in self._scope['games']
+                if game[3:7] == year and start <= game[7:11] <= end]
+
     def assemble_year(self, year):
-        command_parts = ['program', 'switches', 'arg', 'redirect']
-        if 'extended' in self._field_counts:
+        self._project(year)
+        command_parts = ['program', 'switches', 'header', 'arg', 'redirect']
+        if 'extended' in self._fields:
             command_parts.insert(2, 'extended')
-        command = self._chadwick_command(command_parts, year)
-        subprocess.call(command, shell=True)
-
-    def _set_field_names(self, year):
-        command_parts = ['program', 'switches', 'for_names', 'arg']
-        if 'extended' in self._field_counts:
+        files = self._event_files(year)
+        if files == []:  # Nothing is in scope. Write only the header.
+            command_parts.insert(-2, 'for_names')
+            self._shell.call(self._chadwick_command(command_parts, year))
+            return
+        if not self._scope['games']:
+            if self._scope['dates']:
+                command_parts.insert(-2, 'dates')
+            command = self._chadwick_command(command_parts, year, files)
+            self._shell.call(command)
+            return
+        # Chadwick selects one game at a time, so append each game.
+        command_parts.insert(-2, 'game')
+        games = []
+        for game in self._scope_games(year):
+            game_files = [name for name in files if _in_scope(
+                {'teams': [], 'leagues': [], 'games': [game]}, name)]
+            if game_files:  # Else no file in scope has it, so skip it.
+                games.append((game, game_files))
+        if not games:
+            command_parts[-3] = 'for_names'
+            self._shell.call(self._chadwick_command(command_parts, year))
+        for game, game_files in games:
+            command = self._chadwick_command(command_parts, year,
+                                             game_files, game)
+            self._shell.call(command)
+            if 'header' in command_parts:
+                command_parts.remove('header')
+                command_parts[-1] = 'append'
+
+    def _set_field_names(self, year, cwd=None):
+        command_parts = ['program', 'switches', 'header', 'for_names', 'arg']
+        if 'extended' in self._fields:
             command_parts.insert(2, 'extended')
         command = self._chadwick_command(command_parts, year)
-        header_info = subprocess.check_output(command, shell=True)[:-len(os.linesep)]
+        header_info = self._shell.check_output(
+            command, cwd=cwd)[:-len(os.linesep)]
         self._field_names = [quoted[1:-1] for quoted in header_info.split(',')]
 
     def _set_column_types(self):
@@ -382,71 +1377,2053 @@ class Table:
                 continue
             for column in columns:
                 self._tweaked_fields[column] = tweak
+        self._column_types['year_ct'] = 'count'
+        if self._keyed:
+            for kind, table_columns in self._key_columns_literal.items():
+                for column in table_columns.get(self._name, []):
+                    self._column_types[column] = kind
+
+    def _python_tweaks(self, names, columns):
+        # Return {column: values} of a batch given as a list of columns
+        # named names, applying the Python form of each tweak.
+        raw = dict(zip(names, columns))
+        tweaked = {}
+        for column, tweak in self._tweaked_fields.items():
+            if column in raw or column in self._computed_fields:
+                func = self._tweak_functions[tweak]
+                tweaked[column] = func(raw.get(column), raw)
+        return tweaked
+
+    def typed_batch(self, names, rows, keys=None):
+        """Return a batch of rows of Chadwick output as typed rows.
 
-    def define_schema(self, schema, year):
+        names are Chadwick's names of the columns of rows. Each typed
+        row is a namedtuple whose fields have the lower-case names of
+        the database columns, including year_ct. Tweaks are applied as
+        they are when loading, and values are converted to Python
+        types according to their column type. Nulls are None. If the
+        table uses keys, keys is the KeyMap that replaces its IDs.
+
+        """
+        if getattr(self, '_row_names', None) != names:
+            self._set_column_types()
+            self._row_names = names
+            self._row_extra = [
+                name for name in self._computed_fields
+                if name in self._tweaked_fields and name not in names]
+            extra = self._row_extra
+            self._row_type = collections.namedtuple(
+                self._name.capitalize()[:-1],
+                [name.lower() for name in names + extra], rename=True)
+            self._row_casts = [
+                self._python_types[self._column_types.get(name, 'text')]
+                for name in names + extra]
+        if not rows:
+            return []
+        extra = self._row_extra
+        columns = zip(*rows)
+        tweaked = self._python_tweaks(names, columns)
+        if self._keyed:
+            for name, column in zip(names, columns):
+                kind = self._column_types.get(name)
+                if kind in self._key_columns_literal:
+                    tweaked[name] = [keys.key(kind, value)
+                                     for value in column]
+        columns = [tweaked.get(name, column)
+                   for name, column in zip(names, columns)]
+        columns += [tweaked[name] for name in extra]
+        columns = [map(cast, column)
+                   for cast, column in zip(self._row_casts, columns)]
+        return [self._row_type._make(row) for row in zip(*columns)]
+
+    def typed_arrays(self, names, rows, numpy):
+        """Return rows of the MySQL client's batch output as a NumPy
+        record array, with one compactly typed field per column.
+
+        names are the column names of rows, each a list of strings as
+        the client writes them. Counts are 4-byte integers, flags are
+        booleans, player and team keys are unsigned integers, dates
+        and times are datetime64 and timedelta64, IDs (text columns
+        named *_id) are byte strings as wide as the chunk's longest,
+        and other text is Python strings. Nulls are -1, False, 0, NaT
+        or None, according to the type.
+
+        """
+        if getattr(self, '_array_names', None) != names:
+            self._set_column_types()
+            self._array_names = names
+            kinds = dict(self._column_types, id='count')
+            self._array_kinds = [kinds.get(name.upper(),
+                                           kinds.get(name.lower(), 'text'))
+                                 for name in names]
+        arrays = []
+        for name, kind, column in zip(names, self._array_kinds, zip(*rows)):
+            dtype, null = self._numpy_types[kind]
+            if kind == 'time':
+                values = [null if value == 'NULL' else sum(
+                    int(part) * unit for part, unit in
+                    zip(value.split(':'), (3600, 60, 1)))
+                    for value in column]
+            elif kind == 'flag':
+                values = [value not in ('NULL', '0') for value in column]
+            elif kind == 'text' and name.lower().endswith('_id'):
+                values = ['' if value == 'NULL' else value
+                          for value in column]
+                dtype = 'S{0}'.format(max([1] + map(len, values)))
+            elif kind == 'text':
+                values = [None if value == 'NULL' else _batch_text(value)
+                          for value in column]
+            elif dtype[0] in 'iu':
+                values = [null if value == 'NULL' else int(value)
+                          for value in column]
+            else:
+                values = [null if value == 'NULL' else value
+                          for value in column]
+            arrays.append(numpy.array(values, dtype))
+        return numpy.rec.fromarrays(arrays, names=[name.lower()
+                                                   for name in names])
+
+    def stream_year(self, year, batch_size, cwd=None):
+        """Generate a year's typed rows in lists of at most batch_size,
+        as Chadwick writes them. cwd is where the event files are.
+
+        Only one batch of rows is held in memory at a time.
+
+        """
+        self._project(year, cwd)
+        command_parts = ['program', 'switches', 'header', 'arg']
+        if 'extended' in self._fields:
+            command_parts.insert(2, 'extended')
+        command = self._chadwick_command(command_parts, year)
+        reader = csv.reader(self._shell.lines(command, cwd=cwd))
+        try:
+            names = reader.next()
+        except StopIteration:
+            return
+        for batch in _batches(reader, batch_size):
+            yield self.typed_batch(names, batch)
+
+    def read_year(self, year, batch_size, keys=None):
+        """Generate the typed rows of a year's assembled CSV file in
+        lists of at most batch_size. keys is as for typed_batch().
+
+        """
+        with closing(open(self.csv_path(year), 'rb')) as csv_file:
+            reader = csv.reader(csv_file)
+            try:
+                names = reader.next()
+            except StopIteration:
+                return
+            for batch in _batches(reader, batch_size):
+                yield self.typed_batch(names, batch, keys)
+
+    def write_inserts(self, year, sql_dir, batch_size, per_batch,
+                      max_bytes, keys=None):
+        """Write a year's rows as multi-row INSERT statements in
+        standard SQL, for databases that can't load files. Return the
+        paths of the files written.
+
+        Each statement inserts at most batch_size rows, tweaked in
+        Python. If per_batch, each statement is its own transaction;
+        otherwise each file is. A new file is begun rather than let one
+        grow past max_bytes, so the files are named '1990 event inserts
+        001.sql', '1990 event inserts 002.sql' and so on, to be run in
+        that order. The first deletes the year's rows. Only one batch
+        is held in memory.
+
+        """
+        form = os.path.join(sql_dir, '{year} {tool} inserts {part}.sql')
+        for path in glob.glob(form.format(year=year, tool=self._name[:-1],
+                                          part='*')):
+            os.remove(path)
+        begin, end = ('START TRANSACTION;\n', 'COMMIT;\n')
+        paths = []
+        sql_file = None
+        size = 0
+        try:
+            for rows in self.read_year(year, batch_size, keys):
+                if not rows:
+                    continue
+                self._shell.check()
+                statement = ('INSERT INTO {table} ({columns}) VALUES\n'
+                             '  {values};\n').format(
+                    table=self._name, columns=', '.join(rows[0]._fields),
+                    values=',\n  '.join(
+                        '(' + ', '.join(map(_ansi_literal, row)) + ')'
+                        for row in rows))
+                if per_batch:
+                    statement = begin + statement + end
+                statement += '\n'
+                if sql_file is None or size + len(statement) > max_bytes:
+                    if sql_file is not None:
+                        sql_file.write('' if per_batch else end)
+                        sql_file.close()
+                    paths.append(form.format(
+                        year=year, tool=self._name[:-1],
+                        part='{n:03d}'.format(n=len(paths) + 1)))
+                    sql_file = open(paths[-1], 'w')
+                    size = 0
+                    if not per_batch:
+                        sql_file.write(begin + '\n')
+                    if len(paths) == 1:
+                        delete = ('DELETE FROM {table} '
+                                  'WHERE year_ct = {year};\n').format(
+                                      table=self._name, year=year)
+                        sql_file.write((begin + delete + end if per_batch
+                                        else delete) + '\n')
+                sql_file.write(statement)
+                size += len(statement)
+            if sql_file is not None and not per_batch:
+                sql_file.write(end)
+        finally:
+            if sql_file is not None:
+                sql_file.close()
+        return paths
+
+    def row_columns(self):
+        """Return (name, column type) for each field of the rows last
+        made by typed_batch().
+
+        """
+        names = self._row_names + self._row_extra
+        return [(name.lower(), self._column_types.get(name, 'text'))
+                for name in names]
+
+    def _csv_name(self, year, ready=False):
+        # Return the file name of a year's CSV, as assembled or as...
+        # made ready to load by transform_year().
+        form = ('{year} {tool}{variant} ready.csv' if ready else
+                '{year} {tool}{variant}.csv')
+        return form.format(year=year, tool=self._name[:-1],
+                           variant=self._variant)
+
+    def csv_path(self, year):
+        """Return the path of a year's assembled CSV file."""
+        return os.path.join(self._paths['Assemble'], self._csv_name(year))
+
+    def transform_year(self, year, keys=None):
+        """Apply the table's tweaks to a year's assembled CSV file in
+        Python, writing a file that loads without a SET clause.
+
+        If the table uses keys, keys is the KeyMap that replaces its
+        player and team IDs. The file is read and written one batch of
+        rows at a time.
+
+        """
+        self._set_column_types()
+        csv_dir = self._paths['Assemble']
+        in_path = os.path.join(csv_dir, self._csv_name(year))
+        out_path = os.path.join(csv_dir, self._csv_name(year, True))
+        with closing(open(in_path, 'rb')) as in_file, \
+                closing(open(out_path, 'wb')) as out_file:
+            reader = csv.reader(in_file)
+            writer = csv.writer(out_file, lineterminator=self._envir.line_sep)
+            try:
+                names = reader.next()
+            except StopIteration:
+                return
+            extra = [name for name in self._computed_fields
+                     if name in self._tweaked_fields and name not in names]
+            writer.writerow(names + extra)
+            for batch in _batches(reader, self._batch_size):
+                self._shell.check()
+                columns = zip(*batch)
+                tweaked = self._python_tweaks(names, columns)
+                if self._keyed:
+                    for name, column in zip(names, columns):
+                        kind = self._column_types.get(name)
+                        if kind in self._key_columns_literal:
+                            tweaked[name] = [keys.key(kind, value)
+                                             for value in column]
+                columns = [map(_load_text, tweaked[name]) if name in tweaked
+                           else column
+                           for name, column in zip(names, columns)]
+                columns += [map(_load_text, tweaked[name]) for name in extra]
+                writer.writerows(zip(*columns))
+
+    def sort_year(self, year, transformed=False):
+        """Sort a year's CSV file, as it will be loaded, on the
+        table's natural key.
+
+        The sort is an external merge sort: runs of about
+        _sort_run_bytes of row text are sorted in memory and written to
+        temporary files, which are then merged.
+
+        """
+        self._set_column_types()
+        path = os.path.join(self._paths['Assemble'],
+                            self._csv_name(year, transformed))
+        runs = []
+        try:
+            with closing(open(path, 'rb')) as in_file:
+                reader = csv.reader(in_file)
+                try:
+                    names = reader.next()
+                except StopIteration:
+                    return
+                sort_key = self._sort_key(names)
+                for batch in _sized_batches(reader, self._sort_run_bytes):
+                    self._shell.check()
+                    batch.sort(key=sort_key)
+                    run_path = '{path}.{n}.tmp'.format(path=path,
+                                                       n=len(runs))
+                    runs.append(run_path)
+                    with closing(open(run_path, 'wb')) as run_file:
+                        csv.writer(run_file).writerows(batch)
+            sorted_path = path + '.tmp'
+            run_files = [open(run_path, 'rb') for run_path in runs]
+            try:
+                decorated = [((sort_key(row), row)
+                              for row in csv.reader(run_file))
+                             for run_file in run_files]
+                with closing(open(sorted_path, 'wb')) as out_file:
+                    writer = csv.writer(out_file,
+                                        lineterminator=self._envir.line_sep)
+                    writer.writerow(names)
+                    for batch in _batches(heapq.merge(*decorated),
+                                          self._batch_size):
+                        self._shell.check()
+                        writer.writerows(row for key, row in batch)
+            finally:
+                for run_file in run_files:
+                    run_file.close()
+            os.remove(path)  # Windows won't rename onto an existing file.
+            os.rename(sorted_path, path)
+        finally:
+            for run_path in runs:
+                try:
+                    os.remove(run_path)
+                except OSError: pass
+
+    def _sort_key(self, names):
+        # Return a function giving a row's natural key, with numbers as...
+        # numbers so that they sort as the database sorts them.
+        key_parts = []
+        for name in self._natural_keys[self._name]:
+            index = names.index(name)
+            column_type = self._column_types.get(name, 'text')
+            key_parts.append((index, column_type != 'text'))
+        def sort_key(row):
+            return tuple(int(row[index]) if numeric else row[index]
+                         for index, numeric in key_parts)
+        return sort_key
+
+    def define_schema(self, schema, year, transformed=False):
         form = 'CREATE TABLE IF NOT EXISTS {name} (\n  '
         schema.write(form.format(name=self._name))
         
         self._set_column_types()
+        self._project(year)
         self._set_field_names(year)
-        column_specs = [
-            ('id INT UNSIGNED AUTO_INCREMENT PRIMARY KEY COMMENT '
-             '"auto-increment primary key"')]
+        if self._natural:
+            column_specs = []
+        else:
+            column_specs = [
+                ('id INT UNSIGNED AUTO_INCREMENT PRIMARY KEY COMMENT '
+                 '"auto-increment primary key"')]
         form = '{name} {sql_data_type} COMMENT "{comment}"'
-        #
-        client = 'MySQL' #This should not be hard-coded.
-        #
-        for name, comment in zip(self._field_names, self._field_comments):
-            column_type = self._column_types.get(name, 'text')
-            sql_data_type = self._sql_data_types[column_type][client]
-            sql_name = name.lower()
+        for name, sql_data_type, comment in self.column_specs():
             column_specs.append(form.format(
-                name=sql_name, sql_data_type=sql_data_type, comment=comment))
-        count_type = self._sql_data_types['count'][client]
-        column_specs.append(form.format(
-            name='year_ct', sql_data_type=count_type, comment='year'))
+                name=name, sql_data_type=sql_data_type, comment=comment))
+        if self._natural:
+            column_specs.append('PRIMARY KEY ({columns})'.format(
+                columns=', '.join(name.lower()
+                                  for name in self._natural_keys[self._name])))
         schema.write(',\n  '.join(column_specs) + ');\n')
+        if self._keyed:
+            schema.write(self._id_view())
         documentation_form = ('/*\n'
                              'The following form will be used to load data.\n'
                              '{load_form}\n'
                              '*/\n\n\n')
-        self._load_form = self._set_load_form()
-        schema.write(documentation_form.format(load_form=self._load_form))
+        self._load_form = self._set_load_form(transformed)
+        schema.write(documentation_form.format(
+            load_form=self.load_specs('{year}')))
 
-    def _set_load_form(self):
-        load_form = ('LOAD DATA LOCAL INFILE "{unix_style_path}"\n'
+    def column_specs(self, client='MySQL'):
+        """Return (name, SQL data type, comment) for each of the table's
+        columns but id, once define_schema() has been called.
+
+        """
+        specs = []
+        for name, comment in zip(self._field_names, self._field_comments):
+            column_type = self._column_types.get(name, 'text')
+            specs.append((name.lower(),
+                          self._sql_data_types[column_type][client], comment))
+        specs.append(('year_ct', self._sql_data_types['count'][client],
+                      'year'))
+        return specs
+
+    def migration(self, live):
+        """Return an ALTER TABLE statement that brings the table on the
+        server up to date with the fields Chadwick now makes, or None if
+        it is, and the names of the fields it adds.
+
+        live is {column: (column type, comment)} for the table on the
+        server, as information_schema gives them. Missing columns are
+        added beside their neighbors, types are widened and comments
+        updated. Columns only the server has, and types that would
+        narrow, are left alone. Call after define_schema().
+
+        """
+        changes = []
+        added = []
+        position = 'AFTER id' if 'id' in live else 'FIRST'
+        for name, (sql_name, sql_data_type, comment) in zip(
+                self._field_names + ['year_ct'], self.column_specs()):
+            if sql_name not in live:
+                changes.append(
+                    'ADD COLUMN {name} {sql_data_type} COMMENT "{comment}" '
+                    '{position}'.format(name=sql_name, comment=comment,
+                                        sql_data_type=sql_data_type,
+                                        position=position))
+                added.append(name)
+            else:
+                live_type, live_comment = live[sql_name]
+                if not _widens(sql_data_type, live_type):
+                    sql_data_type = live_type
+                if sql_data_type != live_type or comment != live_comment:
+                    changes.append(
+                        'MODIFY COLUMN {name} {sql_data_type} '
+                        'COMMENT "{comment}"'.format(
+                            name=sql_name, sql_data_type=sql_data_type,
+                            comment=comment))
+            position = 'AFTER ' + sql_name
+        if not changes:
+            return None, added
+        return ('ALTER TABLE {name}\n  {changes};'.format(
+            name=self._name, changes=',\n  '.join(changes)), added)
+
+    def backfill_statements(self, year, names, live):
+        """Assemble a year's values of the named fields, with the
+        table's natural key, and return statements that fill them in on
+        the server's rows of that year. Return None if the year's event
+        files aren't at hand or the server's table lacks the natural
+        key. live is as for migration().
+
+        Only the named fields are assembled, into '1990 event
+        backfill.csv' and so on, so this is far less work than loading
+        the year again. Key fields can't be filled in so, and are left.
+
+        """
+        keys = self._natural_keys[self._name]
+        if (not glob.glob(year + '*.EV*') or
+                [key for key in keys if key.lower() not in live]):
+            return None
+        names = [name for name in names if name not in keys and not (
+            self._keyed and
+            self._column_types.get(name) in self._key_columns_literal)]
+        if not names:
+            return []
+        part = Table(self._name, self._envir)
+        part._variant = ' backfill'
+        part.select_columns(keys + names)
+        part.parse_description()
+        part.assemble_year(year)
+        part._set_field_names(year)
+        temp = self._name + '_backfill'
+        part._load_form = part._set_load_form(table_name=temp)
+        specs = ['{0} {1}'.format(name, sql_data_type)
+                 for name, sql_data_type, comment in part.column_specs()]
+        # Keyed as the UPDATE joins it, so each row is found by lookup.
+        specs.append('PRIMARY KEY ({columns})'.format(
+            columns=', '.join(key.lower() for key in keys)))
+        return [
+            'CREATE TEMPORARY TABLE {temp} (\n  {specs});'.format(
+                temp=temp, specs=',\n  '.join(specs)),
+            part.load_specs(year),
+            ('UPDATE {name} AS t JOIN {temp} AS b\n'
+             '  ON {on}\n'
+             '  SET {set}\n'
+             '  WHERE t.year_ct = {year};').format(
+                 name=self._name, temp=temp, year=year,
+                 on=' AND '.join('t.{0} = b.{0}'.format(key.lower())
+                                 for key in keys),
+                 set=', '.join('t.{0} = b.{0}'.format(name.lower())
+                               for name in names)),
+            'DROP TEMPORARY TABLE {temp};'.format(temp=temp)]
+
+    def _id_view(self):
+        # Return a statement making a view of the table that shows...
+        # Retrosheet's IDs in place of the keys. It is named, for...
+        # example, events_ids.
+        selected = [] if self._natural else ['t.id']
+        joins = ['  FROM {name} AS t'.format(name=self._name)]
+        for name in self._field_names + ['year_ct']:
+            kind = self._column_types.get(name)
+            column = name.lower()
+            if kind not in self._key_columns_literal:
+                selected.append('t.' + column)
+                continue
+            table, columns = KeyMap._dimensions[kind]
+            alias = 'k_' + column
+            selected.append('{alias}.{retro_id} AS {column}'.format(
+                alias=alias, retro_id=columns[1][0], column=column))
+            joins.append(
+                '  LEFT JOIN {table} AS {alias} '
+                'ON {alias}.{key} = t.{column}'.format(
+                    table=table, alias=alias, key=columns[0][0],
+                    column=column))
+        return ('CREATE OR REPLACE VIEW {name}_ids AS\n'
+                '  SELECT {selected}\n'
+                '{joins};\n').format(
+                    name=self._name, selected=',\n    '.join(selected),
+                    joins='\n'.join(joins))
+
+    def _set_load_form(self, transformed=False, table_name=None):
+        # If transformed, load the file made by transform_year(), whose...
+        # values need no SET clause. table_name defaults to the table's.
+        # The checksum fields are read into @rcs_ variables, and the SET...
+        # clause sums their CRC32s in @rcs_sum as each row is loaded, as...
+        # fingerprint() does, for count_statement() to select.
+        load_form = ('SET @rcs_sum = 0;\n'
+                     'LOAD DATA LOCAL INFILE "{unix_style_path}"\n'
                      '  INTO TABLE {table_name}\n'
                      '  FIELDS TERMINATED BY ","\n'
                      r'    ENCLOSED BY "\""' '\n'
                      '  LINES TERMINATED BY "{line_sep}"\n'
                      '  IGNORE 1 LINES\n'
-                     '  ({column_names})\n'
-                     '  SET\n'
-                     '  {assign_str};')
-        file_form = '{{year}} {table_name}.csv'
-        file_name = file_form.format(table_name=self._name[:-1])
+                     '  ({column_names})')
+        file_name = self._csv_name('{year}', transformed)
         os_file_path = os.path.join(self._paths['Assemble'], file_name)
-        unix_style_path = os_file_path.replace('\\', '/')
-        table_name = self._name
+        self._path_form = os_file_path
+        unix_style_path = '{unix_style_path}'  # Filled in by load_specs().
+        table_name = table_name or self._name
         line_sep = self._envir.line_sep.encode('string-escape')
-        effective_names = [
-            ('@temp_' if name in self._tweaked_fields else '') + name.lower()
-            for name in self._field_names]
+        checksum_fields = self._checksum_fields(self._field_names)
+        if transformed:
+            effective_names = [
+                ('@rcs_' if name in checksum_fields else '') + name.lower()
+                for name in self._field_names]
+            effective_names += [
+                name for name in self._computed_fields
+                if name in self._tweaked_fields and
+                name not in self._field_names]
+        else:
+            effective_names = [
+                ('@temp_' if name in self._tweaked_fields else
+                 '@rcs_' if name in checksum_fields else '') +
+                name.lower() for name in self._field_names]
         column_str = ', '.join(effective_names)
         assignments = []
         set_form = '  {name} = {formula}'
-        for column, tweak in self._tweaked_fields.items():
-            formula_form = self._field_tweaks[tweak][0]
-            formula = formula_form.format(temp='@temp_' + column.lower())
-            assignments.append(set_form.format(
-                name=column.lower(), formula=formula))
+        # Checksum fields come first, as tweaks such as year_ct's read them.
+        for n, name in enumerate(checksum_fields):
+            formula = '@rcs_' + name.lower()
+            if n == 0:
+                formula = ("IF((@rcs_sum := @rcs_sum + CRC32(CONCAT_WS("
+                           "'|', {variables}))) IS NULL, NULL, {formula})"
+                           ).format(formula=formula, variables=', '.join(
+                               '@rcs_' + field.lower()
+                               for field in checksum_fields))
+            assignments.append(set_form.format(name=name.lower(),
+                                               formula=formula))
+        if not transformed:
+            for column, tweak in self._tweaked_fields.items():
+                if (column not in self._field_names and
+                        column not in self._computed_fields):
+                    continue  # Not selected.
+                formula_form = self._field_tweaks[tweak][0]
+                formula = formula_form.format(temp='@temp_' + column.lower())
+                assignments.append(set_form.format(
+                    name=column.lower(), formula=formula))
+        if assignments:
+            load_form += ('\n'
+                          '  SET\n'
+                          '  {assign_str}')
+        load_form += ';'
         assign_str = (',\n  ').join(assignments)
         return load_form.format(
             unix_style_path=unix_style_path, table_name=table_name,
             line_sep=line_sep, column_names=column_str, assign_str=assign_str)
                                 
-    def load_specs(self, year):
-        return self._load_form.format(year=year)
+    def load_specs(self, year, path=None):
+        # Return the statement loading a year's CSV file, or the file at...
+        # path, such as a chunk made by split_year().
+        if path is None:
+            path = self._path_form.format(year=year)
+        return self._load_form.format(
+            year=year, unix_style_path=path.replace('\\', '/'))
+
+    def count_statement(self):
+        """Return a statement, to follow a load, that selects the rows
+        the load added, as the server counted them, and the checksum it
+        summed while loading them.
+
+        """
+        return ("SELECT 'rcs_loaded', '{name}', ROW_COUNT(), "
+                "@rcs_sum;").format(name=self._name)
+
+    def _checksum_fields(self, names):
+        # Return the fields of names that fingerprint() sums: the...
+        # natural key fields that are loaded untweaked.
+        self._set_column_types()
+        return [name for name in self._natural_keys[self._name]
+                if name in names and name not in self._tweaked_fields]
+
+    def fingerprint(self, path):
+        """Return the number of rows in a CSV file as it will be loaded,
+        the sum of the CRC32s of their checksum fields joined by '|',
+        and those fields, the natural key fields that load untweaked.
+
+        The sum doesn't depend on the rows' order, and the server sums
+        the same one as it loads the file. The file is read a row at a
+        time.
+
+        """
+        rows = checksum = 0
+        with closing(open(path, 'rb')) as csv_file:
+            reader = csv.reader(csv_file)
+            try:
+                names = [name.upper() for name in reader.next()]
+            except StopIteration:
+                return 0, 0, []
+            fields = self._checksum_fields(names)
+            indexes = [names.index(name) for name in fields]
+            for row in reader:
+                rows += 1
+                if indexes:
+                    checksum += zlib.crc32(
+                        '|'.join([row[index] for index in indexes])
+                    ) & 0xffffffff
+        return rows, checksum, fields
+
+    def split_year(self, year, transformed, chunk_bytes):
+        """Split a year's CSV file, as it will be loaded, into chunks of
+        about chunk_bytes, ending at line ends. Return the paths of the
+        chunks, or of the file itself if it's no bigger than that.
+
+        Line ends are found by scanning a memory map of the file, and
+        the chunks are copied from it a block at a time, so the file is
+        never read into memory. Each chunk begins with the header, so it
+        loads just as the whole file would. Chadwick never writes a line
+        end within a field.
+
+        """
+        path = os.path.join(self._paths['Assemble'],
+                            self._csv_name(year, transformed))
+        chunk_form = path[:-len('.csv')] + ' chunk {n:03d}.csv'
+        for old_path in glob.glob(chunk_form.replace('{n:03d}', '*')):
+            os.remove(old_path)
+        size = os.path.getsize(path)
+        if size <= chunk_bytes:
+            return [path]
+        paths = []
+        block = 1024 * 1024
+        with closing(open(path, 'rb')) as csv_file:
+            mapped = mmap.mmap(csv_file.fileno(), 0, access=mmap.ACCESS_READ)
+            with closing(mapped):
+                header_end = mapped.find('\n') + 1
+                start = header_end
+                while start < size:
+                    self._shell.check()
+                    end = mapped.find('\n', start + chunk_bytes - 1) + 1
+                    end = end or size
+                    paths.append(chunk_form.format(n=len(paths) + 1))
+                    with closing(open(paths[-1], 'wb')) as chunk_file:
+                        chunk_file.write(mapped[:header_end])
+                        for offset in xrange(start, end, block):
+                            chunk_file.write(
+                                mapped[offset:min(offset + block, end)])
+                    start = end
+        return paths
+
+    def duckdb_statements(self, year, transformed=False):
+        """Return DuckDB statements that make the table if need be and
+        replace a year's rows with those of its CSV file.
+
+        The columns are those of the file's header, so Chadwick isn't
+        needed. The file is copied as text into a staging table, and
+        each column is converted from there. Unless transformed, the
+        tweaks are done in DuckDB SQL. The table has no primary key, as
+        duckdb 0.1.x can't insert a key deleted in the same
+        transaction; the year's rows are replaced whole anyway.
+
+        """
+        self._set_column_types()
+        path = os.path.join(self._paths['Assemble'],
+                            self._csv_name(year, transformed))
+        with closing(open(path, 'rb')) as csv_file:
+            reader = csv.reader(csv_file)
+            try:
+                names = reader.next()
+            except StopIteration:
+                return []
+            sample = list(itertools.islice(reader, self._format_sample))
+        columns = names + [name for name in self._computed_fields
+                           if name not in names]
+        specs = []
+        selected = []
+        for name in columns:
+            column_type = self._column_types.get(name, 'text')
+            duckdb_type = self._sql_data_types[column_type]['DuckDB']
+            specs.append('{name} {duckdb_type}'.format(
+                name=name.lower(), duckdb_type=duckdb_type))
+            value = "NULLIF({name}, '')".format(name=name)
+            if name in self._tweaked_fields and not transformed:
+                formula = self._duckdb_tweaks[self._tweaked_fields[name]]
+                expression = formula.format(temp=name)
+            elif column_type in self._duckdb_formats:
+                index = names.index(name)
+                forms = self._duckdb_formats[column_type]
+                form = _strptime_format(
+                    [row[index] for row in sample if len(row) > index],
+                    [form for form, sql in forms])
+                expression = dict(forms)[form].format(value=value)
+            elif column_type != 'text':
+                expression = value
+            else:
+                expression = name
+            selected.append('CAST({expression} AS {duckdb_type})'.format(
+                expression=expression, duckdb_type=duckdb_type))
+        return [
+            'CREATE TABLE IF NOT EXISTS {table} (\n  {specs});'.format(
+                table=self._name, specs=',\n  '.join(specs)),
+            'DELETE FROM {table} WHERE year_ct = {year};'.format(
+                table=self._name, year=year)] + _duckdb_copy(
+                    self._name, [name.lower() for name in columns], selected,
+                    path, names, r'\N' if transformed else None)
+
+
+class SeasonAggregates(object):
+    """Writes SQL that keeps season totals built from the events table.
+
+    Batting, pitching and fielding totals are kept for each player and
+    each team, in tables keyed first by year_ct, so one year's totals
+    can be replaced without touching the others. All SQL is written
+    for one dialect, a key of Table._sql_data_types.
+
+    schema() returns statements that create the tables.
+    refresh(year) returns statements that replace one year's totals.
+    required_columns() names the events fields the totals read.
+
+    """
+
+    _tables = collections.OrderedDict([  # {table: (key, [(column, term)])}
+        ('batting_player_seasons', ('resp_bat_id', 'batting')),
+        ('batting_team_seasons', ('bat_team_id', 'batting')),
+        ('pitching_player_seasons', ('resp_pit_id', 'pitching')),
+        ('pitching_team_seasons', ('fld_team_id', 'pitching')),
+        ('fielding_player_seasons', (None, 'fielding')),
+        ('fielding_team_seasons', ('fld_team_id', 'fielding'))])
+
+    # Each term is summed over the year's events.
+    _terms = {
+        'batting': [
+            ('pa_ct', 'CASE WHEN bat_event_fl = 1 THEN 1 ELSE 0 END'),
+            ('ab_ct', 'CASE WHEN ab_fl = 1 THEN 1 ELSE 0 END'),
+            ('h_ct', 'CASE WHEN h_cd > 0 THEN 1 ELSE 0 END'),
+            ('double_ct', 'CASE WHEN h_cd = 2 THEN 1 ELSE 0 END'),
+            ('triple_ct', 'CASE WHEN h_cd = 3 THEN 1 ELSE 0 END'),
+            ('hr_ct', 'CASE WHEN h_cd = 4 THEN 1 ELSE 0 END'),
+            ('rbi_ct', 'rbi_ct'),
+            ('bb_ct', 'CASE WHEN event_cd IN (14, 15) THEN 1 ELSE 0 END'),
+            ('ibb_ct', 'CASE WHEN event_cd = 15 THEN 1 ELSE 0 END'),
+            ('so_ct', 'CASE WHEN event_cd = 3 THEN 1 ELSE 0 END'),
+            ('hbp_ct', 'CASE WHEN event_cd = 16 THEN 1 ELSE 0 END'),
+            ('sh_ct', 'CASE WHEN sh_fl = 1 THEN 1 ELSE 0 END'),
+            ('sf_ct', 'CASE WHEN sf_fl = 1 THEN 1 ELSE 0 END'),
+            ('gdp_ct', 'CASE WHEN dp_fl = 1 AND bat_event_fl = 1 '
+                       'THEN 1 ELSE 0 END')],
+        'pitching': [
+            ('bf_ct', 'CASE WHEN bat_event_fl = 1 THEN 1 ELSE 0 END'),
+            ('outs_ct', 'event_outs_ct'),
+            ('r_ct', 'event_runs_ct'),
+            ('h_ct', 'CASE WHEN h_cd > 0 THEN 1 ELSE 0 END'),
+            ('hr_ct', 'CASE WHEN h_cd = 4 THEN 1 ELSE 0 END'),
+            ('bb_ct', 'CASE WHEN event_cd IN (14, 15) THEN 1 ELSE 0 END'),
+            ('ibb_ct', 'CASE WHEN event_cd = 15 THEN 1 ELSE 0 END'),
+            ('so_ct', 'CASE WHEN event_cd = 3 THEN 1 ELSE 0 END'),
+            ('hbp_ct', 'CASE WHEN event_cd = 16 THEN 1 ELSE 0 END'),
+            ('wp_ct', 'CASE WHEN wp_fl = 1 THEN 1 ELSE 0 END'),
+            ('bk_ct', 'CASE WHEN event_cd = 11 THEN 1 ELSE 0 END')],
+        'fielding': [
+            ('po_ct', ' + '.join(
+                'CASE WHEN po{n}_fld_cd = {{pos}} THEN 1 ELSE 0 END'
+                .format(n=n)
+                for n in range(1, 4))),
+            ('a_ct', ' + '.join(
+                'CASE WHEN ass{n}_fld_cd = {{pos}} THEN 1 ELSE 0 END'
+                .format(n=n)
+                for n in range(1, 11))),
+            ('e_ct', ' + '.join(
+                'CASE WHEN err{n}_fld_cd = {{pos}} THEN 1 ELSE 0 END'
+                .format(n=n)
+                for n in range(1, 4)))]}
+
+    # For teams, any fielder's putout, assist or error counts.
+    _team_fielding = [
+        ('po_ct', ' + '.join('CASE WHEN po{n}_fld_cd > 0 THEN 1 ELSE 0 END'
+                             .format(n=n) for n in range(1, 4))),
+        ('a_ct', ' + '.join('CASE WHEN ass{n}_fld_cd > 0 THEN 1 ELSE 0 END'
+                            .format(n=n) for n in range(1, 11))),
+        ('e_ct', 'err_ct')]
+
+    # The field naming the player at each position, 1 through 9.
+    _fielders = ['pit_id'] + ['pos{n}_fld_id'.format(n=n)
+                              for n in range(2, 10)]
+
+    _key_columns = ('player_id', 'team_id', 'pos_cd')
+
+    _inline_indexes = {'MySQL': True}
+    # duckdb 0.1.x can't insert a key deleted in the same transaction.
+    _primary_keys = {'MySQL': True}
+
+    def __init__(self, dialect='MySQL', keyed=False):
+        # If keyed, player and team IDs are KeyMap keys.
+        self._dialect = dialect
+        self._keyed = keyed
+
+    def _columns(self, table):
+        # Return [(column, data_type, term)] for a table, keys first.
+        key, kind = self._tables[table]
+        if kind == 'fielding' and key is None:
+            columns = [('player_id', 'player', '{fielder}'),
+                       ('pos_cd', 'count', '{pos}')]
+        elif table.endswith('player_seasons'):
+            columns = [('player_id', 'player', key)]
+        else:
+            columns = [('team_id', 'team', key)]
+        if not self._keyed:
+            columns = [(name, 'count' if name == 'pos_cd' else 'text', term)
+                       for name, data_type, term in columns]
+        columns.append(('year_ct', 'count', 'year_ct'))
+        terms = self._team_fielding if (kind == 'fielding' and key) \
+            else self._terms[kind]
+        columns += [(name, 'count', term) for name, term in terms]
+        return columns
+
+    def required_columns(self):
+        """Return the events fields the totals read, upper case."""
+        text = ' '.join(term for terms in self._terms.values()
+                        for name, term in terms)
+        text += ' ' + ' '.join(term for name, term in self._team_fielding)
+        text += ' ' + ' '.join(key for key, kind in self._tables.values()
+                               if key)
+        text += ' ' + ' '.join(self._fielders)
+        names = set(re.findall(r'\b[a-z][a-z0-9]*_[a-z0-9_]+\b', text))
+        names.discard('year_ct')
+        return sorted(name.upper() for name in names)
+
+    def schema(self):
+        """Return a list of statements creating the aggregate tables."""
+        statements = []
+        types = Table._sql_data_types
+        inline = self._inline_indexes.get(self._dialect, False)
+        for table in self._tables:
+            columns = self._columns(table)
+            keys = [name for name, data_type, term in columns
+                    if name in self._key_columns]
+            specs = ['{name} {data_type} NOT NULL'.format(
+                name=name, data_type=types[data_type][self._dialect])
+                for name, data_type, term in columns]
+            if self._primary_keys.get(self._dialect, False):
+                specs.append('PRIMARY KEY (year_ct, {keys})'.format(
+                    keys=', '.join(keys)))
+            index = '{keys}, year_ct'.format(keys=', '.join(keys))
+            if inline:
+                specs.append('INDEX ({index})'.format(index=index))
+            statements.append(
+                'CREATE TABLE IF NOT EXISTS {table} (\n  {specs});'.format(
+                    table=table, specs=',\n  '.join(specs)))
+            if not inline:
+                statements.append(
+                    'CREATE INDEX IF NOT EXISTS {table}_by_{key} '
+                    'ON {table} ({index});'.format(
+                        table=table, key=keys[0], index=index))
+        return statements
+
+    def refresh(self, year):
+        """Return a list of statements replacing a year's totals."""
+        statements = []
+        for table in self._tables:
+            columns = self._columns(table)
+            names = [name for name, data_type, term in columns]
+            statements.append('DELETE FROM {table} WHERE year_ct = {year};'
+                              .format(table=table, year=year))
+            if self._tables[table][0] is None:
+                selects = [self._select(columns, year, fielder, pos)
+                           for pos, fielder in enumerate(self._fielders, 1)]
+            else:
+                selects = [self._select(columns, year)]
+            statements.append('INSERT INTO {table} ({names})\n{selects};'
+                              .format(table=table, names=', '.join(names),
+                                      selects='\nUNION ALL\n'.join(selects)))
+        return statements
+
+    def _select(self, columns, year, fielder=None, pos=None):
+        # Return one SELECT summing the terms, grouped by the keys.
+        keys, sums = [], []
+        for name, data_type, term in columns:
+            term = term.format(fielder=fielder, pos=pos)
+            if name in self._key_columns or name == 'year_ct':
+                keys.append(term)
+            else:
+                sums.append('COALESCE(SUM({term}), 0)'.format(term=term))
+        groups = [key for key in keys if key != str(pos)]
+        return ('  SELECT {keys},\n    {sums}\n'
+                '  FROM events\n'
+                '  WHERE year_ct = {year} AND {first} IS NOT NULL\n'
+                '  GROUP BY {groups}').format(
+                    keys=', '.join(keys), sums=',\n    '.join(sums),
+                    year=year, first=keys[0], groups=', '.join(groups))
+
+
+class BaseOutMatrices(object):
+    """Computes a year's run expectancy and base-out transition matrices
+    from its assembled events file.
+
+    There are 24 base-out states: the bases occupied, as in
+    START_BASES_CD (0-7), times the outs (0-2). Each event moves from
+    one state to another or ends the half inning. A state's run
+    expectancy is the average number of runs scored from the start of
+    an event in that state to the end of the half inning. Half innings
+    that end with fewer than three outs, as when the home team wins at
+    bat, are left out.
+
+    refresh() writes the results as CSV files beside the events file,
+    along with a stamp of that file's SHA-1 digest, and does nothing if
+    the stamp shows the events file unchanged. NumPy is required,
+    but is only imported when the matrices are computed.
+
+    """
+
+    fields = ['GAME_ID', 'INN_CT', 'BAT_HOME_ID', 'OUTS_CT', 'START_BASES_CD',
+              'END_BASES_CD', 'EVENT_OUTS_CT', 'EVENT_RUNS_CT', 'INN_RUNS_CT']
+
+    _file_names = {'expectancy': '{year} run expectancy.csv',
+                   'transitions': '{year} transitions.csv',
+                   'stamp': '{year} matrices.json'}
+
+    def __init__(self, events_path, year):
+        self._events_path = events_path
+        csv_dir = os.path.dirname(events_path)
+        self._paths = {key: os.path.join(csv_dir, form.format(year=year))
+                       for key, form in self._file_names.items()}
+
+    def _stamp(self):
+        # Return what identifies the current version of the events...
+        # file: its contents' digest, since assembling it again...
+        # rewrites it, changing its time, even if nothing else changed.
+        return {'sha1': _file_digest(self._events_path)}
+
+    def current(self, stamp=None):
+        """Return True if the files were written from the events file
+        as it is now, or as stamp, from _stamp(), identifies it.
+
+        """
+        try:
+            with closing(open(self._paths['stamp'])) as stamp_file:
+                written = json.load(stamp_file)
+        except (IOError, ValueError):
+            return False
+        return (written == (stamp or self._stamp()) and
+                all(os.path.exists(path) for path in self._paths.values()))
+
+    def refresh(self):
+        """Write the files unless current. Return True if written."""
+        stamp = self._stamp()
+        if self.current(stamp):
+            return False
+        expectancy, transitions = self.compute()
+        with closing(open(self._paths['expectancy'], 'wb')) as out_file:
+            writer = csv.writer(out_file)
+            writer.writerow(['START_BASES_CD', 'OUTS_CT', 'EVENT_CT',
+                             'RUN_CT', 'EXPECTED_RUNS'])
+            writer.writerows(expectancy)
+        with closing(open(self._paths['transitions'], 'wb')) as out_file:
+            writer = csv.writer(out_file)
+            writer.writerow(['START_BASES_CD', 'START_OUTS_CT',
+                             'END_BASES_CD', 'END_OUTS_CT', 'EVENT_CT',
+                             'PROBABILITY', 'RUN_CT'])
+            writer.writerows(transitions)
+        with closing(open(self._paths['stamp'], 'w')) as stamp_file:
+            json.dump(stamp, stamp_file)
+        return True
+
+    def _read(self, numpy):
+        # Return the needed fields as an array, one row per event,...
+        # with each GAME_ID replaced by a number. NumPy parses the...
+        # needed columns of the file itself.
+        games = {}
+        with closing(open(self._events_path, 'rb')) as events_file:
+            names = (csv.reader([events_file.readline()]).next() or
+                     self.fields)
+            indexes = [names.index(name) for name in self.fields]
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')  # It warns of no events.
+                data = numpy.loadtxt(
+                    events_file, dtype=numpy.int32, delimiter=',',
+                    usecols=indexes, ndmin=2, converters={
+                        indexes[0]: lambda value: games.setdefault(
+                            value.strip('"'), len(games))})
+        return data.reshape(-1, len(indexes))
+
+    def compute(self):
+        """Return the run expectancy rows and the transition rows."""
+        numpy = _import_numpy()
+        if numpy is None:
+            raise ImportError('NumPy is needed for run expectancy.')
+        data = self._read(numpy)
+        if not len(data):
+            return [[state // 3, state % 3, 0, 0, '']
+                    for state in range(24)], []
+        (game, inning, half, outs, start_bases, end_bases, event_outs,
+         event_runs, inning_runs) = data.T
+        new_half = numpy.ones(len(game), dtype=bool)
+        new_half[1:] = ((game[1:] != game[:-1]) |
+                        (inning[1:] != inning[:-1]) |
+                        (half[1:] != half[:-1]))
+        half_ids = numpy.cumsum(new_half) - 1
+        # Runs scored in the half inning before each event.
+        runs_before = numpy.cumsum(event_runs) - event_runs
+        runs_before -= runs_before[new_half][half_ids]
+        runs_after = inning_runs - runs_before
+        end_outs = numpy.minimum(outs + event_outs, 3)
+        last = numpy.append(new_half[1:], True)
+        complete = (end_outs[last] == 3)[half_ids]
+        keep = complete & (outs < 3) & (start_bases < 8) & (end_bases < 8)
+        start = (start_bases * 3 + outs)[keep]
+        end = numpy.where(end_outs == 3, 24, end_bases * 3 + end_outs)[keep]
+        event_counts = numpy.bincount(start, minlength=24)
+        run_counts = numpy.bincount(start, weights=runs_after[keep],
+                                    minlength=24)
+        pairs = start * 25 + end
+        pair_counts = numpy.bincount(pairs, minlength=24 * 25)
+        pair_runs = numpy.bincount(pairs, weights=event_runs[keep],
+                                   minlength=24 * 25)
+        expectancy = []
+        for state in range(24):
+            count = int(event_counts[state])
+            runs = int(run_counts[state])
+            expectancy.append([state // 3, state % 3, count, runs,
+                               '{0:.4f}'.format(float(runs) / count)
+                               if count else ''])
+        transitions = []
+        for pair in numpy.flatnonzero(pair_counts):
+            state, end_state = divmod(int(pair), 25)
+            end_state = (0, 3) if end_state == 24 else divmod(end_state, 3)
+            transitions.append(
+                [state // 3, state % 3, end_state[0], end_state[1],
+                 int(pair_counts[pair]),
+                 '{0:.4f}'.format(float(pair_counts[pair]) /
+                                  event_counts[state]),
+                 int(pair_runs[pair])])
+        return expectancy, transitions
+
+
+class GameStateIndex(object):
+    """A year's game states before each event, found by GAME_ID and
+    EVENT_ID in constant time, made from its assembled events file.
+
+    The index is a file beside the events file: a header, then one
+    fixed-width record per event, in the order of the events file, then
+    a table of each game's first record, first EVENT_ID and number of
+    events. A record packs the inning, the half (BAT_HOME_ID), the outs,
+    the bases (START_BASES_CD), both scores, and the IDs of the batter,
+    the pitcher, the fielders at positions 2 through 9 and the runners
+    on first, second and third, all as they stand before the event.
+
+    refresh() writes the file, and does nothing if the header's stamp
+    of the events file's SHA-1 digest shows it unchanged. state()
+    memory-maps the file and reads only the game table, so finding any
+    event's state is a dictionary lookup and an unpack.
+
+    """
+
+    state_fields = ['INN_CT', 'BAT_HOME_ID', 'OUTS_CT', 'START_BASES_CD',
+                    'AWAY_SCORE_CT', 'HOME_SCORE_CT', 'BAT_ID', 'PIT_ID',
+                    'POS2_FLD_ID', 'POS3_FLD_ID', 'POS4_FLD_ID',
+                    'POS5_FLD_ID', 'POS6_FLD_ID', 'POS7_FLD_ID',
+                    'POS8_FLD_ID', 'POS9_FLD_ID', 'BASE1_RUN_ID',
+                    'BASE2_RUN_ID', 'BASE3_RUN_ID']
+    fields = ['GAME_ID', 'EVENT_ID'] + state_fields
+
+    State = collections.namedtuple(
+        'State', [name.lower() for name in state_fields])
+
+    _magic = 'RCSGSI02'
+    # magic, games, records, game table offset, events file digest.
+    _header = struct.Struct('<8sIIQ40s')
+    # Six small numbers, then 13 player IDs.
+    _record = struct.Struct('<BBBBHH' + '8s' * 13)
+    # GAME_ID, first record, first EVENT_ID, number of events.
+    _game = struct.Struct('<12sIHH')
+    _file_name = '{year} states.idx'
+
+    def __init__(self, events_path, year):
+        self._events_path = events_path
+        self._path = os.path.join(os.path.dirname(events_path),
+                                  self._file_name.format(year=year))
+        self._map = None
+
+    def _stamp(self):
+        # Return what identifies the current version of the events...
+        # file, as for BaseOutMatrices: its contents' digest.
+        return _file_digest(self._events_path)
+
+    def current(self, stamp=None):
+        """Return True if the file was written from the events file as
+        it is now, or as stamp, from _stamp(), identifies it.
+
+        """
+        try:
+            with closing(open(self._path, 'rb')) as index_file:
+                header = self._header.unpack(
+                    index_file.read(self._header.size))
+        except (IOError, struct.error):
+            return False
+        return (header[0] == self._magic and
+                header[4] == (stamp or self._stamp()))
+
+    def refresh(self):
+        """Write the file unless current. Return True if written."""
+        stamp = self._stamp()
+        if self.current(stamp):
+            return False
+        self.close()
+        games = []
+        count = 0
+        temp_path = self._path + '.part'
+        with closing(open(self._events_path, 'rb')) as events_file:
+            reader = csv.reader(events_file)
+            try:
+                names = reader.next()
+            except StopIteration:
+                names = self.fields
+            indexes = [names.index(name) for name in self.fields]
+            with closing(open(temp_path, 'wb')) as index_file:
+                index_file.write('\0' * self._header.size)
+                for row in reader:
+                    values = [row[index] for index in indexes]
+                    game_id, event_id = values[0], int(values[1] or 0)
+                    if not games or games[-1][0] != game_id:
+                        games.append([game_id, count, event_id, 0])
+                    games[-1][3] += 1
+                    count += 1
+                    index_file.write(self._record.pack(
+                        *[int(value or 0) for value in values[2:8]] +
+                        values[8:]))
+                table_offset = index_file.tell()
+                for game in games:
+                    index_file.write(self._game.pack(*game))
+                index_file.seek(0)
+                index_file.write(self._header.pack(
+                    self._magic, len(games), count, table_offset, stamp))
+        _replace_file(temp_path, self._path)
+        return True
+
+    def _open(self):
+        # Map the file and read its game table into {GAME_ID: (first...
+        # record's offset, first EVENT_ID, number of events)}.
+        with closing(open(self._path, 'rb')) as index_file:
+            self._map = mmap.mmap(index_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        header = self._header.unpack_from(self._map)
+        if header[0] != self._magic:
+            raise ValueError('Not a game state index: ' + self._path)
+        self._games = {}
+        offset = header[3]
+        for _ in range(header[1]):
+            game_id, first, event_id, count = self._game.unpack_from(
+                self._map, offset)
+            self._games[game_id.rstrip('\0')] = (
+                self._header.size + first * self._record.size,
+                event_id, count)
+            offset += self._game.size
+
+    def _unpack(self, offset):
+        values = self._record.unpack_from(self._map, offset)
+        return self.State._make(
+            values[:6] + tuple(value.rstrip('\0') for value in values[6:]))
+
+    def state(self, game_id, event_id):
+        """Return the State before an event, a namedtuple of the
+        lower-case names of state_fields. Raise KeyError if there is no
+        such event.
+
+        """
+        if self._map is None:
+            self._open()
+        offset, first, count = self._games[game_id]
+        if not first <= event_id < first + count:
+            raise KeyError((game_id, event_id))
+        return self._unpack(offset + (event_id - first) * self._record.size)
+
+    def states(self, game_id):
+        """Return the States before each of a game's events, in order."""
+        if self._map is None:
+            self._open()
+        offset, _, count = self._games[game_id]
+        return [self._unpack(offset + index * self._record.size)
+                for index in range(count)]
+
+    def close(self):
+        """Unmap the file, if mapped."""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+class PitchTable(object):
+    """Makes a year's rows of the pitches table, one per pitch, from the
+    PITCH_SEQ_TX field of its assembled events file, so pitch-level
+    queries scan an indexed table instead of parsing text in SQL.
+
+    A row has the event's GAME_ID and EVENT_ID, the pitch's place in
+    its plate appearance, its Retrosheet code, the balls and strikes
+    before it, and the markers before it: pickoff throws (1, 2 or 3,
+    after + if the catcher threw), whether the catcher blocked it (*)
+    and whether runners were going (>). When a plate appearance spans
+    events, the later events' sequences repeat the earlier pitches, so
+    an event's rows are only the pitches it adds. N, for no pitch, is
+    left out and not counted, and the markers before it belong to no
+    pitch. Markers after an event's last pitch belong to no pitch of
+    it; if its plate appearance goes on, they go with the next pitch.
+
+    refresh() writes the rows as a CSV file beside the events file,
+    reading and writing a batch of events at a time, unless current()
+    finds the file made from the events file as it is now, by the
+    digest kept in '{year} pitches.json'. schema(),
+    load_specs() and duckdb_statements() define and load the table, and
+    batches() reads the file for other targets.
+
+    """
+
+    name = 'pitches'
+    fields = ['GAME_ID', 'EVENT_ID', 'PA_NEW_FL', 'PITCH_SEQ_TX']
+    columns = [  # (name, column type, comment)
+        ('game_id', 'text', 'game ID'),
+        ('event_id', 'count', 'event ID'),
+        ('pitch_id', 'count', 'pitch of plate appearance'),
+        ('pitch_cd', 'text', 'pitch code'),
+        ('balls_ct', 'count', 'balls before pitch'),
+        ('strikes_ct', 'count', 'strikes before pitch'),
+        ('pickoffs_tx', 'text', 'pickoff throws before pitch'),
+        ('blocked_fl', 'flag', 'blocked by catcher'),
+        ('runners_going_fl', 'flag', 'runners going'),
+        ('year_ct', 'count', 'year')]
+
+    _balls = 'BIPV'  # Codes always counted as balls.
+    _strikes = 'CKLMOQST'  # Codes always counted as strikes.
+    _fouls = 'FR'  # Codes counted as strikes only before two strikes.
+    _pickoffs = '+123'
+    _no_pitch = 'N'  # A play made with no pitch, as on a balk.
+    _null = r'\N'
+    _file_name = '{year} pitches.csv'
+    _stamp_name = '{year} pitches.json'
+    _batch_size = 10000
+
+    def __init__(self, events_path, year, envir):
+        self._events_path = events_path
+        self._year = int(year)
+        self._envir = envir
+        self.path = os.path.join(os.path.dirname(events_path),
+                                 self._file_name.format(year=year))
+        self._stamp_path = os.path.join(os.path.dirname(events_path),
+                                        self._stamp_name.format(year=year))
+
+    def _stamp(self):
+        # Return what identifies the current version of the events...
+        # file, as for BaseOutMatrices: its contents' digest.
+        return {'sha1': _file_digest(self._events_path)}
+
+    def current(self, stamp=None):
+        """Return True if the file was written from the events file as
+        it is now, or as stamp, from _stamp(), identifies it.
+
+        """
+        try:
+            with closing(open(self._stamp_path)) as stamp_file:
+                written = json.load(stamp_file)
+        except (IOError, ValueError):
+            return False
+        return written == (stamp or self._stamp()) and os.path.exists(
+            self.path)
+
+    def refresh(self):
+        """Write the file unless current. Return True if written."""
+        stamp = self._stamp()
+        if self.current(stamp):
+            return False
+        temp_path = self.path + '.part'
+        with closing(open(self._events_path, 'rb')) as events_file:
+            reader = csv.reader(events_file)
+            try:
+                names = reader.next()
+            except StopIteration:
+                names = self.fields
+            indexes = [names.index(name) for name in self.fields]
+            with closing(open(temp_path, 'wb')) as pitch_file:
+                writer = csv.writer(pitch_file,
+                                    lineterminator=self._envir.line_sep)
+                writer.writerow([name.upper() for name, t, c in self.columns])
+                previous = ('', '')  # GAME_ID and sequence of PA so far.
+                for batch in _batches(reader, self._batch_size):
+                    rows = []
+                    for row in batch:
+                        game_id, event_id, new_pa, sequence = [
+                            row[index] for index in indexes]
+                        if new_pa == 'T' or previous[0] != game_id:
+                            previous = (game_id, '')
+                        for pitch in self.pitches(sequence, previous[1]):
+                            rows.append(
+                                (game_id, event_id) + pitch[:4] +
+                                (pitch[4] or self._null, int(pitch[5]),
+                                 int(pitch[6]), self._year))
+                        previous = (game_id, sequence)
+                    writer.writerows(rows)
+        _replace_file(temp_path, self.path)
+        with closing(open(self._stamp_path, 'w')) as stamp_file:
+            json.dump(stamp, stamp_file)
+        return True
+
+    def pitches(self, sequence, previous=''):
+        """Return (pitch_id, pitch_cd, balls_ct, strikes_ct, pickoffs_tx,
+        blocked_fl, runners_going_fl) for each pitch a PITCH_SEQ_TX adds
+        to previous, that of the plate appearance's event before, if any.
+
+        """
+        skip = len(previous) if sequence.startswith(previous) else 0
+        pitches = []
+        balls = strikes = pitch_id = 0
+        markers = ''
+        for position, code in enumerate(sequence):
+            if not code.isalpha():
+                markers += code
+                continue
+            if code == self._no_pitch:
+                markers = ''
+                continue
+            pitch_id += 1
+            if position >= skip:
+                pickoffs = ''.join(marker for marker in markers
+                                   if marker in self._pickoffs)
+                pitches.append((pitch_id, code, balls, strikes,
+                                pickoffs or None, '*' in markers,
+                                '>' in markers))
+            markers = ''
+            if code in self._balls:
+                balls += 1
+            elif code in self._strikes or (code in self._fouls and
+                                           strikes < 2):
+                strikes += 1
+        return pitches
+
+    def schema(self, client='MySQL'):
+        """Return a statement creating the pitches table."""
+        form = '{name} {sql_data_type}'
+        if client == 'MySQL':
+            form += ' COMMENT "{comment}"'
+        specs = [form.format(
+            name=name, sql_data_type=Table._sql_data_types[data_type][client],
+            comment=comment) for name, data_type, comment in self.columns]
+        if client == 'MySQL':
+            specs.append('PRIMARY KEY (game_id, event_id, pitch_id)')
+            specs.append('KEY (year_ct)')
+        return 'CREATE TABLE IF NOT EXISTS {table} (\n  {specs});'.format(
+            table=self.name, specs=',\n  '.join(specs))
+
+    def load_specs(self):
+        """Return a statement loading the file, replacing rows of the
+        same pitch, followed by one selecting the rows it loaded.
+
+        """
+        load_form = ('LOAD DATA LOCAL INFILE "{unix_style_path}"\n'
+                     '  REPLACE INTO TABLE {table}\n'
+                     '  FIELDS TERMINATED BY ","\n'
+                     r'    ENCLOSED BY "\""' '\n'
+                     '  LINES TERMINATED BY "{line_sep}"\n'
+                     '  IGNORE 1 LINES\n'
+                     '  ({column_names});\n'
+                     "SELECT 'rcs_loaded', '{table}', ROW_COUNT();")
+        return load_form.format(
+            unix_style_path=self.path.replace('\\', '/'), table=self.name,
+            line_sep=self._envir.line_sep.encode('string-escape'),
+            column_names=', '.join(name for name, t, c in self.columns))
+
+    def duckdb_statements(self):
+        """Return DuckDB statements that make the pitches table if need
+        be and replace the year's rows with those of the file.
+
+        """
+        selected = ['CAST({name} AS {duckdb_type})'.format(
+            name=name.upper(),
+            duckdb_type=Table._sql_data_types[data_type]['DuckDB'])
+            for name, data_type, c in self.columns]
+        names = [name.upper() for name, t, c in self.columns]
+        return [self.schema('DuckDB'),
+                'DELETE FROM {table} WHERE year_ct = {year};'.format(
+                    table=self.name, year=self._year)] + _duckdb_copy(
+                        self.name, [name for name, t, c in self.columns],
+                        selected, self.path, names, self._null)
+
+    def batches(self, batch_size):
+        """Generate (table, [(column, column type)], rows) for the
+        file's typed rows, at most batch_size rows at a time.
+
+        """
+        columns = [(name, data_type) for name, data_type, c in self.columns]
+        types = [Table._python_types[data_type]
+                 for name, data_type in columns]
+        with closing(open(self.path, 'rb')) as pitch_file:
+            reader = csv.reader(pitch_file)
+            reader.next()  # Header
+            for batch in _batches(reader, batch_size):
+                yield self.name, columns, [
+                    tuple(None if value == self._null else to_type(value)
+                          for to_type, value in zip(types, row))
+                    for row in batch]
+
+
+class KeyMap(object):
+    """Assigns lasting integer keys to Retrosheet's player and team IDs.
+
+    The keys are kept in the players and teams CSV files, which are
+    also what get loaded into the players and teams tables, so an ID
+    keeps its key across years and runs. read_year() fills in names
+    and other details from a year's roster (.ROS) and TEAM files. An
+    ID first met in the data, not in those files, still gets a key.
+
+    """
+
+    _dimensions = collections.OrderedDict([  # {kind: (table, columns)}
+        ('player', ('players', [
+            ('player_key', 'player', 'integer key'),
+            ('player_id', 'text', 'Retrosheet ID'),
+            ('last_name_tx', 'text', 'last name'),
+            ('first_name_tx', 'text', 'first name'),
+            ('bat_hand_cd', 'text', 'bats'),
+            ('pit_hand_cd', 'text', 'throws')])),
+        ('team', ('teams', [
+            ('team_key', 'team', 'integer key'),
+            ('team_id', 'text', 'Retrosheet ID'),
+            ('league_cd', 'text', 'league'),
+            ('city_tx', 'text', 'city'),
+            ('name_tx', 'text', 'nickname')]))])
+
+    def __init__(self, csv_dir, envir):
+        self._envir = envir
+        self._paths = {}
+        self._entries = {}  # {kind: {retro_id: [key, retro_id, ...]}}
+        for kind, (table, columns) in self._dimensions.items():
+            path = os.path.join(csv_dir, table + '.csv')
+            self._paths[kind] = path
+            self._entries[kind] = {}
+            try:
+                with closing(open(path, 'rb')) as key_file:
+                    reader = csv.reader(key_file)
+                    reader.next()  # Header
+                    for row in reader:
+                        self._entries[kind][row[1]] = [int(row[0])] + row[1:]
+            except (IOError, StopIteration): pass
+
+    def key(self, kind, retro_id):
+        """Return the key of a 'player' or 'team' ID, assigning one if
+        the ID is new. A blank ID has no key, None.
+
+        """
+        if not retro_id:
+            return None
+        entries = self._entries[kind]
+        try:
+            return entries[retro_id][0]
+        except KeyError:
+            blanks = [''] * (len(self._dimensions[kind][1]) - 2)
+            entries[retro_id] = [len(entries) + 1, retro_id] + blanks
+            return len(entries)
+
+    def _describe(self, kind, retro_id, details):
+        # Set the details of an ID, keeping its key.
+        self.key(kind, retro_id)
+        entry = self._entries[kind][retro_id]
+        entry[2:] = details[:len(entry) - 2]
+
+    def read_year(self, unzip_dir, year):
+        """Describe the players and teams in a year's roster and TEAM
+        files, as found in unzip_dir.
+
+        """
+        for path in sorted(glob.glob(os.path.join(unzip_dir,
+                                                  '*' + year + '.ROS'))):
+            with closing(open(path, 'rb')) as roster:
+                for row in csv.reader(roster):
+                    if row:
+                        self._describe('player', row[0], row[1:5])
+        try:
+            with closing(open(os.path.join(unzip_dir, 'TEAM' + year),
+                              'rb')) as teams:
+                for row in csv.reader(teams):
+                    if row:
+                        self._describe('team', row[0], row[1:4])
+        except IOError: pass
+
+    def write(self):
+        """Write the players and teams CSV files."""
+        for kind, (table, columns) in self._dimensions.items():
+            with closing(open(self._paths[kind], 'wb')) as key_file:
+                writer = csv.writer(key_file,
+                                    lineterminator=self._envir.line_sep)
+                writer.writerow([column.upper() for column, t, c in columns])
+                writer.writerows(sorted(self._entries[kind].values()))
+
+    def schema(self, client='MySQL'):
+        """Return statements creating the players and teams tables."""
+        statements = []
+        form = '{name} {sql_data_type} NOT NULL'
+        if client == 'MySQL':
+            form += ' COMMENT "{comment}"'
+        for kind, (table, columns) in self._dimensions.items():
+            specs = [form.format(name=name,
+                                 sql_data_type=Table._sql_data_types[
+                                     data_type][client],
+                                 comment=comment)
+                     for name, data_type, comment in columns]
+            if client == 'MySQL':
+                specs.append('PRIMARY KEY ({key})'.format(key=columns[0][0]))
+                specs.append('UNIQUE ({retro_id})'.format(
+                    retro_id=columns[1][0]))
+            statements.append(
+                'CREATE TABLE IF NOT EXISTS {table} (\n  {specs});'.format(
+                    table=table, specs=',\n  '.join(specs)))
+        return statements
+
+    def duckdb_statements(self):
+        """Return DuckDB statements that make the players and teams
+        tables if need be and replace their rows.
+
+        """
+        statements = self.schema('DuckDB')
+        for kind, (table, columns) in self._dimensions.items():
+            # Blank details are read as NULL, but are stored as ''.
+            selected = [
+                ("COALESCE({name}, '')" if data_type == 'text' else
+                 'CAST({name} AS {duckdb_type})').format(
+                     name=name.upper(), duckdb_type=Table._sql_data_types[
+                         data_type]['DuckDB'])
+                for name, data_type, c in columns]
+            statements.append('DELETE FROM {table};'.format(table=table))
+            statements += _duckdb_copy(
+                table, [name for name, t, c in columns], selected,
+                self._paths[kind], [name.upper() for name, t, c in columns])
+        return statements
+
+    def batches(self):
+        """Generate (table, [(column, column type)], rows) for the
+        players and teams tables.
+
+        """
+        for kind, (table, columns) in self._dimensions.items():
+            yield (table,
+                   [(name, data_type) for name, data_type, c in columns],
+                   [tuple(entry) for entry in
+                    sorted(self._entries[kind].values())])
+
+    def load_specs(self):
+        """Return statements loading the players and teams tables,
+        replacing rows already there.
+
+        """
+        load_form = ('LOAD DATA LOCAL INFILE "{unix_style_path}"\n'
+                     '  REPLACE INTO TABLE {table}\n'
+                     '  FIELDS TERMINATED BY ","\n'
+                     r'    ENCLOSED BY "\""' '\n'
+                     '  LINES TERMINATED BY "{line_sep}"\n'
+                     '  IGNORE 1 LINES\n'
+                     '  ({column_names});')
+        line_sep = self._envir.line_sep.encode('string-escape')
+        return [load_form.format(
+            unix_style_path=self._paths[kind].replace('\\', '/'),
+            table=table, line_sep=line_sep,
+            column_names=', '.join(column for column, t, c in columns))
+            for kind, (table, columns) in self._dimensions.items()]
+
+
+class Sink(object):
+    """A target of a fan-out load, written by a thread of its own.
+
+    put() queues a batch of typed rows, blocking while the sink's
+    bounded queue is full, so reading keeps pace with the slowest sink.
+    If writing fails, the error is kept in error and later batches are
+    dropped, leaving other sinks to carry on. finish() waits for the
+    sink to write what was queued. rows counts the rows written.
+
+    Subclasses write in _write(), from an iterable of batches, each
+    (table, [(column, column type)], rows, replace). replace means
+    the rows replace rows of the same key, as for players and teams.
+
+    """
+
+    _queue_size = 4  # Batches a sink may fall behind.
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = 0
+        self.error = None
+        self._queue = Queue.Queue(self._queue_size)
+        self._ended = False
+        self._aborted = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def put(self, table, columns, rows, replace=False):
+        """Queue a batch of rows for table."""
+        if self.error is None and not self._aborted:
+            self._queue.put((table, columns, rows, replace))
+
+    def finish(self):
+        """Wait until everything queued has been written."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def abort(self):
+        """Stop the sink without waiting, dropping what is queued."""
+        self._aborted = True
+        try:
+            self._queue.put_nowait(None)
+        except Queue.Full: pass  # The sink will see _aborted.
+
+    def _batches(self):
+        # Generate queued batches until finish() or abort().
+        while not self._ended:
+            batch = self._queue.get()
+            if batch is None or self._aborted:
+                self._ended = True
+            else:
+                yield batch
+
+    def _run(self):
+        try:
+            self._write(self._batches())
+        except Exception as e:
+            self.error = e
+        for batch in self._batches(): pass  # Drain so put() won't block.
+
+
+class MySqlSink(Sink):
+    """Writes batches as INSERT statements to the SQL client, in one
+    transaction, with a load profile's session settings. A year's rows
+    already on the server are deleted in the same transaction. A batch
+    takes as many statements as keep each under _max_bytes, as the
+    server refuses any longer than its max_allowed_packet, 4 MB by
+    default in MySQL 5.7.
+
+    """
+
+    _max_bytes = 1024 * 1024
+
+    def __init__(self, name, shell, connect, use_statement, year,
+                 settings=()):
+        super(MySqlSink, self).__init__(name)
+        self._shell = shell
+        self._connect = connect
+        self._use = use_statement
+        self._year = int(year)
+        self._settings = settings  # (variable, value) pairs.
+
+    def _write(self, batches):
+        self._shell.feed(self._connect, self._statements(batches))
+
+    def _statements(self, batches):
+        # Generate SQL text for the client. Unless its rows replace by...
+        # key, a table's rows of the year are deleted before its first...
+        # batch.
+        yield '\n'.join(
+            [self._use] +
+            ['SET SESSION {variable} = {value};'.format(
+                variable=variable, value=value)
+             for variable, value in self._settings] +
+            ['START TRANSACTION;\n'])
+        cleared = set()
+        for table, columns, rows, replace in batches:
+            if not replace and table not in cleared:
+                yield 'DELETE FROM {table} WHERE year_ct = {year};\n'.format(
+                    table=table, year=self._year)
+                cleared.add(table)
+            head = '{verb} INTO {table} ({names}) VALUES\n'.format(
+                verb='REPLACE' if replace else 'INSERT', table=table,
+                names=', '.join(name for name, t in columns))
+            values = []
+            size = len(head)
+            for row in rows:
+                value = '(' + ', '.join(map(_sql_literal, row)) + ')'
+                if values and size + len(value) + 2 > self._max_bytes:
+                    yield head + ',\n'.join(values) + ';\n'
+                    values = []
+                    size = len(head)
+                values.append(value)
+                size += len(value) + 2
+            if values:
+                yield head + ',\n'.join(values) + ';\n'
+            self.rows += len(rows)
+        yield 'COMMIT;\n'
+
+
+class SqliteSink(Sink):
+    """Writes batches into an SQLite database file, making tables as
+    needed. A year's rows already in the file are replaced.
+
+    """
+
+    def __init__(self, name, path, year):
+        super(SqliteSink, self).__init__(name)
+        self._path = path
+        self._year = int(year)
+
+    def _write(self, batches):
+        connection = sqlite3.connect(self._path)
+        connection.text_factory = str
+        try:
+            made = set()
+            for table, columns, rows, replace in batches:
+                if table not in made:
+                    self._make_table(connection, table, columns, replace)
+                    made.add(table)
+                connection.executemany(
+                    '{verb} INTO {table} VALUES ({marks})'.format(
+                        verb='INSERT OR REPLACE' if replace else 'INSERT',
+                        table=table, marks=', '.join('?' * len(columns))),
+                    [[value.isoformat() if isinstance(value, datetime.time)
+                      else value for value in row] for row in rows])
+                self.rows += len(rows)
+            connection.commit()
+        finally:
+            connection.close()
+
+    def _make_table(self, connection, table, columns, replace):
+        # Make table unless it exists. Unless its rows replace by key,...
+        # delete the year's rows.
+        specs = ['{name} {data_type}'.format(
+            name=name, data_type=Table._sql_data_types[data_type]['SQLite'])
+            for name, data_type in columns]
+        if replace:
+            specs[0] += ' PRIMARY KEY'
+        connection.execute('CREATE TABLE IF NOT EXISTS {table} ({specs})'
+                           .format(table=table, specs=', '.join(specs)))
+        if not replace:
+            connection.execute('DELETE FROM {table} WHERE year_ct = ?'
+                               .format(table=table), (self._year,))
+
+
+class ParquetSink(Sink):
+    """Writes batches as Parquet files, one per table and year, such
+    as events/1990.parquet, in a folder. Rows that replace by key go
+    in one file per table, such as players.parquet. Needs pyarrow.
+
+    """
+
+    _arrow_types = {  # {column type: (pyarrow type function, args)}
+        'count': ('int32', ()),
+        'date': ('date32', ()),
+        'datetime': ('timestamp', ('s',)),
+        'flag': ('bool_', ()),
+        'player': ('int32', ()),
+        'team': ('int16', ()),
+        'text': ('string', ()),
+        'time': ('time32', ('s',))}
+
+    def __init__(self, name, path, year):
+        super(ParquetSink, self).__init__(name)
+        self._path = path
+        self._year = year
+        # Import here, not in the sink's thread, since Python 2...
+        # can't import in one thread while another uses strptime().
+        self._pyarrow = _import_pyarrow()
+
+    def _write(self, batches):
+        pyarrow = self._pyarrow
+        if pyarrow is None:
+            raise ImportError('pyarrow is needed to write Parquet files.')
+        writers = {}
+        try:
+            for table, columns, rows, replace in batches:
+                if table not in writers:
+                    writers[table] = self._writer(pyarrow, table, columns,
+                                                  replace)
+                schema = writers[table].schema
+                arrays = [pyarrow.array(list(values), type=field.type)
+                          for values, field in zip(zip(*rows), schema)]
+                writers[table].write_table(
+                    pyarrow.Table.from_arrays(arrays, schema=schema))
+                self.rows += len(rows)
+        finally:
+            for writer in writers.values():
+                writer.close()
+
+    def _writer(self, pyarrow, table, columns, replace):
+        # Return a ParquetWriter for a table's file.
+        fields = []
+        for name, data_type in columns:
+            function, args = self._arrow_types[data_type]
+            fields.append(pyarrow.field(
+                name, getattr(pyarrow, function)(*args)))
+        if replace:
+            path = os.path.join(self._path, table + '.parquet')
+        else:
+            path = os.path.join(self._path, table, self._year + '.parquet')
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        return pyarrow.parquet.ParquetWriter(path, pyarrow.schema(fields))
+
+
+class _FileLock(object):
+    # Held by one process at a time, for a with block, by locking the...
+    # first byte of a file at path, which is kept. The system frees...
+    # the lock if its holder dies. Threads of one process share it,...
+    # so they need a lock of their own as well.
+
+    def __init__(self, path):
+        self._path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self._path, 'a+')
+        try:
+            if os.name == 'posix':
+                import fcntl
+                fcntl.lockf(self._file, fcntl.LOCK_EX)
+            else:
+                import msvcrt
+                self._file.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except IOError: pass  # LK_LOCK gives up after 10 s.
+        except:
+            self._file.close()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            if os.name != 'posix':
+                import msvcrt
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()  # Which frees a posix lock.
+
+
+class Snapshots(object):
+    """A folder of per-season snapshots: for each year, an SQLite file
+    such as 1990.sqlite holding the year's rows as loaded, and, for all
+    of them, manifest.json, recording each file's size, SHA-256 digest
+    and rows per table. A copy of the folder is enough to set up
+    another host, without downloading, assembling or loading.
+
+    writer() returns the sink that writes a year's snapshot, and add()
+    puts the finished file in place and in the manifest. check() and
+    restore() read the files in parallel, so restoring many years is
+    bound by the disk rather than by Chadwick or the SQL server. Any
+    number of processes may add years at once: the manifest is read
+    and rewritten holding manifest.json.lock.
+
+    """
+
+    manifest_name = 'manifest.json'
+    _block_size = 1024 * 1024
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()  # Guards the manifest file,...
+        # ...along with a _FileLock, which other processes respect.
+
+    def file_path(self, year):
+        return os.path.join(self.path, str(year) + '.sqlite')
+
+    def manifest(self):
+        """Return the manifest, {'version': ..., 'years': {year: entry}},
+        with an entry for each year snapshotted.
+
+        """
+        try:
+            with closing(open(os.path.join(self.path, self.manifest_name))
+                         ) as manifest_file:
+                return json.load(manifest_file)
+        except IOError:
+            return {'version': VERSION, 'years': {}}
+
+    def writer(self, year):
+        """Return an unstarted SqliteSink that writes a year's snapshot
+        to a temporary file, for add() to put in place.
+
+        """
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        temp_path = self._part_path(self.file_path(year))
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return SqliteSink('snapshot', temp_path, year)
+
+    def _part_path(self, path):
+        # Return the temporary file of this process's own for path.
+        return '{path}.{pid}.part'.format(path=path, pid=os.getpid())
+
+    def add(self, year):
+        """Put a year's finished snapshot in place and record it in the
+        manifest. Return its entry.
+
+        """
+        path = self.file_path(year)
+        _replace_file(self._part_path(path), path)
+        entry = {'file': os.path.basename(path),
+                 'bytes': os.path.getsize(path),
+                 'sha256': self.digest(path),
+                 'tables': self._table_rows(path),
+                 'made': datetime.datetime.now().isoformat(' ')[:19]}
+        manifest_path = os.path.join(self.path, self.manifest_name)
+        with self._lock, _FileLock(manifest_path + '.lock'):
+            manifest = self.manifest()  # As others may have changed it.
+            manifest['version'] = VERSION
+            manifest['years'][str(year)] = entry
+            temp_path = self._part_path(manifest_path)
+            with closing(open(temp_path, 'w')) as manifest_file:
+                json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+            _replace_file(temp_path, manifest_path)
+        return entry
+
+    def digest(self, path):
+        """Return the SHA-256 digest of a file, in hex."""
+        sha = hashlib.sha256()
+        with closing(open(path, 'rb')) as in_file:
+            while True:
+                block = in_file.read(self._block_size)
+                if not block:
+                    break
+                sha.update(block)
+        return sha.hexdigest()
+
+    def check(self, years=None, threads=4):
+        """Compare the snapshot files of years (all in the manifest, if
+        None) with the manifest, threads files at a time. Return a list
+        of problems, empty if all are as recorded.
+
+        """
+        entries = self._entries(years)
+        problems = []
+        pending = Queue.Queue()
+        for year in sorted(entries):
+            pending.put(year)
+
+        def check_files():
+            while True:
+                try:
+                    year = pending.get_nowait()
+                except Queue.Empty:
+                    return
+                problem = self._check_file(year, entries[year])
+                if problem:
+                    problems.append(problem)  # list.append is atomic.
+
+        workers = [threading.Thread(target=check_files)
+                   for i in range(max(1, min(threads, len(entries))))]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return sorted(problems)
+
+    def restore(self, path, years=None, threads=4):
+        """Check the snapshots of years (all in the manifest, if None),
+        then merge them into the SQLite database at path, replacing
+        rows of those years already there. Return {year: rows}.
+
+        Raises ValueError, changing nothing, if any file is missing or
+        not as the manifest records.
+
+        """
+        entries = self._entries(years)
+        problems = self.check(entries.keys(), threads)
+        if problems:
+            raise ValueError('Snapshots not as recorded: ' +
+                             '; '.join(problems))
+        connection = sqlite3.connect(path, isolation_level=None)
+        connection.text_factory = str
+        restored = {}
+        try:
+            for year in sorted(entries):
+                restored[year] = self._merge(connection, year)
+        finally:
+            connection.close()
+        return restored
+
+    def _entries(self, years):
+        # Return {year: manifest entry} for years, or for all years in...
+        # the manifest if years is None.
+        entries = self.manifest()['years']
+        if years is None:
+            return entries
+        missing = [str(year) for year in years if str(year) not in entries]
+        if missing:
+            raise ValueError('No snapshot of ' + ', '.join(missing))
+        return dict((str(year), entries[str(year)]) for year in years)
+
+    def _check_file(self, year, entry):
+        # Return what is wrong with a year's file, or None.
+        path = os.path.join(self.path, entry['file'])
+        if not os.path.exists(path):
+            return year + ': ' + entry['file'] + ' is missing'
+        if os.path.getsize(path) != entry['bytes']:
+            return year + ': ' + entry['file'] + ' is the wrong size'
+        if self.digest(path) != entry['sha256']:
+            return year + ': ' + entry['file'] + ' has the wrong digest'
+        return None
+
+    def _table_rows(self, path):
+        # Return {table: rows} for an SQLite file.
+        connection = sqlite3.connect(path)
+        try:
+            return dict(
+                (table, connection.execute(
+                    'SELECT COUNT(*) FROM ' + table).fetchone()[0])
+                for table, in connection.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table'"))
+        finally:
+            connection.close()
+
+    def _merge(self, connection, year):
+        # Copy a year's snapshot into connection's database, in one...
+        # transaction. Tables with a year_ct column lose their rows...
+        # of the year first; the rest, players and teams, replace by...
+        # key. Return the rows copied.
+        connection.execute('ATTACH DATABASE ? AS snapshot',
+                           (self.file_path(year),))
+        rows = 0
+        try:
+            connection.execute('BEGIN')
+            try:
+                for table, sql in connection.execute(
+                        "SELECT name, sql FROM snapshot.sqlite_master "
+                        "WHERE type = 'table'").fetchall():
+                    if not connection.execute(
+                            "SELECT 1 FROM main.sqlite_master WHERE "
+                            "type = 'table' AND name = ?", (table,)
+                            ).fetchone():
+                        connection.execute(sql)  # Made in main.
+                    names = [column[1] for column in connection.execute(
+                        'PRAGMA snapshot.table_info({0})'.format(table))]
+                    if 'year_ct' in names:
+                        connection.execute(
+                            'DELETE FROM main.{0} WHERE year_ct = ?'
+                            .format(table), (int(year),))
+                    rows += connection.execute(
+                        '{verb} INTO main.{table} ({names}) SELECT {names} '
+                        'FROM snapshot.{table}'.format(
+                            verb='INSERT' if 'year_ct' in names
+                            else 'INSERT OR REPLACE',
+                            table=table, names=', '.join(names))).rowcount
+            except:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+        finally:
+            connection.execute('DETACH DATABASE snapshot')
+        return rows
 
 
 class Tasks(collections.OrderedDict):
@@ -602,11 +3579,9 @@ class Input(object):
             '-- set something on the Load tab\n'
             '-- download and/or locate Chadwick\n'
             '-- perhaps customize the years on the General tab\n\n'
-            'If you click Pause when RetroChadSql is running, RetroChadSql '
-            'will pause when it gets to the end of the task its working on '
-            'for the year it\'s working on. Depending on the task, that might '
-            'take some time. You won\'t notice the button has been pushed '
-            'until RetroChadSql pauses.'))
+            'If you click Cancel when RetroChadSql is running, RetroChadSql '
+            'will stop the task it\'s working on right away.  Years it has '
+            'already finished, and all files and folders, will be kept.'))
         label.grid(sticky='w', pady=3, padx=3, columnspan=99)
         sep = ttk.Separator(frame, orient='horizontal')
         sep.grid(row=10, columnspan=9999, sticky='ew', pady=3)
@@ -637,19 +3612,52 @@ class Input(object):
         entry.grid(row=10, sticky='ew', padx=3)
         self._finish_frame(frame)
 
+    def _ask_scope(self, parent):
+        # Make the frame for limiting which games are processed.
+        frame = ttk.Frame(parent)
+        label = ttk.Label(frame, wraplength=self._wrap_length, text=(
+            'To process only some games, fill in any of these.  Teams, such '
+            'as BOS NYA, keep the games in those teams\' event files, which '
+            'are their home games.  Leagues are AL, NL and the like.  Game '
+            'ids look like BOS199004090.  Dates are month and day, such as '
+            '0401-0430.  Leave all blank to process every game.'))
+        label.grid(padx=3, sticky='w', columnspan=99)
+        self._vars['scope'] = {}
+        last_col = -10
+        for key, text in [('teams', 'Teams'), ('leagues', 'Leagues'),
+                          ('games', 'Game ids'), ('dates', 'Dates')]:
+            label = ttk.Label(frame, text=text)
+            label.grid(row=10, column=last_col + 10, padx=(3, 0))
+            self._vars['scope'][key] = tk.StringVar()
+            entry = ttk.Entry(frame, width=14,
+                              textvariable=self._vars['scope'][key])
+            entry.grid(row=10, column=last_col + 20, padx=(0, 3))
+            last_col += 20
+        self._finish_frame(frame)
+
     def _ask_tables(self, parent):
-        # Make the frame for choosing the tables to deal with.
+        # Make the frame for choosing the tables, and their columns, to...
+        # deal with.
         frame = ttk.Frame(parent)
-        label = ttk.Label(frame, text='Select the tables to create.')
-        label.grid(padx=3)
-        last_col = 0
+        label = ttk.Label(frame, wraplength=self._wrap_length, text=(
+            'Select the tables to create.  To keep only some of a table\'s '
+            'columns, list their Chadwick names, such as GAME_ID EVENT_ID '
+            'BAT_ID.  Leave the list blank to keep every column.  Columns '
+            'that others depend on are kept automatically.'))
+        label.grid(padx=3, sticky='w', columnspan=99)
+        last_row = 0
         self._vars['tables'] = {}
+        self._vars['columns'] = {}
         for table in ['events', 'subs', 'games']:
             self._vars['tables'][table] = tk.BooleanVar(value=True)
             button = ttk.Checkbutton(frame, text=table,
                                      variable=self._vars['tables'][table])
-            button.grid(row=0, column=last_col + 10, padx=3)
-            last_col += 10
+            button.grid(row=last_row + 10, column=0, sticky='w', padx=3)
+            self._vars['columns'][table] = tk.StringVar()
+            entry = ttk.Entry(frame, textvariable=self._vars['columns'][table])
+            entry.grid(row=last_row + 10, column=10, sticky='ew', padx=3)
+            last_row += 10
+        frame.columnconfigure(10, weight=1)
         self._finish_frame(frame)
 
     def _ask_log(self, parent):
@@ -696,6 +3704,48 @@ class Input(object):
             'Stop after...'))
         self._finish_frame(frame, False)
 
+    def _ask_workers(self, parent):
+        # Make the frame asking whether to hand the years out to workers.
+        frame = ttk.Frame(parent)
+        vars_ = {}
+        vars_['coordinate'] = tk.BooleanVar(value=False)
+        button = ttk.Checkbutton(frame, variable=vars_['coordinate'], text=(
+            'Hand the years out to workers'))
+        button.grid(padx=3, sticky='w', columnspan=99)
+        for row, fields in [(10, [('host', 'Serve on:', 12),
+                                  ('port', 'Port:', 6)]),
+                            (15, [('lease', 'Lease (seconds):', 6),
+                                  ('retries', 'Retries:', 6)]),
+                            (17, [('token', 'Token:', 34)])]:
+            last_col = -10
+            for key, text, width in fields:
+                label = ttk.Label(frame, text=text)
+                label.grid(row=row, column=last_col + 10, padx=3, sticky='w')
+                vars_[key] = tk.StringVar(value=Coordinator._defaults[key])
+                entry = ttk.Entry(frame, textvariable=vars_[key], width=width)
+                entry.grid(row=row, column=last_col + 20, padx=3, sticky='w')
+                last_col += 20
+        label = ttk.Label(frame, wraplength=self._wrap_length, text=(
+            'Instead of doing the years itself, RetroChadSql hands each to '
+            'the next worker that asks, on this or any other machine, and '
+            'loads nothing itself.  Serve on 0.0.0.0 for workers on other '
+            'machines.  Leave the token blank to have one made up.  Start '
+            'each worker with:\n'
+            'retrochadsql.py --work <worker settings file>\n'
+            'The file, in JSON, gives the "coordinator" URL, such as '
+            'http://<this machine>:<port>, the "token", and optionally the '
+            '"folder" to keep task folders in, or else they\'re where set '
+            'here, the "chadwick" folder of its Chadwick programs, the '
+            '"snapshots" folder, if not Snapshots in that folder, and the '
+            '"connect" string of its SQL client.  Workers load into the '
+            'targets set here.  '
+            'A year whose worker fails, or stops renewing its lease, is '
+            'handed out again.  Not for integer keys, SQLite or DuckDB '
+            'files, comparing profiles or watching.'))
+        label.grid(row=20, padx=3, sticky='w', columnspan=99)
+        self._finish_frame(frame)
+        return vars_
+
     def _ask_rcs_dir(self, parent):
         # Make the frame to pick the program's home directory.
         frame = ttk.Frame(parent)
@@ -714,9 +3764,11 @@ class Input(object):
         # Make the main control tab.
         frame = ttk.Frame(nb)
         self._ask_years(frame)
+        self._ask_scope(frame)
         self._ask_tables(frame)
         self._ask_log(frame)
         self._ask_first_last(frame)
+        self._vars['coordinate'] = self._ask_workers(frame)
         self._ask_rcs_dir(frame)
         nb.add(frame, text='General')
         return frame
@@ -876,14 +3928,122 @@ class Input(object):
     def _ask_files(self, nb, task):
         # Make the tab to deal with files pertaining to <task>.
         frame=ttk.Frame(nb)
+        if task == 'Download':
+            self._vars['Download'] = self._ask_watch(frame)
+        if task == 'Assemble':
+            self._vars['Assemble'] = {'matrices': self._ask_matrices(frame),
+                                      'index': self._ask_index(frame),
+                                      'pitches': self._ask_pitches(frame)}
         if task == 'Define':
-            self._vars['Define'] = {'db_name': self._ask_db_name(frame)}
+            self._vars['Define'] = {'db_name': self._ask_db_name(frame),
+                                    'transform': self._ask_transform(frame),
+                                    'keys': self._ask_keys(frame),
+                                    'cluster': self._ask_cluster(frame),
+                                    'profile': self._ask_profile(frame)}
+            self._vars['Define'].update(self._ask_inserts(frame))
+            self._vars['Define'].update(self._ask_parallel(frame))
         self._ask_path(frame, task)
         self._ask_keep(frame, task)
         frame.columnconfigure(0, weight=1)
         nb.add(frame, text=task.partition(' ')[0])
         return frame
 
+    def _ask_watch(self, parent):
+        # Make the frame asking where to download from and whether to...
+        # keep watching for changes.
+        frame = ttk.Frame(parent)
+        vars_ = {}
+        label = ttk.Label(frame, text='Download from:')
+        label.grid(padx=3, sticky='w')
+        vars_['source_url'] = tk.StringVar(value=SOURCE_URL)
+        entry = ttk.Entry(frame, textvariable=vars_['source_url'])
+        entry.grid(row=0, column=10, padx=3, sticky='ew', columnspan=99)
+        vars_['watch'] = tk.BooleanVar(value=False)
+        button = ttk.Checkbutton(frame, variable=vars_['watch'], text=(
+            'Keep watching, redoing the years whose files change'))
+        button.grid(row=10, padx=3, sticky='w', columnspan=99)
+        last_col = -10
+        for key, text, default in [
+                ('interval', 'Check every (minutes):', '60'),
+                ('jitter', 'plus up to:', '10'),
+                ('max_refreshes', 'Years redone at once:', '2')]:
+            label = ttk.Label(frame, text=text)
+            label.grid(row=20, column=last_col + 10, padx=3, sticky='w')
+            vars_[key] = tk.StringVar(value=default)
+            entry = ttk.Entry(frame, textvariable=vars_[key], width=6)
+            entry.grid(row=20, column=last_col + 20, padx=3, sticky='w')
+            last_col += 20
+        label = ttk.Label(frame, wraplength=self._wrap_length, text=(
+            '{year} in the address stands for each year.  When watching, '
+            'RetroChadSql asks for each year\'s file with the tags it was '
+            'last downloaded with, so an unchanged year is not downloaded '
+            'again.  Only the years that changed are unzipped, assembled, '
+            'defined and loaded, as set on the other tabs, and all folders '
+            'are kept.  Each refresh is recorded in "refresh log.jsonl" in '
+            'the Download folder, where the settings are also saved as '
+            '"watch.json" for running without a window, as in:\n'
+            'retrochadsql.py --watch "<Download folder>/watch.json"'))
+        label.grid(row=30, padx=3, sticky='w', columnspan=99)
+        frame.columnconfigure(10, weight=1)
+        self._finish_frame(frame)
+        return vars_
+
+    def _ask_matrices(self, parent):
+        # Make the frame asking whether to compute run expectancy.
+        frame = ttk.Frame(parent)
+        var = tk.BooleanVar(value=False)
+        button = ttk.Checkbutton(frame, variable=var, text=(
+            'Compute run expectancy and base-out transitions for each year'))
+        button.grid(padx=3, sticky='w')
+        if _import_numpy() is None:
+            button.state(['disabled'])
+        label = ttk.Label(frame, wraplength=self._wrap_length, text=(
+            'After assembling the events table, RetroChadSql writes each '
+            "year's 24 base-out states, with the runs expected to score from "
+            'each, and how often each state leads to each other state, as '
+            'small CSV files beside the assembled files.  A year is only '
+            'recomputed when its events file changes.  This requires NumPy.'))
+        label.grid(row=10, padx=3, sticky='w')
+        self._finish_frame(frame)
+        return var
+
+    def _ask_index(self, parent):
+        # Make the frame asking whether to index game states.
+        frame = ttk.Frame(parent)
+        var = tk.BooleanVar(value=False)
+        button = ttk.Checkbutton(frame, variable=var, text=(
+            'Index the game state before each event for each year'))
+        button.grid(padx=3, sticky='w')
+        label = ttk.Label(frame, wraplength=self._wrap_length, text=(
+            'After assembling the events table, RetroChadSql writes a '
+            "compact file beside each year's events file, holding the "
+            'inning, outs, bases, score, batter, pitcher, fielders and '
+            'runners before each event, so programs using GameStateIndex '
+            'can look up any event by game and event ID without scanning '
+            'the table.  A year is only reindexed when its events file '
+            'changes.'))
+        label.grid(row=10, padx=3, sticky='w')
+        self._finish_frame(frame)
+        return var
+
+    def _ask_pitches(self, parent):
+        # Make the frame asking whether to derive the pitches table.
+        frame = ttk.Frame(parent)
+        var = tk.BooleanVar(value=False)
+        button = ttk.Checkbutton(frame, variable=var, text=(
+            'Derive a pitches table from the pitch sequences'))
+        button.grid(padx=3, sticky='w')
+        label = ttk.Label(frame, wraplength=self._wrap_length, text=(
+            'After assembling the events table, RetroChadSql splits each '
+            "event's PITCH_SEQ_TX into one row per pitch, with the balls "
+            'and strikes before it and any pickoff throws, blocked pitch '
+            'or runners going, in a pitches file beside the events file.  '
+            'It is defined and loaded with the other tables, keyed by game, '
+            'event and pitch, so pitch queries need no string parsing.'))
+        label.grid(row=10, padx=3, sticky='w')
+        self._finish_frame(frame)
+        return var
+
     def _ask_db_name(self, parent):
         # Make the frame asking for the database name.
         frame = ttk.Frame(parent)
@@ -894,7 +4054,10 @@ class Input(object):
             'those names are already in the database, RetroChadSql will '
             'attempt to insert data into those tables.  If the tables do not '
             'have the structure to allow that, RetroChadSql will stop and '
-            'report the error.'))
+            'report the error.  If this run also loads the server, tables '
+            'that lack fields this Chadwick makes are altered to add them, '
+            'and the new fields are filled in for the years already '
+            'loaded, if their event files are in the Unzip folder.'))
         label.grid(padx=3, pady=(3, 0), sticky='w', columnspan=99)
         var = tk.StringVar(value='RetroChadSql')
         label = ttk.Label(frame, text='Name of database to use or create:')
@@ -903,7 +4066,240 @@ class Input(object):
         entry.grid(row=10, column=10, padx=3, pady=(3, 0), sticky='ew')
         frame.columnconfigure(10, weight=1)
         self._finish_frame(frame)
-        return var
+        return var
+
+    def _ask_transform(self, parent):
+        # Make the frame asking where field conversions should be done.
+        frame = ttk.Frame(parent)
+        var = tk.BooleanVar(value=False)
+        button = ttk.Checkbutton(frame, variable=var, text=(
+            'Convert fields in Python, making CSV files ready to load'))
+        button.grid(padx=3, sticky='w')
+        label = ttk.Label(frame, wraplength=self._wrap_length, text=(
+            'Some fields, such as T/F flags and time stamps, must be '
+            'converted before they are stored.  Normally the database does '
+            'that for each row as it loads.  If this is checked, '
+            'RetroChadSql converts them first, writing a "ready" copy of '
+            'each CSV file.  That takes disk space but makes loading faster, '
+            'and the ready files can be loaded by other databases.'))
+        label.grid(row=10, padx=3, sticky='w')
+        self._finish_frame(frame)
+        return var
+
+    def _ask_keys(self, parent):
+        # Make the frame asking whether to store IDs as integer keys.
+        frame = ttk.Frame(parent)
+        var = tk.BooleanVar(value=False)
+        button = ttk.Checkbutton(frame, variable=var, text=(
+            'Store player and team IDs as integer keys'))
+        button.grid(padx=3, sticky='w')
+        label = ttk.Label(frame, wraplength=self._wrap_length, text=(
+            'Players and teams are loaded, from the roster and team files, '
+            'into players and teams tables, and the other tables refer to '
+            'them by small integer keys.  Views such as events_ids show the '
+            'Retrosheet IDs.  Requires converting fields in Python.  The '
+            'keys are kept in players.csv and teams.csv in the SQL folder; '
+            'keep them as long as the database is kept.  When only loading, '
+            'this must match how the SQL files were made.'))
+        label.grid(row=10, padx=3, sticky='w')
+        self._finish_frame(frame)
+        return var
+
+    def _ask_cluster(self, parent):
+        # Make the frame asking whether to key tables on natural keys.
+        frame = ttk.Frame(parent)
+        var = tk.BooleanVar(value=False)
+        button = ttk.Checkbutton(frame, variable=var, text=(
+            'Use natural primary keys, sorting files before loading'))
+        button.grid(padx=3, sticky='w')
+        label = ttk.Label(frame, wraplength=self._wrap_length, text=(
+            'Instead of an auto-increment id, events are keyed on game_id '
+            'and event_id, subs on game_id, event_id, sub_id and sub_fld_cd, '
+            'and games on game_id.  The database then stores rows in game '
+            'order, so reading a game reads neighboring rows.  Each file is '
+            'sorted on its key first, using temporary files rather than '
+            'memory, so the rows load in order.'))
+        label.grid(row=10, padx=3, sticky='w')
+        self._finish_frame(frame)
+        return var
+
+    def _ask_inserts(self, parent):
+        # Make the frame asking whether to write INSERT statements too.
+        frame = ttk.Frame(parent)
+        vars_ = {}
+        vars_['inserts'] = tk.BooleanVar(value=False)
+        button = ttk.Checkbutton(frame, variable=vars_['inserts'], text=(
+            'Also write standard SQL INSERT statements'))
+        button.grid(padx=3, sticky='w', columnspan=99)
+        last_col = 0
+        for key, text, default in [('insert_rows', 'Rows per INSERT:', '500'),
+                                   ('insert_mb', 'MB per file:', '50')]:
+            ttk.Label(frame, text=text).grid(row=10, column=last_col + 10,
+                                             padx=3, sticky='w')
+            vars_[key] = tk.StringVar(value=default)
+            entry = ttk.Entry(frame, textvariable=vars_[key], width=8)
+            entry.grid(row=10, column=last_col + 20, padx=3, sticky='w')
+            last_col += 20
+        vars_['insert_commit'] = tk.StringVar(value='batch')
+        for value, text in [('batch', 'commit each INSERT'),
+                            ('file', 'commit each file')]:
+            button = ttk.Radiobutton(frame, text=text, value=value,
+                                     variable=vars_['insert_commit'])
+            button.grid(row=10, column=last_col + 10, padx=3, sticky='w')
+            last_col += 10
+        label = ttk.Label(frame, wraplength=self._wrap_length, text=(
+            'For databases, such as Access, that can\'t load files from the '
+            'command line, each CSV file is also written, a batch of rows at '
+            'a time, as INSERT statements that can be run in any SQL tool.  '
+            'Fields are converted in Python.  Files are split to stay under '
+            'the size given.'))
+        label.grid(row=20, padx=3, sticky='w', columnspan=99)
+        self._finish_frame(frame)
+        return vars_
+
+    def _ask_parallel(self, parent):
+        # Make the frame asking whether to load in parallel parts.
+        frame = ttk.Frame(parent)
+        vars_ = {}
+        vars_['parallel'] = tk.BooleanVar(value=False)
+        button = ttk.Checkbutton(frame, variable=vars_['parallel'], text=(
+            'Load each year in parts, over several connections at once'))
+        button.grid(padx=3, sticky='w', columnspan=99)
+        last_col = -10
+        for key, text, default in [('chunk_mb', 'MB per part:', '64'),
+                                   ('connections', 'Connections:', '4')]:
+            label = ttk.Label(frame, text=text)
+            label.grid(row=10, column=last_col + 10, padx=3, sticky='w')
+            vars_[key] = tk.StringVar(value=default)
+            entry = ttk.Entry(frame, textvariable=vars_[key], width=6)
+            entry.grid(row=10, column=last_col + 20, padx=3, sticky='w')
+            last_col += 20
+        label = ttk.Label(frame, wraplength=self._wrap_length, text=(
+            'Big CSV files are split into parts at line ends, and each part, '
+            'and each smaller file, is loaded over its own connection, so '
+            'the server can use more of its cores.  Each part is an XA '
+            'transaction, and none is committed until all are ready, so a '
+            'failure leaves none of the year loaded.  Needs MySQL 5.7.7 or '
+            'MariaDB 10.5 or newer, and is only used when the SQL server is '
+            'the only target.  When only loading, this must match how the '
+            'SQL files were made.'))
+        label.grid(row=20, padx=3, sticky='w', columnspan=99)
+        self._finish_frame(frame)
+        return vars_
+
+    def _profile_box(self, parent, var):
+        # Return a read-only combobox for choosing a load profile.
+        return ttk.Combobox(parent, textvariable=var, state='readonly',
+                            values=_LOAD_PROFILES.keys(), width=16)
+
+    def _ask_profile(self, parent):
+        # Make the frame asking which load profile the SQL files use.
+        frame = ttk.Frame(parent)
+        label = ttk.Label(frame, text='Load profile:')
+        label.grid(padx=3, sticky='w')
+        var = tk.StringVar(value=_LOAD_PROFILES.keys()[0])
+        self._profile_box(frame, var).grid(row=0, column=10, padx=3)
+        text = '\n'.join('{name}:  {description}'.format(
+            name=name, description=profile['description'])
+            for name, profile in _LOAD_PROFILES.items())
+        label = ttk.Label(frame, wraplength=self._wrap_length, text=text)
+        label.grid(row=10, padx=3, sticky='w', columnspan=99)
+        self._finish_frame(frame)
+        return var
+
+    def _ask_compare(self, parent):
+        # Make the frame asking whether to compare two load profiles.
+        frame = ttk.Frame(parent)
+        vars_ = {}
+        vars_['compare'] = tk.BooleanVar(value=False)
+        button = ttk.Checkbutton(frame, variable=vars_['compare'], text=(
+            'Instead of loading, compare load profiles'))
+        button.grid(padx=3, sticky='w')
+        last_col = 0
+        for key, index in [('compare_a', 0), ('compare_b', -1)]:
+            vars_[key] = tk.StringVar(value=_LOAD_PROFILES.keys()[index])
+            box = self._profile_box(frame, vars_[key])
+            box.grid(row=0, column=last_col + 10, padx=3)
+            last_col += 10
+        label = ttk.Label(frame, wraplength=self._wrap_length, text=(
+            'To compare, RetroChadSql loads each year under both profiles, '
+            'each into its own scratch database, and reports how long each '
+            'took.  The scratch databases are dropped when done.  The SQL '
+            'files must already be defined.'))
+        label.grid(row=10, padx=3, sticky='w', columnspan=99)
+        self._finish_frame(frame, False)
+        return vars_
+
+    def _ask_aggregate(self, parent):
+        # Make the frame asking whether to keep season totals.
+        frame = ttk.Frame(parent)
+        var = tk.BooleanVar(value=False)
+        button = ttk.Checkbutton(frame, variable=var, text=(
+            'After loading each year, refresh its season totals'))
+        button.grid(padx=3, sticky='w')
+        label = ttk.Label(frame, wraplength=self._wrap_length, text=(
+            'Batting, pitching and fielding totals for each player and team '
+            'are kept in tables such as batting_player_seasons.  Only the '
+            'years loaded in this run are recomputed; other years are left '
+            'as they are.  Requires the events table.  Not done when '
+            'comparing load profiles.'))
+        label.grid(row=10, padx=3, sticky='w')
+        self._finish_frame(frame, False)
+        return var
+
+    def _ask_sinks(self, parent):
+        # Make the frame asking what to load the data into.
+        frame = ttk.Frame(parent)
+        frame.last_row = 0
+        label = ttk.Label(frame, wraplength=self._wrap_length, text=(
+            'Load the data into each of these.  If more than the SQL server '
+            'is checked, each CSV file is read once and its rows are passed '
+            'to all of them at the same pace.  If one fails, the others go '
+            'on.  Parquet files need pyarrow.  DuckDB, which needs the '
+            'duckdb module, reads the CSV files itself.'))
+        label.grid(padx=3, sticky='w', columnspan=99)
+        vars_ = {}
+        rcs_dir = self._vars['rcs_dir'].get()
+        for kind, text, default, folder in [
+                ('mysql', 'the SQL server, through the shell above', None,
+                 None),
+                ('sqlite', 'an SQLite file', 'RetroChadSql.sqlite', False),
+                ('parquet', 'a folder of Parquet files', 'Parquet', True),
+                ('duckdb', 'a DuckDB file', 'RetroChadSql.duckdb', False)]:
+            vars_['sink_' + kind] = tk.BooleanVar(value=kind == 'mysql')
+            button = ttk.Checkbutton(frame, variable=vars_['sink_' + kind],
+                                     text=text)
+            button.grid(row=frame.last_row + 10, padx=3, sticky='w')
+            frame.last_row += 10
+            if (kind == 'parquet' and _import_pyarrow() is None or
+                    kind == 'duckdb' and _import_duckdb() is None):
+                button.state(['disabled'])
+            if default:
+                vars_[kind + '_path'] = self._choose_var(
+                    frame, 'Path', os.path.join(rcs_dir, default), folder)
+        self._finish_frame(frame)
+        return vars_
+
+    def _ask_snapshots(self, parent):
+        # Make the frame asking whether to snapshot each year loaded.
+        frame = ttk.Frame(parent)
+        vars_ = {}
+        vars_['snapshot'] = tk.BooleanVar(value=False)
+        button = ttk.Checkbutton(frame, variable=vars_['snapshot'], text=(
+            'After loading each year, save a snapshot of it'))
+        button.grid(padx=3, sticky='w')
+        vars_['snapshot_path'] = self._choose_var(
+            frame, 'Folder', os.path.join(self._vars['rcs_dir'].get(),
+                                          'Snapshots'), True)
+        label = ttk.Label(frame, wraplength=self._wrap_length, text=(
+            'Each year is saved as an SQLite file, such as 1990.sqlite, '
+            'with its size and SHA-256 digest in the folder\'s '
+            'manifest.json.  To set up another host from a copy of the '
+            'folder, run RetroChadSql with --restore FOLDER DATABASE.  Not '
+            'done when comparing load profiles.'))
+        label.grid(row=20, padx=3, sticky='w')
+        self._finish_frame(frame, False)
+        return vars_
 
     def _ask_client(self, parent):
         # Make a frame to pick the SQL command shell.
@@ -994,6 +4390,10 @@ class Input(object):
         vars_ = {}
         vars_['shell'] = self._ask_client(frame)
         vars_.update(self._ask_params(frame))
+        vars_.update(self._ask_compare(frame))
+        vars_['aggregate'] = self._ask_aggregate(frame)
+        vars_.update(self._ask_sinks(frame))
+        vars_.update(self._ask_snapshots(frame))
         self._vars['Load'] = vars_
         frame.columnconfigure(0, weight=1)
         nb.add(frame, text='RDBMS')
@@ -1129,11 +4529,34 @@ class Input(object):
             msg = "No RetroChadSql folder for standard paths."
             path = os.path.join(self._vals['rcs_dir'], '')
             self._require_input(path, 'rcs_dir', msg, 'General')
-        if 'Load' in path_set:
+        load_vals = self._vals['Load']
+        if 'Load' in path_set and (load_vals['sink_mysql'] or
+                                   load_vals['compare']):
             msg = "No SQL client selected."
             self._require_input(self._vals['Load']['shell'], 'client_path',
                                 msg, 'Load')
     
+    def _parse_sinks(self):
+        # Set config['sinks'] to a list of load targets, as dicts,...
+        # unless the SQL server is the only one.
+        load_vals = self._vals['Load']
+        targets = []
+        if load_vals['sink_mysql']:
+            targets.append({'kind': 'MySQL'})
+        for kind in ('SQLite', 'Parquet', 'DuckDB'):
+            key = kind.lower()
+            if load_vals['sink_' + key]:
+                target = {'kind': kind}
+                msg = 'No path given for the {kind} target.'.format(kind=kind)
+                self._require_input(load_vals[key + '_path'], 'path', msg,
+                                    'Load', target)
+                targets.append(target)
+        if not targets:
+            self._require_input(None, 'sinks', 'Nothing to load into.',
+                                'Load')
+        elif targets != [{'kind': 'MySQL'}]:
+            self._config['sinks'] = targets
+
     def _parse_years(self):
         specs = self._vals['years'].split()
         if not specs:
@@ -1153,6 +4576,106 @@ class Input(object):
                     years += new
         self._config['years'] = map(str, years)
 
+    def _parse_scope(self):
+        # Store the teams, leagues, games and dates to limit processing to.
+        vals = {key: val.replace(',', ' ').upper().split()
+                for key, val in self._vals['scope'].items()}
+        scope = {'teams': vals['teams'],
+                 'leagues': [league[0] for league in vals['leagues']],
+                 'games': vals['games'],
+                 'dates': None}
+        bad = [team for team in scope['teams'] if len(team) != 3]
+        bad += [game for game in scope['games']
+                if not re.match(r'^\w{3}\d{9}$', game)]
+        if vals['dates']:
+            match = re.match(r'^(\d{4})-(\d{4})$', ''.join(vals['dates']))
+            if match:
+                scope['dates'] = match.groups()
+            else:
+                bad += vals['dates']
+        if bad:
+            self._errors.insert(0, 'Bad teams, games or dates: ' +
+                                ' '.join(bad))
+            self._show_tab = self._tabs['General']
+        self._config['scope'] = scope
+
+    def _parse_coordinate(self, tasks):
+        # Store how years are handed out to workers, if that can be done.
+        vals = self._vals['coordinate']
+        try:
+            settings = {key: int(vals[key])
+                        for key in ('port', 'lease', 'retries')}
+        except ValueError:
+            settings = None
+        if settings and (settings['lease'] < 1 or settings['retries'] < 0):
+            settings = None
+        if settings:
+            settings['host'] = vals['host'].strip() or 'localhost'
+            settings['token'] = vals['token'].strip()
+        msg = 'The port, lease and retries must be whole numbers.'
+        self._require_input(settings, 'coordinate', msg, 'General')
+        load_vals = self._vals['Load']
+        define = self._config['tasks'].get('Define', {})
+        msg = ('Workers can\'t share integer keys, SQLite or DuckDB files, '
+               'compare profiles, or watch.')
+        clash = (define.get('keys') or
+                 'Download' in tasks and self._vals['Download']['watch'] or
+                 'Load' in tasks and (load_vals['compare'] or
+                                      load_vals['sink_sqlite'] or
+                                      load_vals['sink_duckdb']))
+        self._require_input(not clash or None, 'coordinate', msg, 'General',
+                            {})
+
+    def _parse_watch(self):
+        # Store where to download from and how to watch, if watching.
+        vals = self._vals['Download']
+        msg = 'The download address must include {year}.'
+        self._require_input('{year}' in vals['source_url'] or None,
+                            'source_url', msg, 'Download')
+        self._config['source_url'] = vals['source_url']
+        if not vals['watch']:
+            return
+        try:
+            watch = {'interval': float(vals['interval']) * 60,
+                     'jitter': float(vals['jitter']) * 60,
+                     'max_refreshes': int(vals['max_refreshes'])}
+        except ValueError:
+            watch = None
+        if watch and (watch['interval'] <= 0 or watch['jitter'] < 0 or
+                      watch['max_refreshes'] < 1):
+            watch = None
+        msg = 'Watch times and the number of years at once must be numbers.'
+        self._require_input(watch, 'watch', msg, 'Download')
+
+    def _parse_parallel(self, dic):
+        # Store the size of parts and how many connections load them.
+        vals = self._vals['Define']
+        try:
+            chunk_mb = float(vals['chunk_mb'])
+            connections = int(vals['connections'])
+        except ValueError:
+            chunk_mb = connections = 0
+        msg = 'MB per part and connections must be positive numbers.'
+        self._require_input(chunk_mb > 0 and connections > 0 or None,
+                            'parallel', msg, 'Define', dic)
+        dic['parallel'] = {'chunk_bytes': int(chunk_mb * 1024 * 1024),
+                           'connections': connections}
+
+    def _parse_inserts(self, dic):
+        # Store how INSERT statements are to be batched and split.
+        vals = self._vals['Define']
+        try:
+            batch_size = int(vals['insert_rows'])
+            max_mb = float(vals['insert_mb'])
+        except ValueError:
+            batch_size = max_mb = 0
+        msg = 'Rows per INSERT and MB per file must be positive numbers.'
+        self._require_input(batch_size > 0 and max_mb > 0 or None,
+                            'inserts', msg, 'Define', dic)
+        dic['inserts'] = {'batch_size': batch_size,
+                          'per_batch': vals['insert_commit'] == 'batch',
+                          'max_bytes': int(max_mb * 1024 * 1024)}
+
     def _test_connection(self, connect_string):
         test = connect_string + ' -e "SELECT 0;"'
         try:
@@ -1192,30 +4715,95 @@ class Input(object):
             msg = 'No database name given'
             dic = self._config['tasks']['Define']
             self._require_input(db_name, 'db_name', msg, 'Define', dic)
+            dic['transform'] = self._vals['Define']['transform']
+            dic['profile'] = self._vals['Define']['profile']
+            dic['cluster'] = self._vals['Define']['cluster']
+            if self._vals['Define']['keys'] and not dic['transform']:
+                self._require_input(None, 'keys', 'Integer keys require '
+                                    'converting fields in Python.', 'Define')
+            if self._vals['Define']['inserts']:
+                self._parse_inserts(dic)
+        if 'Define' in self._config.get('tasks', {}):
+            keys = self._vals['Define']['keys']
+            self._config['tasks']['Define']['keys'] = keys
+            if self._vals['Define']['parallel']:
+                self._parse_parallel(self._config['tasks']['Define'])
         
         tables = {table for table in self._vals['tables']
                   if self._vals['tables'][table]}  # {k if v}
         self._require_input(tables, 'tables', "No tables selected.",
                             'General')
+        self._config['columns'] = {}
+        for table in tables:
+            columns = self._vals['columns'][table].replace(',', ' ').split()
+            if columns:
+                self._config['columns'][table] = columns
         
         self._parse_years()
+        self._parse_scope()
+
+        if 'Download' in tasks:
+            self._parse_watch()
+        if self._vals['coordinate']['coordinate']:
+            self._parse_coordinate(tasks)
+
+        if 'Assemble' in tasks and self._vals['Assemble']['matrices']:
+            msg = 'Run expectancy needs the events table.'
+            self._require_input('events' in tables or None, 'matrices', msg,
+                                'General')
+        if 'Assemble' in tasks and self._vals['Assemble']['index']:
+            msg = 'Indexing game states needs the events table.'
+            self._require_input('events' in tables or None, 'state_index',
+                                msg, 'General')
+        if self._vals['Assemble']['pitches'] and \
+                set(tasks).intersection({'Assemble', 'Define', 'Load'}):
+            msg = 'The pitches table needs the events table.'
+            self._require_input('events' in tables or None, 'pitches', msg,
+                                'General')
 
         if 'Load' in tasks:
-            self._config['connect'] = self._connect_string(self._vals['Load'])
+            load_vals = self._vals['Load']
+            if load_vals['sink_mysql'] or load_vals['compare']:
+                self._config['connect'] = self._connect_string(load_vals)
+            if load_vals['compare']:
+                profiles = [load_vals['compare_a'], load_vals['compare_b']]
+                msg = 'Choose two different load profiles to compare.'
+                self._require_input(profiles if len(set(profiles)) == 2
+                                    else None, 'compare', msg, 'Load')
+            else:
+                self._parse_sinks()
+                if load_vals['snapshot']:
+                    msg = 'No folder given for snapshots.'
+                    self._require_input(load_vals['snapshot_path'],
+                                        'snapshots', msg, 'Load')
+            if load_vals['aggregate'] and not load_vals['compare']:
+                msg = 'Season totals need the events table.'
+                self._require_input('events' in tables or None, 'aggregate',
+                                    msg, 'General')
+                if not (load_vals['sink_mysql'] or load_vals['sink_duckdb']):
+                    self._require_input(None, 'aggregate', 'Season totals '
+                                        'are kept only on the SQL server '
+                                        'or in DuckDB.', 'Load')
             
         self._config['log_level'] = self._vals['log']
     
-    def _submit(self):
-        # Handle the Go! button.
+    def _submit(self, plan=False):
+        # Handle the Go! button, or, if plan, the Plan button.
         self._set_config()
         if self._errors:
             message = '\n'.join(self._errors)
             showwarning('Incorrect Input', message)
             self._show_tab.master.select(self._show_tab)
         else:
+            if plan:
+                self._config['plan'] = True
             self._window.destroy()
             self._when_done(self._config)
 
+    def _plan(self):
+        # Handle the Plan button.
+        self._submit(plan=True)
+
     def _cancel(self):
         self._root.destroy()
 
@@ -1224,6 +4812,8 @@ class Input(object):
         frame=ttk.Frame(parent)
         submit_button = ttk.Button(frame, text='Go!', command=self._submit)
         submit_button.grid(padx=3)
+        plan_button = ttk.Button(frame, text='Plan', command=self._plan)
+        plan_button.grid(row=0, column=5, padx=3)
         cancel_button = ttk.Button(frame, text='Cancel', command=self._cancel)
         cancel_button.grid(row=0, column=10, padx=3)
         frame.grid(row=999)
@@ -1263,7 +4853,7 @@ class Input(object):
 class FuncError(Exception):
     """Common class to handle exceptions thrown by task functions.
 
-    Processor._step() calls task functions. If those functions throw an
+    Processer._work() calls task functions. If those functions throw an
     exception, it is caught and paseed here for handling.
 
     __init__ requires the original exception, the year that did not
@@ -1279,7 +4869,7 @@ class FuncError(Exception):
 
     def __init__(self, e, year, gerund):
         """e is an exception thrown by a task's function that is called
-        by Processor._step().
+        by Processer._work().
         
         year is the year being processed when e was thrown occured.
         
@@ -1346,7 +4936,7 @@ class Reporter(object):
         self._root = root
         self._noisiness = noisiness
         self._log_box = ScrolledText(parent, wrap=tk.WORD)
-        self._log_box.grid(padx=3, pady=3, sticky='news')
+        self._log_box.grid(row=0, padx=3, pady=3, sticky='news')
         
     def _pretty_map(self, d, indents):
         #Formats a dictionary. Mutually recursive with _prep_report().
@@ -1390,35 +4980,249 @@ class Reporter(object):
         self._root.update_idletasks()
 
 
+class RunStats(object):
+    """Measures a run's progress through its steps, each one task for
+    one year, and estimates how long the run has left.
+
+    Each task's work is counted in its own unit: bytes downloaded,
+    files unzipped, CSV rows assembled and rows loaded. Defining is only
+    timed. start() begins a step, given the work it will take if known,
+    and advance(), which any thread may call, counts work done.
+    Throughput is averaged over the last _window seconds. finish()
+    records the step's seconds, CPU seconds (the process's and its
+    commands'), work and bytes of files written, and save() keeps them
+    as JSON in file_name in the user's folder, so estimate() can tell a
+    later run what a step will cost from what it cost last time, or
+    else from the average of the task's other years.
+
+    """
+
+    units = {'Download': 'bytes', 'Unzip': 'files', 'Assemble': 'rows',
+             'Define': None, 'Load': 'rows'}
+    file_name = '.retrochadsql-stats.json'
+    _window = 10.0
+
+    def __init__(self, path, steps):
+        self._path = path
+        self._steps = list(steps)  # [(year, task)], in order.
+        self._lock = threading.Lock()
+        try:
+            with closing(open(path)) as stats_file:
+                self._costs = json.load(stats_file)
+        except (IOError, ValueError):
+            self._costs = {}  # {task: {year: {'seconds':, 'work':...}}}
+        self._begun = time.time()
+        self._finished = 0
+        self._step = None
+
+    def estimate(self, year, task, key='seconds'):
+        """Return what a step is expected to cost, as key: 'seconds',
+        'cpu', 'work' or 'bytes'. Return None if nothing is known.
+
+        """
+        costs = self._costs.get(task, {})
+        if costs.get(year, {}).get(key) is not None:
+            return costs[year][key]
+        values = [cost[key] for cost in costs.values()
+                  if cost.get(key) is not None]
+        return float(sum(values)) / len(values) if values else None
+
+    def _cpu(self):
+        # Return the CPU seconds used so far by this process and by...
+        # the commands it has waited for.
+        return sum(os.times()[:4])
+
+    def start(self, year, task, total=None):
+        """Begin a step. total is the work it will take, if known."""
+        now = time.time()
+        with self._lock:
+            self._step = {
+                'year': year, 'task': task, 'done': 0, 'begun': now,
+                'cpu': self._cpu(),
+                'ended': None, 'seconds': self.estimate(year, task),
+                'total': (self.estimate(year, task, 'work') if total is None
+                          else total),
+                'samples': collections.deque([(now, 0)])}
+
+    def advance(self, amount, total=None):
+        """Count amount more work done, and reset the total if given."""
+        now = time.time()
+        with self._lock:
+            step = self._step
+            step['done'] += amount
+            if total is not None:
+                step['total'] = total
+            samples = step['samples']
+            samples.append((now, step['done']))
+            while len(samples) > 2 and now - samples[0][0] > self._window:
+                samples.popleft()
+
+    def finish(self, written=None):
+        """End the current step, recording what it cost. written is the
+        bytes of the files it wrote, if known.
+
+        """
+        with self._lock:
+            step = self._step
+            step['ended'] = time.time()
+            self._costs.setdefault(step['task'], {})[step['year']] = {
+                'seconds': step['ended'] - step['begun'],
+                'cpu': self._cpu() - step['cpu'],
+                'work': step['done'] if self.units[step['task']] else None,
+                'bytes': written}
+            self._finished += 1
+
+    def save(self):
+        """Write the recorded costs, for later runs' estimates."""
+        temp_path = self._path + '.part'
+        try:
+            with closing(open(temp_path, 'w')) as stats_file:
+                json.dump(self._costs, stats_file, indent=1, sort_keys=True)
+            _replace_file(temp_path, self._path)
+        except (IOError, OSError): pass  # Estimates are only a nicety.
+
+    def snapshot(self):
+        """Return a dict of the current step's year, task, unit, done,
+        total (or None), rate in units a second (or None) and fraction
+        done (or None), and the run's fraction done and eta, its
+        seconds left (or None if some step can't yet be estimated).
+
+        """
+        now = time.time()
+        with self._lock:
+            step = dict(self._step)
+            samples = list(step['samples'])
+        unit = self.units[step['task']]
+        elapsed = (step['ended'] or now) - step['begun']
+        rate = None
+        if unit and samples[-1][0] > samples[0][0]:
+            rate = ((samples[-1][1] - samples[0][1]) /
+                    (samples[-1][0] - samples[0][0]))
+        if step['ended']:
+            fraction, left = 1.0, 0.0
+        elif unit and step['total']:
+            fraction = min(float(step['done']) / step['total'], 1.0)
+            left = ((step['total'] - step['done']) / rate if rate else
+                    step['seconds'] and step['seconds'] * (1 - fraction))
+        elif step['seconds']:
+            fraction = min(elapsed / step['seconds'], 0.99)
+            left = max(step['seconds'] - elapsed, 0.0)
+        else:
+            fraction = left = None
+        for year, task in self._steps[self._finished +
+                                      (0 if step['ended'] else 1):]:
+            cost = self.estimate(year, task)
+            left = None if left is None or cost is None else left + cost
+        spent = now - self._begun
+        return {'year': step['year'], 'task': step['task'], 'unit': unit,
+                'done': step['done'], 'total': step['total'], 'rate': rate,
+                'fraction': fraction, 'eta': left,
+                'overall': (spent / (spent + left) if left is not None and
+                            spent + left else None)}
+
+
 class Processer(object):
-    def __init__(self, root, envir, tasks, config):
-        self._root = root
+    """Performs the chosen tasks for each chosen year.
+
+    Processer does no Tk work of its own, so run() can be the target of
+    a worker thread. Anything it has to tell the user is put on the
+    events queue as a tuple whose first item is the kind of event:
+    ('report', ignorability, args) is to be passed to Reporter.report(),
+    ('progress', snapshot) gives a RunStats snapshot, at most every
+    _progress_seconds while a step works and whenever one starts or
+    ends, and ('done',) is put when run() returns.
+
+    cancel() may be called from any thread. succeeded is True once every
+    task has been done for every year.
+
+    """
+
+    def __init__(self, envir, tasks, config, events):
         self._envir = envir
         self._config = config
         self._tasks = tasks
+        self._events = events
+        self._shell = Shell()
         self._tasks.set_attr(
             'func',
             [self._download, self._unzip, self._assemble, self._define,
              self._load])
         self._schema_defined = False
         self._schema_loaded = False
+        self._aggregates_defined = False
+        self._fan_out_size = 5000  # Rows per batch sent to each sink.
+        self._migrate_lock = 'retrochadsql_migrate'  # Server-wide name.
+        self._migrate_wait = 3600  # Seconds to wait for that lock.
+        self._stats_path = os.path.join(envir.user_dir, RunStats.file_name)
+        self._progress_seconds = 0.25
+        self._csv_rows = {}  # {(year, table name): rows assembled}
+        self.succeeded = False
+
+    def _report(self, ignorability, *args):
+        self._events.put(('report', ignorability, args))
+
+    def _progress(self, amount=0, total=None, force=False):
+        # Count work done on the current step, and put a progress...
+        # event if force or if none was put lately.
+        self._stats.advance(amount, total)
+        now = time.time()
+        with self._progress_lock:
+            if not force and now - self._progress_time < \
+                    self._progress_seconds:
+                return
+            self._progress_time = now
+        self._events.put(('progress', self._stats.snapshot()))
 
-        if config['log_level']:
-            root.geometry('+80+3')
-            self._reporter = Reporter(root, root, config['log_level'])
-        else:
-            root.withdraw()
+    def cancel(self):
+        """Stop the run as soon as possible.
 
-    def process(self):    
-        # Initialize the run-time and call the generator.
-        
+        Commands in flight are killed. Years already reported complete,
+        and all files and directories, are kept.
+
+        """
+        self._shell.cancel()
+
+    def run(self):
+        """Initialize the run-time, then do each task for each year."""
+        try:
+            if self._prepare():
+                self._work()
+        except Cancelled:
+            self._report(0, 'Cancelled.  Years already reported complete '
+                         'and all files and directories will be kept.')
+        finally:
+            self._events.put(('done',))
+
+    def _prepare(self):
+        # Initialize the run-time. Return False if the run can't go on.
         self._tables = {name: Table(name, self._envir)
                         for name in self._config['tables']}
-                        
-        try:
-            self._reporter.report(1, "Starting RetroChadSql")
-            self._reporter.report(2, 'User input is:\n', self._config, '\n')
-        except AttributeError: pass
+        for name, columns in self._config['columns'].items():
+            self._tables[name].select_columns(columns)
+        for table in self._tables.values():
+            table.set_scope(self._config['scope'])
+        if self._config.get('matrices'):
+            self._tables['events'].require_columns(BaseOutMatrices.fields)
+        if self._config.get('state_index'):
+            self._tables['events'].require_columns(GameStateIndex.fields)
+        if self._config.get('pitches'):
+            self._tables['events'].require_columns(PitchTable.fields)
+        if self._config['tasks'].get('Define', {}).get('cluster'):
+            for table in self._tables.values():
+                table.use_natural_key()
+        keyed = self._config['tasks'].get('Define', {}).get('keys')
+        if keyed:
+            for table in self._tables.values():
+                table.use_keys()
+            self._keys = KeyMap(self._config['tasks']['Define']['path'],
+                                self._envir)
+        if self._config.get('aggregate'):
+            self._aggregates = SeasonAggregates(keyed=keyed)
+            self._tables['events'].require_columns(
+                self._aggregates.required_columns())
+
+        self._report(1, "Starting RetroChadSql")
+        self._report(2, 'User input is:\n', self._config, '\n')
 
         self._old_dirs = set()
         paths = {name: attributes['path']
@@ -1427,7 +5231,7 @@ class Processer(object):
         try:
             paths['Chadwick'] = self._config['Chadwick']['path']
         except KeyError: pass
-        Table.set_class_attributes(paths)
+        Table.set_class_attributes(paths, self._shell)
         for path in paths.values():
             self._old_dirs.add(self._envir.exist_path(path))
         for path in paths.values():
@@ -1445,54 +5249,233 @@ class Processer(object):
                     # Test Chadwick while doing something useful.
                     table.parse_description()
             except subprocess.CalledProcessError as error:
-                try:
-                    self._reporter.report(0, "Error accessing Chadwick: ",
-                                          error.output)
-                except AttributeError:
-                    self._reporter = Reporter(self._root, self._root, 0)
-                    self._reporter.report(0, "Error accessing Chadwick: ",
-                                          error.output)
-                self._reporter.report(0, "Close this window to exit.")
-                return
-
-        self._root.stepper = self._step().next
-        self._reset_caller(100)
+                self._report(0, "Error accessing Chadwick: ", error.output)
+                return False
+        return True
 
     def _download(self, year):
         #Download a year's .zip file from Retrosheet.
-        source_pattern = 'http://www.retrosheet.org/events/{year}eve.zip'
-        zip_string = urllib2.urlopen(source_pattern.format(year=year)).read()
+        source_pattern = self._config.get('source_url', SOURCE_URL)
+        source = urllib2.urlopen(source_pattern.format(year=year), timeout=60)
         write_dir = self._config['tasks']['Download']['path']
         file_name = os.path.join(write_dir, year + '.zip')
-        with closing(open(file_name, 'wb')) as zip_file:
-            zip_file.write(zip_string)
+        length = source.info().getheader('Content-Length')
+        self._progress(0, int(length) if length else None, True)
+        # Keep the file's validators, so Watcher can tell when it changes.
+        validators = _read_validators(write_dir)
+        validators[year] = _save_response(source, file_name, self._shell,
+                                          self._progress)
+        _write_validators(write_dir, validators)
 
 
     def _unzip(self, year):
         # Unzip a year's Retrosheet data. All years share a directory.
         read_dir = self._config['tasks']['Download']['path']
         read_name = os.path.join(read_dir, year + '.zip')
-        ZipFile(read_name).extractall(self._config['tasks']['Unzip']['path'])
-
+        with closing(ZipFile(read_name)) as zipped:
+            members = [member for member in zipped.infolist()
+                       if _in_scope(self._config['scope'], member.filename)]
+            self._unzipped_bytes = sum(member.file_size for member in members)
+            self._progress(0, len(members), True)
+            for member in members:
+                self._shell.check()
+                zipped.extract(member, self._config['tasks']['Unzip']['path'])
+                self._progress(1)
+
+
+    def _written(self, year, task):
+        # Return the bytes of the files a step wrote, for RunStats.
+        paths = self._config['tasks']
+        if task == 'Download':
+            return os.path.getsize(os.path.join(paths['Download']['path'],
+                                                year + '.zip'))
+        if task == 'Unzip':
+            return self._unzipped_bytes
+        if task == 'Assemble':
+            written = [table.csv_path(year) for table in self._tables.values()]
+            if self._config.get('pitches'):
+                written.append(self._pitch_table(year).path)
+            return sum(os.path.getsize(path) for path in written)
+        if task == 'Define':
+            written = glob.glob(os.path.join(paths['Define']['path'],
+                                             year + ' *.sql'))
+            written.append(os.path.join(paths['Define']['path'],
+                                        year + '.sql'))
+            if paths['Define']['transform']:
+                written += [self._loaded_path(year, table)
+                            for table in self._tables.values()]
+            written += glob.glob(os.path.join(paths['Assemble']['path'],
+                                              year + ' * chunk *.csv'))
+            return sum(os.path.getsize(path) for path in written
+                       if os.path.exists(path))
+        if self._snapshots is not None:
+            return os.path.getsize(self._snapshots.file_path(year))
+        return 0  # Loading writes to the database, not to files.
 
     def _assemble(self, year):
         """Use Chadwick to make a year's CSV file for each table."""
-        for table in self._tables.values():
+        for name, table in self._tables.items():
             table.assemble_year(year)
+            rows = _count_rows(table.csv_path(year))
+            self._csv_rows[(year, name)] = rows
+            self._progress(rows)
+        if self._config.get('matrices'):
+            self._compute_matrices(year)
+        if self._config.get('state_index'):
+            self._index_states(year)
+        if self._config.get('pitches'):
+            self._derive_pitches(year)
+
+    def _compute_matrices(self, year):
+        # Write a year's run expectancy and transition matrices, unless...
+        # its events file hasn't changed since they were written.
+        matrices = BaseOutMatrices(self._tables['events'].csv_path(year), year)
+        if matrices.refresh():
+            self._report(2, year, ' run expectancy computed.')
+        else:
+            self._report(2, year, ' run expectancy already current.')
+
+    def _index_states(self, year):
+        # Write a year's game state index, unless its events file...
+        # hasn't changed since it was written.
+        index = GameStateIndex(self._tables['events'].csv_path(year), year)
+        if index.refresh():
+            self._report(2, year, ' game states indexed.')
+        else:
+            self._report(2, year, ' game state index already current.')
+
+    def _pitch_table(self, year):
+        # Return the PitchTable of a year, or None if not wanted.
+        if not self._config.get('pitches'):
+            return None
+        return PitchTable(self._tables['events'].csv_path(year), year,
+                          self._envir)
+
+    def _derive_pitches(self, year):
+        # Write a year's pitches file, unless its events file hasn't...
+        # changed since it was written.
+        pitches = self._pitch_table(year)
+        if pitches.refresh():
+            rows = _count_rows(pitches.path)
+            self._csv_rows[(year, pitches.name)] = rows
+            self._report(2, year, ' pitches derived: ', rows, ' rows.')
+        else:
+            self._report(2, year, ' pitches already current.')
 
 
 
     def _define_schema(self, db_name, sql_dir, year):
+        # Write to a file of this process's own, then rename it, as...
+        # Watcher may run several at once.
         file_name = os.path.join(sql_dir, 'schema.sql')
-        with closing(open(file_name, 'w')) as schema:
+        temp_name = '{path}.{pid}.tmp'.format(path=file_name, pid=os.getpid())
+        with closing(open(temp_name, 'w')) as schema:
             schema.write('CREATE DATABASE IF NOT EXISTS ' + db_name + ';\n')
             schema.write('USE ' + db_name + ';\n\n')
+            transformed = self._config['tasks']['Define']['transform']
+            if self._config['tasks']['Define']['keys']:
+                schema.write('\n\n'.join(self._keys.schema()) + '\n\n')
             for table in self._tables.values():
                 # Supply a dummy year for Chadwick.
-                table.define_schema(schema, year)
+                table.define_schema(schema, year, transformed)
                 #TODO: write here instead of passing schema.
-            self._schema_defined = True
-            
+            if self._config.get('pitches'):
+                schema.write(self._pitch_table(year).schema() + '\n\n')
+        _replace_file(temp_name, file_name)
+        self._schema_defined = True
+        targets = self._config.get('sinks', [{'kind': 'MySQL'}])
+        if 'connect' in self._config and {'kind': 'MySQL'} in targets:
+            self._define_migration(sql_dir)
+
+    def _define_migration(self, sql_dir, file_name='migrate.sql'):
+        # Compare the tables with those on the server, writing a file...
+        # with what brings them up to date: ALTER TABLE statements,...
+        # then backfills of the years already loaded. Return None if...
+        # there's nothing to do, else the loaded years whose rows gain...
+        # fields. The file is written under a name of this process's...
+        # own, then renamed, as others may write it too.
+        db_name = self._config['tasks']['Define']['db_name']
+        rows = self._query(
+            "SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, COLUMN_COMMENT "
+            "FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = '{db_name}' "
+            "ORDER BY TABLE_NAME, ORDINAL_POSITION;".format(db_name=db_name))
+        live = collections.defaultdict(collections.OrderedDict)
+        for row in rows:
+            if len(row) == 4:
+                live[row[0]][row[1].lower()] = (row[2], row[3])
+        statements = []
+        changed = set()
+        for name, table in self._tables.items():
+            if name not in live:
+                continue  # CREATE TABLE will make it.
+            alter, added = table.migration(live[name])
+            if alter:
+                statements.append(alter)
+            if not added:
+                continue
+            self._report(1, name, ' will gain ', added, '.')
+            years = self._query(
+                'SELECT DISTINCT year_ct FROM {db_name}.{name};'.format(
+                    db_name=db_name, name=name))
+            for row in years:
+                changed.add(row[0])
+                backfill = table.backfill_statements(row[0], added,
+                                                     live[name])
+                if backfill is None:
+                    self._report(0, name, '\'s new fields can\'t be filled '
+                                 'in for ', row[0], ' without its event '
+                                 'files and natural key.')
+                else:
+                    statements += backfill
+        file_path = os.path.join(sql_dir, file_name)
+        if statements:
+            temp_name = '{path}.{pid}.tmp'.format(path=file_path,
+                                                  pid=os.getpid())
+            with closing(open(temp_name, 'w')) as sql_file:
+                sql_file.write('\n\n'.join(
+                    ['USE `{db_name}`;'.format(db_name=db_name)] +
+                    statements) + '\n')
+            _replace_file(temp_name, file_path)
+        else:
+            try:
+                os.remove(file_path)  # The server is already up to date.
+            except OSError: pass
+            return None
+        return sorted(changed)
+
+    def _migrate(self, sql_dir):
+        # Bring the server's tables up to date, as migrate.sql, written...
+        # by Define, would. Watch children and Workers may load at...
+        # once, so this holds a server lock, taken by a client kept...
+        # open meanwhile, and compares the tables again under it, as...
+        # another may have just migrated them. What's run is kept...
+        # under a name with the time. The years changed get new data...
+        # versions, as loading them would give.
+        client = self._shell.session(self._config['connect'] + ' -N -B -n')
+        try:
+            client.stdin.write(
+                "SELECT GET_LOCK('{name}', {seconds});\n".format(
+                    name=self._migrate_lock, seconds=self._migrate_wait))
+            client.stdin.flush()
+            if client.stdout.readline().strip() != '1':
+                raise IOError('The tables are being brought up to date '
+                              'elsewhere.')
+            stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+            file_name = 'migrate {stamp}.sql'.format(stamp=stamp)
+            years = self._define_migration(sql_dir, file_name)
+            if years is not None:
+                self._run_sql_file(os.path.join(sql_dir, file_name))
+                if years:
+                    self._record_versions(
+                        years, 'migrate {stamp} versions.sql'.format(
+                            stamp=stamp))
+                self._report(1, 'Tables brought up to date.')
+            try:
+                os.remove(os.path.join(sql_dir, 'migrate.sql'))
+            except OSError: pass
+        finally:
+            self._shell.end(client)  # Ending its session frees the lock.
+
 
     def _define(self, year):
         db_name = '`' + self._config['tasks']['Define']['db_name'] + '`'
@@ -1500,25 +5483,538 @@ class Processer(object):
         if not self._schema_defined:
             # Supply a dummy year for Chadwick.
             self._define_schema(db_name, sql_dir, year)
+        keyed = self._config['tasks']['Define']['keys']
+        if keyed:
+            self._keys.read_year(self._config['tasks']['Unzip']['path'], year)
+        transformed = self._config['tasks']['Define']['transform']
+        if transformed:
+            for table in self._tables.values():
+                table.transform_year(year, self._keys if keyed else None)
+        if self._config['tasks']['Define']['cluster']:
+            for table in self._tables.values():
+                table.sort_year(year, transformed)
         file_path = os.path.join(sql_dir, year + '.sql')
         sql_statements = ['USE {db_name};'.format(db_name=db_name)]
-        for table in self._tables.values():
-            sql_statements.append(table.load_specs(year))
+        load_statements = [
+            table.load_specs(year) + '\n' + table.count_statement()
+            for table in self._tables.values()]
+        if keyed:
+            self._keys.write()
+            load_statements[:0] = self._keys.load_specs()
+        pitches = self._pitch_table(year)
+        if pitches is not None:
+            pitches.refresh()
+            load_statements.append(pitches.load_specs())
+        sql_statements += self._profile_statements(
+            self._config['tasks']['Define']['profile'], load_statements)
         with closing(open(file_path, 'w')) as sql_file:
             sql_file.write('\n\n'.join(sql_statements))
+        if self._config['tasks']['Define'].get('parallel'):
+            self._define_parts(year, db_name, transformed, keyed)
+        inserts = self._config['tasks']['Define'].get('inserts')
+        if inserts:
+            paths = []
+            for table in self._tables.values():
+                paths += table.write_inserts(
+                    year, sql_dir, inserts['batch_size'],
+                    inserts['per_batch'], inserts['max_bytes'],
+                    self._keys if keyed else None)
+            self._report(2, year, ' INSERT statements written to ',
+                         len(paths), ' files.')
+
+    def _define_parts(self, year, db_name, transformed, keyed):
+        # Write a year's loading as part files that can run at once over...
+        # several connections, each loading one file or chunk in an XA...
+        # transaction that it leaves prepared. _load_parallel() commits.
+        sql_dir = self._config['tasks']['Define']['path']
+        for old_path in glob.glob(os.path.join(sql_dir, year + ' part *.sql')):
+            os.remove(old_path)
+        parallel = self._config['tasks']['Define']['parallel']
+        statements = self._keys.load_specs() if keyed else []
+        for table in self._tables.values():
+            for path in table.split_year(year, transformed,
+                                         parallel['chunk_bytes']):
+                statements.append(table.load_specs(year, path) + '\n' +
+                                  table.count_statement())
+        if self._config.get('pitches'):
+            statements.append(self._pitch_table(year).load_specs())
+        profile = _LOAD_PROFILES[self._config['tasks']['Define']['profile']]
+        settings = ['SET SESSION {variable} = {value};'.format(
+            variable=variable, value=value)
+            for variable, value in profile['settings']]
+        for n, statement in enumerate(statements, 1):
+            xid = "'rcs-{year}-{n:03d}'".format(year=year, n=n)
+            part = (['USE {db_name};'.format(db_name=db_name)] + settings +
+                    ['XA START {xid};'.format(xid=xid), statement,
+                     'XA END {xid};\nXA PREPARE {xid};'.format(xid=xid)])
+            file_path = os.path.join(sql_dir, '{year} part {n:03d}.sql'.format(
+                year=year, n=n))
+            with closing(open(file_path, 'w')) as sql_file:
+                sql_file.write('\n\n'.join(part) + '\n')
+
+    def _loaded_path(self, year, table):
+        # Return the path of the CSV file that loads a year of a table.
+        transformed = self._config['tasks']['Define']['transform']
+        return os.path.join(self._config['tasks']['Assemble']['path'],
+                            table._csv_name(year, transformed))
+
+    def _profile_statements(self, profile_name, statements):
+        # Return statements wrapped in a load profile's settings.
+        profile = _LOAD_PROFILES[profile_name]
+        before = []
+        after = []
+        for variable, value in profile['settings']:
+            saved = '@rcs_saved_' + variable
+            before.append('SET {saved} = @@SESSION.{variable};'.format(
+                saved=saved, variable=variable))
+            before.append('SET SESSION {variable} = {value};'.format(
+                variable=variable, value=value))
+            after.append('SET SESSION {variable} = {saved};'.format(
+                variable=variable, saved=saved))
+        if profile['transaction']:
+            before.append('START TRANSACTION;')
+            after.insert(0, 'COMMIT;')
+        return (['\n'.join(before)] if before else []) + statements + (
+            ['\n'.join(after)] if after else [])
+
+    def _run_sql_file(self, file_path):
+        # Run a file of SQL statements through the SQL client.
+        command = '{connect} < "{sql_file}"'.format(
+            connect=self._config['connect'], sql_file=file_path)
+        return self._shell.check_output(command)
+
+    def _query(self, sql):
+        # Return the rows, as lists of strings, that a query selects.
+        command = '{connect} -N -B -e "{sql}"'.format(
+            connect=self._config['connect'], sql=sql)
+        output = self._shell.check_output(command)
+        return [line.split('\t') for line in output.splitlines()]
+
+    def _year_rows(self, year):
+        # Return the number of rows in a year's assembled CSV files,...
+        # the pitches file among them, or None if some file is missing.
+        paths = [(name, table.csv_path(year))
+                 for name, table in self._tables.items()]
+        pitches = self._pitch_table(year)
+        if pitches is not None:
+            paths.append((pitches.name, pitches.path))
+        total = 0
+        for name, path in paths:
+            if (year, name) not in self._csv_rows:
+                try:
+                    self._csv_rows[(year, name)] = _count_rows(path)
+                except IOError:
+                    return None
+            total += self._csv_rows[(year, name)]
+        return total
 
     def _load(self, year):
         sql_dir = self._config['tasks']['Define']['path']
+        if 'compare' in self._config:
+            return self._compare_year(year)
+        total = self._year_rows(year)
+        self._progress(0, total, True)
+        targets = self._config.get('sinks', [{'kind': 'MySQL'}])
+        sinks = [target for target in targets if target['kind'] != 'DuckDB']
+        to_mysql = {'kind': 'MySQL'} in sinks
+        if to_mysql and not self._schema_loaded:
+            self._migrate(sql_dir)
+            self._run_sql_file(os.path.join(sql_dir, 'schema.sql'))
+            self._schema_loaded = True
+        if sinks == [{'kind': 'MySQL'}]:
+            fingerprints = {}
+            thread = threading.Thread(target=self._fingerprint,
+                                      args=(year, fingerprints))
+            thread.daemon = True
+            thread.start()
+            if self._config['tasks']['Define'].get('parallel'):
+                output = self._load_parallel(year, total)
+            else:
+                output = self._run_sql_file(
+                    os.path.join(sql_dir, year + '.sql'))
+                self._progress(total or 0)
+            while thread.is_alive():
+                thread.join(1)
+            self._verify(year, fingerprints, output)
+        elif sinks:
+            to_mysql = self._fan_out(year, sinks, total)
+        if to_mysql and self._config.get('aggregate'):
+            self._aggregate(year)
+        if to_mysql:
+            self._record_versions([year], year + ' version.sql')
+        for target in targets:
+            if target['kind'] != 'DuckDB':
+                continue
+            try:
+                self._load_duckdb(year, target['path'])
+            except Cancelled:
+                raise
+            except Exception as e:
+                if len(targets) == 1:
+                    raise
+                self._report(0, year, ' not loaded into DuckDB: ', e)
+        if self._snapshots is not None:
+            self._snapshot(year)
+
+    def _fingerprint(self, year, fingerprints):
+        # Put each table's Table.fingerprint() for a year in...
+        # fingerprints, leaving out any whose file can't be read.
+        for name, table in self._tables.items():
+            try:
+                fingerprints[name] = table.fingerprint(
+                    self._loaded_path(year, table))
+            except (IOError, csv.Error): pass
+
+    def _verify(self, year, fingerprints, output):
+        # Compare a year's rows and checksums, as read from its CSV...
+        # files, with the rows the server says each load added and the...
+        # checksum it summed while loading them, as selected in output.
+        loaded = {}
+        for line in output.splitlines():
+            fields = line.split('\t')
+            if (len(fields) != 4 or fields[0] != 'rcs_loaded' or
+                    not fields[2].isdigit() or not fields[3].isdigit()):
+                continue  # A header, or something else.
+            rows, checksum = loaded.get(fields[1], (0, 0))
+            loaded[fields[1]] = (rows + int(fields[2]),
+                                 checksum + int(fields[3]))
+        problems = []
+        for name in sorted(fingerprints):
+            rows, checksum, fields = fingerprints[name]
+            if name not in loaded:
+                continue
+            if loaded[name][0] != rows:
+                problems.append('{0}: {1} rows read, {2} loaded'.format(
+                    name, rows, loaded[name][0]))
+            elif loaded[name][1] != checksum:
+                problems.append('{0}: checksums differ over {1}'.format(
+                    name, ', '.join(fields).lower()))
+        if problems:
+            self._mismatches.append((year, problems))
+            self._report(0, 'Warning: ', year, ' may not have loaded '
+                         'correctly: ', '; '.join(problems), '.')
+        elif loaded:
+            self._report(2, year, ' verified: ', sum(
+                fingerprint[0] for fingerprint in fingerprints.values()),
+                         ' rows.')
+
+    def _load_duckdb(self, year, path):
+        # Load a year into a DuckDB file, in one transaction, with the...
+        # statements also written to the SQL folder.
+        duckdb = _import_duckdb()
+        if duckdb is None:
+            raise ImportError('The duckdb module is needed to load DuckDB.')
+        transformed = self._config['tasks']['Define'].get('transform')
+        statements = []
+        if self._config['tasks']['Define'].get('keys'):
+            statements += self._keys.duckdb_statements()
+        for table in self._tables.values():
+            statements += table.duckdb_statements(year, transformed)
+        if self._config.get('pitches'):
+            statements += self._pitch_table(year).duckdb_statements()
+        if self._config.get('aggregate') and 'events' in self._tables:
+            aggregates = SeasonAggregates(
+                'DuckDB', self._config['tasks']['Define'].get('keys'))
+            statements += aggregates.schema() + aggregates.refresh(year)
+        sql_dir = self._config['tasks']['Define']['path']
+        file_path = os.path.join(sql_dir, year + ' duckdb.sql')
+        with closing(open(file_path, 'w')) as sql_file:
+            sql_file.write('\n\n'.join(statements) + '\n')
+        connection = duckdb.connect(path)
+        cursor = connection.cursor()  # duckdb 0.1.x has only cursors.
+        try:
+            cursor.execute('BEGIN TRANSACTION;')
+            for statement in statements:
+                self._shell.check()
+                cursor.execute(statement)
+            cursor.execute('COMMIT;')
+        except:
+            cursor.execute('ROLLBACK;')
+            raise
+        finally:
+            # duckdb 0.1.x can't open the file again in this process...
+            # once the connection is closed with a cursor still held.
+            del cursor
+            connection.close()
+        self._report(2, year, ' loaded into DuckDB.')
+
+    def _load_parallel(self, year, total=None):
+        # Run a year's part files over several connections at once. Each...
+        # leaves its XA transaction prepared, and they are committed only...
+        # once all are prepared, so a failure leaves none of the year.
+        # Parts left prepared by a cancelled run are rolled back first.
+        # Each part counts as an equal share of total rows loaded.
+        sql_dir = self._config['tasks']['Define']['path']
+        parts = sorted(glob.glob(os.path.join(sql_dir, year + ' part *.sql')))
+        if not parts:
+            raise IOError('No part files for ' + year + '.  Define them '
+                          'for parallel loading first.')
+        xid_form = 'rcs-{year}-{n}'
+        leftovers = [row[3] for row in self._query('XA RECOVER;')
+                     if len(row) > 3 and
+                     row[3].startswith(xid_form.format(year=year, n=''))]
+        self._end_transactions(leftovers, 'ROLLBACK')
+        pending = Queue.Queue()
+        for part in parts:
+            pending.put(part)
+        prepared = []
+        errors = []
+        outputs = []
+        share = (total or 0) // len(parts)
+        threads = [threading.Thread(target=self._load_parts,
+                                    args=(pending, prepared, errors, share,
+                                          outputs))
+                   for i in range(min(self._config['tasks']['Define'][
+                       'parallel']['connections'], len(parts)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(1)
+        xids = [xid_form.format(year=year, n=part[-len('001.sql'):-4])
+                for part in prepared]
+        self._shell.check()
+        if errors:
+            self._end_transactions(xids, 'ROLLBACK')
+            raise errors[0]
+        self._end_transactions(xids, 'COMMIT')
+        self._report(2, year, ' loaded in ', len(parts), ' parts over ',
+                     len(threads), ' connections.')
+        return ''.join(outputs)
+
+    def _load_parts(self, pending, prepared, errors, share, outputs):
+        # Run part files from pending until none are left or one fails,...
+        # keeping their output in outputs.
+        while not errors:
+            try:
+                part = pending.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                outputs.append(self._run_sql_file(part))
+            except Exception as e:
+                errors.append(e)
+                return
+            prepared.append(part)
+            self._progress(share)
+
+    def _end_transactions(self, xids, verb):
+        # Commit or roll back prepared XA transactions.
+        if xids:
+            self._shell.feed(self._config['connect'], [
+                "XA {verb} '{xid}';\n".format(verb=verb, xid=xid)
+                for xid in xids])
+
+    def _use_statement(self, year):
+        # Return the USE statement of a year's SQL file.
+        sql_dir = self._config['tasks']['Define']['path']
+        with closing(open(os.path.join(sql_dir, year + '.sql'))) as sql_file:
+            return re.search(r'^USE `[^`]+`;', sql_file.read(),
+                             re.MULTILINE).group(0)
+
+    def _make_sink(self, target, year):
+        # Return a Sink for a target, a dict as made by...
+        # Input._parse_sinks().
+        kind = target['kind']
+        if kind == 'MySQL':
+            profile = self._config['tasks']['Define'].get('profile',
+                                                          'default')
+            return MySqlSink(kind, self._shell, self._config['connect'],
+                             self._use_statement(year), year,
+                             _LOAD_PROFILES[profile]['settings'])
+        if kind == 'SQLite':
+            return SqliteSink(kind, target['path'], year)
+        return ParquetSink(kind, target['path'], year)
+
+    def _fan_out_batches(self, year, keys):
+        # Generate the batches a fan-out load passes to each sink.
+        if keys:
+            for table, columns, rows in keys.batches():
+                yield table, columns, rows, True
+        for name, table in self._tables.items():
+            for rows in table.read_year(year, self._fan_out_size, keys):
+                yield name, table.row_columns(), rows, False
+        pitches = self._pitch_table(year)
+        if pitches is not None:
+            for table, columns, rows in pitches.batches(self._fan_out_size):
+                yield table, columns, rows, False
+
+    def _fan_out(self, year, targets, total=None):
+        # Read each of a year's CSV files once, passing each batch to...
+        # every target's sink. Report how each sink did, warning if it...
+        # wrote other than total rows. Return True if MySQL was a...
+        # target and its sink succeeded.
+        sinks = [self._make_sink(target, year) for target in targets]
+        for sink in sinks:
+            sink.start()
+        keys = self._keys if self._config['tasks']['Define'].get('keys') \
+            else None
+        try:
+            for table, columns, rows, replace in self._fan_out_batches(
+                    year, keys):
+                self._shell.check()
+                if not rows:
+                    continue
+                for sink in sinks:
+                    sink.put(table, columns, rows, replace)
+                if not replace:
+                    self._progress(len(rows))
+                if all(sink.error for sink in sinks):
+                    break
+        except:
+            for sink in sinks:
+                sink.abort()
+            raise
+        for sink in sinks:
+            sink.finish()
+        for sink in sinks:
+            if sink.error:
+                self._report(0, year, ' not loaded into ', sink.name, ': ',
+                             getattr(sink.error, 'output', None) or
+                             sink.error)
+            else:
+                self._report(2, year, ' loaded into ', sink.name, ': ',
+                             sink.rows, ' rows.')
+                if keys is None and total is not None and \
+                        sink.rows != total:
+                    problem = '{0}: {1} rows read, {2} written'.format(
+                        sink.name, total, sink.rows)
+                    self._mismatches.append((year, [problem]))
+                    self._report(0, 'Warning: ', year, ' may not have '
+                                 'loaded correctly: ', problem, '.')
+        self._shell.check()
+        if all(sink.error for sink in sinks):
+            raise sinks[0].error
+        return any(sink.name == 'MySQL' and not sink.error for sink in sinks)
+
+    def _snapshot(self, year):
+        # Write a loaded year's snapshot, reading its CSV files as a...
+        # fan-out load does, and record it in the manifest.
+        sink = self._snapshots.writer(year)
+        sink.start()
+        keys = self._keys if self._config['tasks']['Define'].get('keys') \
+            else None
+        try:
+            for table, columns, rows, replace in self._fan_out_batches(
+                    year, keys):
+                self._shell.check()
+                if rows:
+                    sink.put(table, columns, rows, replace)
+                if sink.error:
+                    break
+        except:
+            sink.abort()
+            raise
+        sink.finish()
+        if sink.error:
+            raise sink.error
+        entry = self._snapshots.add(year)
+        self._report(2, year, ' snapshot saved: ', sink.rows, ' rows, ',
+                     entry['bytes'], ' bytes.')
+
+    def _aggregate(self, year):
+        # Replace a loaded year's season totals, in one transaction.
+        sql_dir = self._config['tasks']['Define']['path']
+        statements = [self._use_statement(year)]
+        if not self._aggregates_defined:
+            statements += self._aggregates.schema()
+        statements.append('START TRANSACTION;')
+        statements += self._aggregates.refresh(year)
+        statements.append('COMMIT;')
+        file_path = os.path.join(sql_dir, year + ' aggregates.sql')
+        with closing(open(file_path, 'w')) as sql_file:
+            sql_file.write('\n\n'.join(statements) + '\n')
+        self._run_sql_file(file_path)
+        self._aggregates_defined = True
+        self._report(2, year, ' season totals refreshed.')
+
+    def _record_versions(self, years, file_name):
+        # Give years, loaded or changed, new data versions, which...
+        # QueryCache keys its results by, so results that read them...
+        # are not reused. The SQL is kept in file_name.
+        sql_dir = self._config['tasks']['Define']['path']
+        db_name = self._config['tasks']['Define']['db_name']
+        rows = ["({year}, '{version:.6f}-{bits:08x}', NOW())".format(
+            year=int(year), version=time.time(),
+            bits=random.getrandbits(32)) for year in years]
+        statements = ['USE `{db_name}`;'.format(db_name=db_name),
+                      QueryCache.versions_schema,
+                      'REPLACE INTO {table} VALUES\n  {rows};'.format(
+                          table=QueryCache.versions_table,
+                          rows=',\n  '.join(rows))]
+        file_path = os.path.join(sql_dir, file_name)
+        with closing(open(file_path, 'w')) as sql_file:
+            sql_file.write('\n\n'.join(statements) + '\n')
+        self._run_sql_file(file_path)
+
+    def _scratch_sql(self, text, scratch_name):
+        # Return SQL text with its database swapped for a scratch one.
+        db_name = re.search(r'^USE (`[^`]+`);', text, re.MULTILINE).group(1)
+        return text.replace(db_name, '`' + scratch_name + '`')
+
+    def _compare_year(self, year):
+        # Load a year under each of two load profiles, each into its...
+        # own scratch database, timing each. Alternate which goes first.
+        sql_dir = self._config['tasks']['Define']['path']
+        profiles = self._config['compare']
         if not self._schema_loaded:
-            self._sql_form = '{connect} < "{{sql_file}}"'.format(
-                connect=self._config['connect'])
-            schema_file = os.path.join(sql_dir, 'schema.sql')
-            command = self._sql_form.format(sql_file=schema_file)
-            subprocess.check_output(command, shell=True)
+            self._compare_times = dict.fromkeys(profiles, 0.0)
+            with closing(open(os.path.join(sql_dir, 'schema.sql'))) as schema:
+                schema_text = schema.read()
+            for i, profile in enumerate(profiles):
+                scratch_name = 'rcs_compare_{i}'.format(i=i)
+                file_path = os.path.join(sql_dir, scratch_name + '.sql')
+                with closing(open(file_path, 'w')) as sql_file:
+                    sql_file.write('DROP DATABASE IF EXISTS `{name}`;\n'.format(
+                        name=scratch_name))
+                    sql_file.write(self._scratch_sql(schema_text, scratch_name))
+                self._run_sql_file(file_path)
             self._schema_loaded = True
-        load_file = os.path.join(sql_dir, year + '.sql')
-        command = self._sql_form.format(sql_file=load_file)
-        subprocess.check_output(command, shell=True)
+        with closing(open(os.path.join(sql_dir, year + '.sql'))) as sql_file:
+            year_text = sql_file.read()
+        loads = re.findall(r'^LOAD DATA .*?;$', year_text,
+                           re.MULTILINE | re.DOTALL)
+        order = list(enumerate(profiles))
+        if int(year) % 2:
+            order.reverse()
+        for i, profile in order:
+            scratch_name = 'rcs_compare_{i}'.format(i=i)
+            statements = ['USE `{name}`;'.format(name=scratch_name)]
+            statements += self._profile_statements(profile, loads)
+            file_path = os.path.join(
+                sql_dir, '{year} {name}.sql'.format(year=year, name=scratch_name))
+            with closing(open(file_path, 'w')) as sql_file:
+                sql_file.write('\n\n'.join(statements))
+            start = time.time()
+            self._run_sql_file(file_path)
+            seconds = time.time() - start
+            self._compare_times[profile] += seconds
+            self._report(2, year, ' loaded with profile ', profile, ' in ',
+                         '{0:.1f}'.format(seconds), ' seconds.')
+
+    def _finish_compare(self):
+        # Report the profiles' times, check that both scratch databases...
+        # got the same rows, and drop them.
+        profiles = self._config['compare']
+        times = [self._compare_times[profile] for profile in profiles]
+        for profile, seconds in zip(profiles, times):
+            self._report(0, 'Profile ', profile, ' took ',
+                         '{0:.1f}'.format(seconds), ' seconds.')
+        fast, slow = sorted(times)
+        if fast:
+            faster = profiles[times.index(fast)]
+            self._report(0, faster, ' was ', '{0:.2f}'.format(slow / fast),
+                         ' times as fast.')
+        for table in sorted(self._config['tables']):
+            counts = [self._query(
+                'SELECT COUNT(*) FROM rcs_compare_{i}.{table}'.format(
+                    i=i, table=table))[0][0] for i in range(len(profiles))]
+            if len(set(counts)) > 1:
+                self._report(0, 'Warning: the profiles loaded different '
+                             'numbers of rows into ', table, ': ', counts)
+        for i in range(len(profiles)):
+            self._query('DROP DATABASE rcs_compare_{i}'.format(i=i))
 
     def _cleanup(self):
         os.chdir(self._original_dir)
@@ -1550,73 +6046,1222 @@ class Processer(object):
                     break
                 dir_name = os.path.dirname(dir_name)
 
-    def _reset_caller(self, time=0):
-        root = self._root
-        root.caller = root.after(time, root.stepper)
-
-    def _step(self):
-        """A generator that allows Tk to update while running.
-
-        Run each task's function for each year. Log progress. Allow Tk to
-        update the UI between steps.
-
-        Tk's updates are often behind real time and it appears unresponsive
-        for periods of time. Users are warned of that.
-
-        """
+    def _work(self):
+        # Run each task's function for each year. Log progress.
         do_tasks = [task for task in self._config['tasks'].keys()
                     if self._config['tasks'][task]['action'] == 'do']
+        self._stats = RunStats(self._stats_path,
+                               [(year, task) for year in self._config['years']
+                                for task in do_tasks])
+        self._progress_lock = threading.Lock()
+        self._progress_time = 0
+        self._mismatches = []  # [(year, [problem])], see _verify().
+        self._snapshots = (Snapshots(self._config['snapshots'])
+                           if self._config.get('snapshots') and
+                           'compare' not in self._config else None)
 
         try:
             for year in self._config['years']:
                 for task in do_tasks:
-                    
                     func = self._tasks[task]['func']
                     gerund = self._tasks[task]['gerund']
-                    try:
-                        self._reporter.report(3, 'Starting ', year, ' ',
-                                              gerund, '.')
-                    except AttributeError: pass
-                    self._reset_caller()
-                    yield
-                    
+                    self._report(3, 'Starting ', year, ' ', gerund, '.')
+                    self._stats.start(year, task)
+                    self._progress(force=True)
                     try:
                         func(year)
+                    except Cancelled:
+                        raise
                     except Exception as e:
                         raise FuncError(e, year, gerund)
-                    
-                    try:
-                        self._reporter.report(2, year, ' ', gerund,
-                                              ' complete.')
-                    except AttributeError: pass
-                    self._reset_caller()
-                    yield
+                    self._stats.finish(self._written(year, task))
+                    self._stats.save()
+                    self._progress(force=True)
+                    self._report(2, year, ' ', gerund, ' complete.')
+                self._report(1, year, ' complete.')
+            if self._mismatches:
+                self._report(0, 'Warning: ', len(self._mismatches),
+                             ' years may not have loaded correctly:')
+                for year, problems in self._mismatches:
+                    self._report(0, '    ', year, ': ', '; '.join(problems))
+            if 'compare' in self._config and 'Load' in do_tasks:
                 try:
-                    self._reporter.report(1, year, ' complete.')
-                except AttributeError: pass
-                
+                    self._finish_compare()
+                except Cancelled:
+                    raise
+                except Exception as e:
+                    raise FuncError(e, 'all years', 'comparing')
         except FuncError as e:
+            self._report(0, e.notice())
+        else:
+            self._report(2, "Starting cleanup.")
+            self._cleanup()
+            self.succeeded = True
+
+
+class Planner(object):
+    """Works out what a run would do and what it would cost, without
+    doing any of it.
+
+    run() reports, through the events queue as for Processer, each
+    year's tasks, leaving out the years a watch would find unchanged,
+    then the bytes to download, the disk the run's files would take at
+    their peak, the CPU time, and the wall time at the run's
+    parallelism. Download sizes come from HEAD requests, and the rest
+    from what RunStats recorded in earlier runs. A step no earlier run
+    can estimate is left out of the estimates, and counted.
+
+    """
+
+    _worker_counts = [2, 4, 8]  # Workers to project a coordinated run for.
+
+    def __init__(self, envir, tasks, config, events):
+        self._envir = envir
+        self._config = config
+        self._events = events
+        self._shell = Shell()
+        self.succeeded = False
+
+    def _report(self, ignorability, *args):
+        self._events.put(('report', ignorability, args))
+
+    def cancel(self):
+        """Stop planning."""
+        self._shell.cancel()
+
+    def run(self):
+        """Report the plan and its estimates."""
+        try:
+            self._plan()
+            self.succeeded = True
+        except Cancelled:
+            self._report(0, 'Planning cancelled.')
+        finally:
+            self._events.put(('done',))
+
+    def _head(self, year, conditional):
+        # Return whether a year's zip file would be downloaded, and its...
+        # size if the server gives it, asking with a HEAD request. If...
+        # conditional, an unchanged file, as a watch sees it, isn't.
+        url = self._config.get('source_url', SOURCE_URL).format(year=year)
+        download_dir = self._config['tasks']['Download']['path']
+        validators = (_read_validators(download_dir).get(year, {})
+                      if conditional else {})
+        request = _conditional_request(
+            url, os.path.join(download_dir, year + '.zip'), validators)
+        request.get_method = lambda: 'HEAD'
+        try:
+            response = urllib2.urlopen(request, timeout=60)
+        except urllib2.HTTPError as e:
+            if e.code == 304:
+                return False, None
+            raise
+        with closing(response):
+            length = response.info().getheader('Content-Length')
+        return True, int(length) if length else None
+
+    def _parallelism(self):
+        # Return how many years the run would work on at once, and how...
+        # to say so, or None for a coordinated run.
+        if self._config.get('coordinate'):
+            return None, None
+        watch = self._config.get('watch')
+        if not watch or watch['max_refreshes'] == 1:
+            return 1, 'one year at a time'
+        define = self._config['tasks'].get('Define', {})
+        targets = self._config.get('sinks', [{'kind': 'MySQL'}])
+        if define.get('keys') or [target for target in targets
+                                  if target['kind'] != 'MySQL']:
+            return 1, 'one year at a time, as keys or files are written'
+        return watch['max_refreshes'], '{0} years at once'.format(
+            watch['max_refreshes'])
+
+    def _makespan(self, seconds, workers):
+        # Return how long years taking seconds would take over workers,...
+        # each given the longest year left as it comes free.
+        loads = [0.0] * workers
+        for duration in sorted(seconds, reverse=True):
+            heapq.heapreplace(loads, loads[0] + duration)
+        return max(loads)
+
+    def _plan(self):
+        # Report the steps and estimates.
+        tasks = self._config['tasks']
+        do_tasks = [task for task in tasks if tasks[task]['action'] == 'do']
+        stats = RunStats(os.path.join(self._envir.user_dir,
+                                      RunStats.file_name), [])
+        watch = bool(self._config.get('watch'))
+        years = []
+        sizes = {}
+        skipped = []
+        for year in self._config['years']:
+            self._shell.check()
+            if 'Download' in do_tasks or watch:
+                try:
+                    changed, sizes[year] = self._head(year, watch)
+                except (urllib2.URLError, socket.error) as e:
+                    self._report(1, year, "'s size is unknown: ", e)
+                    changed, sizes[year] = True, None
+                if not changed:
+                    skipped.append(year)
+                    continue
+            years.append(year)
+        steps = [(year, task) for year in years for task in do_tasks]
+        if years:
+            self._report(0, 'The run would take ', len(steps), ' steps for ',
+                         len(years), ' year' if len(years) == 1 else ' years',
+                         ':')
+        else:
+            self._report(0, 'The run would do nothing.')
+        for year in years:
+            self._report(1, '    ', year, ': ', ', '.join(do_tasks), '.')
+        if skipped:
+            self._report(0, 'Unchanged, so left out: ', ', '.join(skipped),
+                         '.')
+        totals = {'download': 0, 'bytes': 0, 'cpu': 0}
+        unknown = set()
+        year_seconds = collections.OrderedDict(
+            (year, 0.0) for year in years)
+        for year, task in steps:
+            costs = {key: stats.estimate(year, task, key)
+                     for key in ('seconds', 'cpu', 'bytes')}
+            if task == 'Download':
+                costs['bytes'] = (sizes.get(year) or
+                                  stats.estimate(year, task, 'work'))
+                totals['download'] += costs['bytes'] or 0
+            for key in ('bytes', 'cpu'):
+                totals[key] += costs[key] or 0
+            year_seconds[year] += costs['seconds'] or 0
+            if None in costs.values():
+                unknown.add((year, task))
+        self._report(0, 'Estimated download: ', '{0:,.1f} MB'.format(
+            totals['download'] / 1e6), '.')
+        self._report(0, 'Estimated disk at peak: ', '{0:,.1f} MB'.format(
+            totals['bytes'] / 1e6), ', as files are kept until the run '
+                     'ends.')
+        self._report(0, 'Estimated CPU time: ', _duration(totals['cpu']),
+                     '.')
+        workers, how = self._parallelism()
+        if workers:
+            self._report(0, 'Estimated wall time: ', _duration(
+                self._makespan(year_seconds.values(), workers)), ', ', how,
+                         '.')
+        else:
+            self._report(0, 'Estimated wall time: ', '; '.join(
+                '{0} with {1} workers'.format(_duration(self._makespan(
+                    year_seconds.values(), count)), count)
+                for count in self._worker_counts), '.')
+        if unknown:
+            self._report(0, 'No earlier run tells what ', len(unknown),
+                         ' of the steps will cost, so the estimates leave '
+                         'out what is unknown.')
+        self._report(1, 'Nothing was run.')
+
+
+class Watcher(object):
+    """Keeps the chosen years current, redoing only those whose zip
+    files have changed.
+
+    Every interval seconds, plus up to jitter more, each year's zip file
+    is requested with the ETag and Last-Modified it was last downloaded
+    with, so an unchanged year costs a 304 response. Each changed year
+    is then taken through the rest of the chosen tasks by a headless
+    child process (see main()), at most max_refreshes at once. Each
+    refresh is recorded as a line of JSON in 'refresh log.jsonl' in the
+    Download folder, and the settings are saved there as 'watch.json'.
+
+    run() and cancel() are as for Processer.
+
+    """
+
+    def __init__(self, envir, tasks, config, events):
+        self._config = config
+        self._events = events
+        self._shell = Shell()
+        self._lock = threading.Lock()  # Guards the validators and log.
+        self._dir = config['tasks']['Download']['path']
+
+    def _report(self, ignorability, *args):
+        self._events.put(('report', ignorability, args))
+
+    def cancel(self):
+        """Stop watching, killing any refreshes in flight."""
+        self._shell.cancel()
+
+    def run(self):
+        """Check, and refresh, the years until cancelled."""
+        try:
+            self._watch()
+        except Cancelled:
+            self._report(0, 'Stopped watching.')
+        finally:
+            self._events.put(('done',))
+
+    def _watch(self):
+        # Check every year, refresh those that changed, wait, repeat.
+        if not os.path.exists(self._dir):
+            os.makedirs(self._dir)
+        watch = self._config['watch']
+        _save_config(self._config, os.path.join(self._dir, 'watch.json'))
+        limit = watch['max_refreshes']
+        define = self._config['tasks'].get('Define', {})
+        targets = self._config.get('sinks', [{'kind': 'MySQL'}])
+        if limit > 1 and (define.get('keys') or
+                          [t for t in targets if t['kind'] != 'MySQL']):
+            self._report(1, 'Refreshing one year at a time, as the key or '
+                         'target files take one writer at a time.')
+            limit = 1
+        self._report(1, 'Watching ', len(self._config['years']), ' years.')
+        while True:
+            changed = {}
+            for year in self._config['years']:
+                try:
+                    validators = self._check(year)
+                except Cancelled:
+                    raise
+                except Exception as e:
+                    self._report(0, year, ' not checked: ', e)
+                    continue
+                if validators is not None:
+                    changed[year] = validators
+            if changed:
+                self._refresh(changed, limit)
+            else:
+                self._report(2, 'No years have changed.')
+            wait = watch['interval'] + random.uniform(0, watch['jitter'])
+            self._report(3, 'Checking again in ', int(wait), ' seconds.')
+            self._shell.wait(wait)
+
+    def _check(self, year):
+        # Download a year's zip file if it has changed, returning its...
+        # new validators, or return None if it hasn't.
+        url = self._config.get('source_url', SOURCE_URL).format(year=year)
+        path = os.path.join(self._dir, year + '.zip')
+        with self._lock:
+            old = _read_validators(self._dir).get(year, {})
+        request = _conditional_request(url, path, old)
+        try:
+            response = urllib2.urlopen(request, timeout=60)
+        except urllib2.HTTPError as e:
+            if e.code == 304:
+                self._report(3, year, ' is unchanged.')
+                return None
+            raise
+        self._report(1, year, ' has changed.')
+        return _save_response(response, path, self._shell)
+
+    def _refresh(self, changed, limit):
+        # Refresh the changed years, at most limit at a time.
+        pending = Queue.Queue()
+        for year in sorted(changed):
+            pending.put((year, changed[year]))
+        threads = [threading.Thread(target=self._refresh_from,
+                                    args=(pending,))
+                   for i in range(min(limit, len(changed)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(1)
+        self._shell.check()
+
+    def _refresh_from(self, pending):
+        # Refresh years from pending until none are left.
+        while True:
+            try:
+                year, validators = pending.get_nowait()
+            except Queue.Empty:
+                return
             try:
-                self._reporter.report(0, e.notice())
-            except AttributeError:
-                self._reporter = Reporter(self._root, self._root, 0)
-                self._reporter.report(0, e.notice())
+                self._refresh_year(year, validators)
+            except Cancelled:
+                return
+
+    def _refresh_year(self, year, validators):
+        # Run the chosen tasks after downloading for one year, in a...
+        # child process. Only once that works are the new validators...
+        # kept, so a failed year is tried again at the next check.
+        config = self._child_config(year)
+        config_path = os.path.join(self._dir, 'watch {year}.json'.format(
+            year=year))
+        _save_config(config, config_path)
+        command = '"{python}" "{script}" --run "{config}"'.format(
+            python=sys.executable, script=os.path.abspath(__file__),
+            config=config_path)
+        started = time.time()
+        last_lines = collections.deque(maxlen=3)  # Why, if it fails.
+        try:
+            for line in self._shell.lines(command):
+                self._report(2, year, ':  ', line.rstrip())
+                last_lines.append(line.rstrip())
+        except subprocess.CalledProcessError:
+            result = 'failed'
+        else:
+            result = 'refreshed'
+        seconds = time.time() - started
+        entry = {'year': year, 'result': result,
+                 'seconds': round(seconds, 1),
+                 'time': datetime.datetime.now().isoformat(' ')[:19]}
+        entry.update(validators)
+        with self._lock:
+            if result == 'refreshed':
+                all_validators = _read_validators(self._dir)
+                all_validators[year] = validators
+                _write_validators(self._dir, all_validators)
+            log_path = os.path.join(self._dir, 'refresh log.jsonl')
+            with closing(open(log_path, 'a')) as log_file:
+                log_file.write(json.dumps(entry, sort_keys=True) + '\n')
+        if result == 'failed':
+            self._report(0, year, ' failed:\n', '\n'.join(last_lines))
         else:
+            self._report(1, year, ' refreshed in {0:.0f} seconds.'.format(
+                seconds))
+
+    def _child_config(self, year):
+        # Return the config for refreshing one downloaded year.
+        config = _year_config(self._config, year, 'watch')
+        config['tasks']['Download']['action'] = 'access files'
+        return config
+
+
+class Coordinator(object):
+    """Hands the chosen years out to Workers, which may be on other
+    machines, and keeps track of them until every year is done.
+
+    Each year is a unit of work, carrying the config for all of its
+    chosen tasks, as those tasks share files. Workers talk to the
+    Coordinator with JSON over HTTP, posting to:
+    /lease  to be given a year, or told to wait (204) or that all the
+            years are settled (410);
+    /renew  now and then while working, to keep the lease;
+    /finish with whether the year succeeded, and its last reports.
+    A year whose Worker fails, or lets its lease lapse by vanishing, is
+    handed out again, up to retries more times. Late news about a year
+    whose lease has lapsed is refused (409).
+
+    The config's coordinate setting holds the host to serve on, the
+    port, the lease in seconds, the retries and the token Workers must
+    send. If the token is blank, one is made up and reported. The years'
+    configs leave out the connect string, which would carry the
+    coordinator's password, the Chadwick folder and the snapshots
+    folder, as they are of this machine; each Worker brings its own.
+    run() and
+    cancel() are as for Processer, and succeeded is True once run() has
+    seen every year done.
+
+    """
+
+    _defaults = {'host': 'localhost', 'port': 8390, 'lease': 120,
+                 'retries': 2, 'token': ''}
+    _linger = 15  # Seconds to keep telling Workers there's no more work.
+
+    def __init__(self, envir, tasks, config, events):
+        self._config = config
+        self._events = events
+        self._shell = Shell()
+        self._settings = dict(self._defaults, **config.get('coordinate', {}))
+        self._token = (self._settings['token'] or
+                       binascii.hexlify(os.urandom(16)))
+        self._lock = threading.Lock()  # Guards _units.
+        self._units = collections.OrderedDict(
+            (year, {'state': 'pending', 'worker': None, 'expires': 0,
+                    'tries': 0})
+            for year in config['years'])
+        self.succeeded = False
+
+    def _report(self, ignorability, *args):
+        self._events.put(('report', ignorability, args))
+
+    def cancel(self):
+        """Stop handing out years. Workers finish what they have."""
+        self._shell.cancel()
+
+    def run(self):
+        """Serve Workers until every year is done or given up on."""
+        server = None
+        try:
+            server = _CoordinatorServer(
+                (self._settings['host'], self._settings['port']),
+                _CoordinatorHandler)
+            server.coordinator = self
+            thread = threading.Thread(target=server.serve_forever)
+            thread.daemon = True
+            thread.start()
+            self._report(1, 'Handing out ', len(self._units), ' years on ',
+                         self._settings['host'], ':', self._settings['port'],
+                         '.')
+            if not self._settings['token']:
+                self._report(1, 'Workers must send the token ', self._token,
+                             '.')
+            while not self._settled():
+                self._shell.wait(1)
+                with self._lock:
+                    self._expire()
+            done = [year for year, unit in self._units.items()
+                    if unit['state'] == 'done']
+            self.succeeded = len(done) == len(self._units)
+            self._report(1, len(done), ' of ', len(self._units),
+                         ' years done.')
             try:
-                self._reporter.report(2, "Starting cleanup.")
-            except AttributeError: pass
-            self._reset_caller()
-            yield
-            self._cleanup()
+                self._shell.wait(self._linger)
+            except Cancelled: pass
+        except Cancelled:
+            self._report(0, 'Stopped handing out years.')
+        except socket.error as e:
+            self._report(0, 'Can\'t serve workers:  ', e)
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+            self._events.put(('done',))
+
+    def _settled(self):
+        with self._lock:
+            return all(unit['state'] in ('done', 'failed')
+                       for unit in self._units.values())
+
+    def _expire(self):
+        # Take back years whose leases have lapsed. _lock must be held.
+        now = time.time()
+        for year, unit in self._units.items():
+            if unit['state'] == 'leased' and unit['expires'] < now:
+                self._retry(year, unit, unit['worker'] + ' stopped renewing.')
+
+    def _retry(self, year, unit, why):
+        # Hand a year out again, unless it's out of tries.
+        unit['tries'] += 1
+        unit['worker'] = None
+        if unit['tries'] > self._settings['retries']:
+            unit['state'] = 'failed'
+            self._report(0, year, ' given up:  ', why)
+        else:
+            unit['state'] = 'pending'
+            self._report(1, year, ' will be tried again:  ', why)
+
+    def admits(self, token):
+        """Return whether a Worker's token is the one set."""
+        return hmac.compare_digest(str(token or ''), self._token)
+
+    def _held(self, worker, year):
+        # Return the unit for year if worker holds its lease, else None.
+        unit = self._units.get(year)
+        if unit and unit['state'] == 'leased' and unit['worker'] == worker:
+            return unit
+        return None
+
+    def lease(self, worker):
+        """Return (HTTP status, reply) for a Worker asking for work."""
+        with self._lock:
+            self._expire()
+            for year, unit in self._units.items():
+                if unit['state'] == 'pending':
+                    unit.update(state='leased', worker=worker,
+                                expires=time.time() + self._settings['lease'])
+                    self._report(1, year, ' handed to ', worker, '.')
+                    config = _year_config(self._config, year, 'coordinate')
+                    # Workers bring their own client, Chadwick and...
+                    # snapshots folder.
+                    if 'connect' in config:
+                        config['connect'] = None
+                    if 'Chadwick' in config:
+                        config['Chadwick']['path'] = None
+                    if config.get('snapshots'):
+                        config['snapshots'] = None
+                    return 200, {'year': year, 'config': _config_json(config),
+                                 'lease': self._settings['lease']}
+            if all(unit['state'] in ('done', 'failed')
+                   for unit in self._units.values()):
+                return 410, None
+            return 204, None
+
+    def renew(self, worker, year):
+        """Return (HTTP status, reply) for a Worker keeping its lease."""
+        with self._lock:
+            unit = self._held(worker, year)
+            if unit is None:
+                return 409, None
+            unit['expires'] = time.time() + self._settings['lease']
+            return 200, {}
+
+    def finish(self, worker, year, succeeded, output):
+        """Return (HTTP status, reply) for a Worker done with a year."""
+        with self._lock:
+            unit = self._held(worker, year)
+            if unit is None:
+                return 409, None
+            if succeeded:
+                unit['state'] = 'done'
+                self._report(1, year, ' done by ', worker, '.')
+            else:
+                self._retry(year, unit, 'failed on ' + worker + ':\n' +
+                            '\n'.join(output))
+            return 200, {}
+
+
+class _CoordinatorServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _CoordinatorHandler(BHRH):
+    # Passes Workers' posts to the server's Coordinator, if they carry...
+    # its token.
+
+    def do_POST(self):
+        coordinator = self.server.coordinator
+        try:
+            length = int(self.headers.getheader('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length))
+            worker = body['worker']
+            if not coordinator.admits(self.headers.getheader('X-Rcs-Token')):
+                status, reply = 403, None
+            elif self.path == '/lease':
+                status, reply = coordinator.lease(worker)
+            elif self.path == '/renew':
+                status, reply = coordinator.renew(worker, body['year'])
+            elif self.path == '/finish':
+                status, reply = coordinator.finish(
+                    worker, body['year'], body['succeeded'], body['output'])
+            else:
+                status, reply = 404, None
+        except (ValueError, KeyError, TypeError):
+            status, reply = 400, None
+        text = '' if reply is None else json.dumps(reply)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(text)))
+        self.end_headers()
+        self.wfile.write(text)
+
+    def log_message(self, *args): pass
+
+
+class Worker(object):
+    """Does years handed out by a Coordinator, one at a time, until
+    there are none left.
+
+    Each year is done by a Processer in this process, loading straight
+    into the targets its config names, while the lease is renewed. If
+    the lease is lost, the year is cancelled, as the Coordinator has
+    handed it to another Worker. Several Workers may run on one machine.
+
+    The config, read by --work from a JSON file, holds the
+    coordinator's URL, such as http://host:8390, and its token, and,
+    optionally, the log_level, a folder to keep the task folders in
+    instead of the paths the Coordinator's config gives, the chadwick
+    folder holding this machine's Chadwick programs, where years are
+    assembled, the snapshots folder, where they're snapshotted, if not
+    Snapshots in that folder, and the connect string, such as "mysql"
+    --defaults-extra-file="my.cnf", of the SQL client used to load,
+    where years are loaded into the SQL server. run() and cancel() are
+    as for Processer.
+
+    """
+
+    _poll_seconds = 5  # Wait between asking for work when there's none.
+    _attempts = 5  # Tries to reach the Coordinator before giving up.
+
+    def __init__(self, envir, tasks, config, events):
+        self._envir = envir
+        self._url = config['coordinator'].rstrip('/')
+        self._token = config['token']
+        self._folder = config.get('folder')
+        self._connect = config.get('connect')
+        self._chadwick = (os.path.join(config['chadwick'], '')
+                          if config.get('chadwick') else None)
+        self._snapshots = config.get('snapshots') or (
+            os.path.join(self._folder, 'Snapshots', '') if self._folder
+            else None)
+        self._events = events
+        self._shell = Shell()
+        self._name = '{host}-{pid}'.format(host=platform.node(),
+                                           pid=os.getpid())
+        self._failed = False  # Whether any year done here failed.
+        self.succeeded = False
+
+    def _report(self, ignorability, *args):
+        self._events.put(('report', ignorability, args))
+
+    def cancel(self):
+        """Stop, cancelling the year being done."""
+        self._shell.cancel()
+
+    def run(self):
+        """Ask for years and do them until there are none left."""
+        try:
+            while True:
+                unit = self._call('lease', {})
+                if unit is None:
+                    self._report(1, 'No more years to do.')
+                    self.succeeded = not self._failed
+                    return
+                if not unit:
+                    self._shell.wait(self._poll_seconds)
+                    continue
+                self._do(unit)
+        except Cancelled:
+            self._report(0, 'Worker stopped.')
+        except (urllib2.URLError, socket.error) as e:
+            self._report(0, 'Can\'t reach the coordinator:  ',
+                         getattr(e, 'reason', e))
+        finally:
+            self._events.put(('done',))
+
+    def _do(self, unit):
+        # Do one leased year, renewing the lease, then say how it went.
+        year = unit['year']
+        config = _config_from_json(unit['config'])
+        # The Coordinator sends None for what's only right on its machine.
+        if 'connect' in config:
+            config['connect'] = self._connect
+        if 'Chadwick' in config:
+            config['Chadwick']['path'] = self._chadwick
+        if 'snapshots' in config and config['snapshots'] is None:
+            config['snapshots'] = self._snapshots
+        missing = [key for key, value in [
+            ('connect', config.get('connect', '')),
+            ('chadwick', config.get('Chadwick', {}).get('path', '')),
+            ('snapshots', config.get('snapshots', ''))]
+            if value is None]
+        if missing:
+            why = 'No {keys} setting for this worker.'.format(
+                keys=' or '.join(missing))
+            self._report(0, year, ':  ', why)
+            self._failed = True
+            self._call('finish', {'year': year, 'succeeded': False,
+                                  'output': [why]})
+            return
+        if self._folder:
+            for name, dic in config['tasks'].items():
+                if 'path' in dic:
+                    dic['path'] = os.path.join(self._folder, name, '')
+        events = Queue.Queue()
+        processer = Processer(self._envir, _make_tasks(), config, events)
+        thread = threading.Thread(target=processer.run)
+        thread.daemon = True
+        thread.start()
+        last_lines = collections.deque(maxlen=3)
+        renew_at = time.time() + unit['lease'] / 3.0
+        lost = False
+        done = False
+        while not done:
+            try:
+                event = events.get(timeout=1)
+            except Queue.Empty:
+                event = (None,)
+            if event[0] == 'done':
+                done = True
+            elif event[0] == 'report':
+                self._report(event[1], year, ':  ', *event[2])
+                if event[1] == 0:
+                    last_lines.append(''.join(map(unicode, event[2])))
+            if self._shell.cancelled():
+                processer.cancel()
+            elif not lost and time.time() >= renew_at:
+                renew_at = time.time() + unit['lease'] / 3.0
+                if self._call('renew', {'year': year}) is None:
+                    self._report(0, year, ' was handed to another worker.')
+                    lost = True
+                    processer.cancel()
+        self._shell.check()
+        self._failed = self._failed or not processer.succeeded
+        if not lost:
+            self._call('finish', {'year': year,
+                                  'succeeded': processer.succeeded,
+                                  'output': list(last_lines)})
+
+    def _call(self, action, body):
+        # Post to the Coordinator. Return its reply, {} if it had none,...
+        # or None if it refused (409) or has no more work (410).
+        body = dict(body, worker=self._name)
+        request = urllib2.Request(self._url + '/' + action, json.dumps(body),
+                                  {'Content-Type': 'application/json',
+                                   'X-Rcs-Token': self._token})
+        for attempt in range(1, self._attempts + 1):
+            try:
+                response = urllib2.urlopen(request, timeout=30)
+            except urllib2.HTTPError as e:
+                if e.code in (409, 410):
+                    return None
+                raise
+            except (urllib2.URLError, socket.error) as e:
+                if attempt == self._attempts:
+                    raise
+                self._report(1, 'The coordinator isn\'t answering:  ',
+                             getattr(e, 'reason', e))
+                self._shell.wait(self._poll_seconds)
+                continue
+            with closing(response):
+                text = response.read()
+            if not text:
+                return {}
+            return json.loads(text, object_pairs_hook=collections.OrderedDict)
+
+
+class Monitor(object):
+    """Shows the progress of a Processer that works in another thread.
+
+    start() starts the worker thread and then polls its events queue
+    from the Tk loop, so the window stays responsive however long a
+    task takes. Each task gets a progress bar, with its throughput, and
+    the run's time left is shown below them. The Cancel button and the
+    window's close box both cancel the run.
+
+    """
+
+    _poll_ms = 100
+    _unit_forms = {'bytes': ('{0:.1f}', 1e6, ' MB'),
+                   'files': ('{0:,.0f}', 1, ' files'),
+                   'rows': ('{0:,.0f}', 1, ' rows')}
+
+    def __init__(self, root, noisiness, processer, events):
+        self._root = root
+        self._noisiness = noisiness
+        self._processer = processer
+        self._events = events
+        self._window = ttk.Frame(root)
+        self._window.grid(sticky='news')
+        self._window.columnconfigure(0, weight=1)
+        self._window.rowconfigure(0, weight=1)
+        root.columnconfigure(0, weight=1)
+        root.rowconfigure(0, weight=1)
+        root.geometry('+80+3')
+        if noisiness:
+            self._reporter = Reporter(self._window, root, noisiness)
+        self._cancel_button = ttk.Button(self._window, text='Cancel',
+                                         command=self._cancel)
+        self._cancel_button.grid(row=999, padx=3, pady=3)
+        root.protocol('WM_DELETE_WINDOW', self._close)
+
+    def start(self):
+        """Start the Processer's thread and begin polling its events."""
+        worker = threading.Thread(target=self._processer.run)
+        worker.daemon = True  # Don't outlive a closed window.
+        worker.start()
+        self._root.after(self._poll_ms, self._poll)
+
+    def _report(self, ignorability, *args):
+        # Report, making a silent Reporter if an error must be shown.
+        try:
+            self._reporter.report(ignorability, *args)
+        except AttributeError:
+            if ignorability:
+                return
+            self._reporter = Reporter(self._window, self._root, 0)
+            self._reporter.report(ignorability, *args)
+
+    def _poll(self):
+        # Handle every event the worker has queued, then poll again.
+        while True:
+            try:
+                event = self._events.get_nowait()
+            except Queue.Empty:
+                break
+            if event[0] == 'report':
+                self._report(event[1], *event[2])
+            elif event[0] == 'progress':
+                self._show_progress(event[1])
+            elif event[0] == 'done':
+                return self._finish()
+        self._root.after(self._poll_ms, self._poll)
+
+    def _amount(self, value, unit):
+        # Format an amount of work, such as '12.3 MB' or '1,024 rows'.
+        form, scale, suffix = self._unit_forms[unit]
+        return form.format(value / scale) + suffix
+
+    def _show_progress(self, snapshot):
+        # Update the task's progress bar and the run's time left.
+        if not hasattr(self, '_bars'):
+            self._root.deiconify()
+            self._bars = {}
+            self._progress_frame = ttk.Frame(self._window)
+            self._progress_frame.grid(row=1, padx=3, sticky='ew')
+            self._progress_frame.columnconfigure(1, weight=1)
+            self._eta_label = ttk.Label(self._progress_frame)
+            self._eta_label.grid(row=999, columnspan=2, sticky='w')
+        task = snapshot['task']
+        if task not in self._bars:
+            label = ttk.Label(self._progress_frame, width=50)
+            label.grid(row=len(self._bars), column=0, padx=(0, 6),
+                       sticky='w')
+            bar = ttk.Progressbar(self._progress_frame, length=300,
+                                  maximum=1000)
+            bar.grid(row=len(self._bars), column=1, pady=1, sticky='ew')
+            self._bars[task] = label, bar
+        label, bar = self._bars[task]
+        text = '{year} {task}'.format(**snapshot)
+        unit = snapshot['unit']
+        if unit:
+            text += ': ' + self._amount(snapshot['done'], unit)
+            if snapshot['total'] and snapshot['fraction'] < 1:
+                text += ' of ' + self._amount(snapshot['total'], unit)
+            if snapshot['rate'] and snapshot['fraction'] < 1:
+                text += ', ' + self._amount(snapshot['rate'], unit) + '/s'
+        label.config(text=text)
+        if snapshot['fraction'] is None:
+            bar.config(mode='indeterminate')
+            bar.step(20)
+        else:
+            bar.config(mode='determinate',
+                       value=int(snapshot['fraction'] * 1000))
+        if snapshot['eta'] is None:
+            self._eta_label.config(text='Estimating the time left.')
+        else:
+            self._eta_label.config(text='{0:.0%} done, about {1} left.'.format(
+                snapshot['overall'] or 0, _duration(snapshot['eta'])))
 
+    def _finish(self):
         # Either finish or tell user to.
+        self._cancel_button.config(state='disabled')
         try:
             self._reporter.report(0, "Close this window to exit.")
         except AttributeError:
-            self._root.destroy()  # Destroy tkinter.
-        # Even though tkinter is destroyed, Python root variable exists.
-        # And therefore root.caller may be yielded to.
-        yield
+            self._root.destroy()
+
+    def _cancel(self):
+        self._cancel_button.config(state='disabled')
+        self._report(1, 'Cancelling.')
+        self._processer.cancel()
+
+    def _close(self):
+        self._processer.cancel()
+        self._root.destroy()
+
+
+def read_batches(chadwick_path, year, table_name, event_path='.',
+                 batch_size=1000, columns=None):
+    """Generate one year's rows of one table, batch_size rows at a time.
+
+    chadwick_path is the folder holding the Chadwick tools.
+    year is the year (season) to read.
+    table_name is 'events', 'subs' or 'games'.
+    event_path is the folder holding the unzipped Retrosheet files.
+    columns, if given, lists the only Chadwick fields to read, although
+    fields needed to compute others are read too.
+
+    Each batch is a list of namedtuples, typed as described for
+    Table.typed_batch(). Rows are parsed as Chadwick writes them, so a
+    whole season is never held in memory.
+
+    """
+    if table_name not in ('events', 'subs', 'games'):
+        raise ValueError('No such table: ' + str(table_name))
+    paths = {'Chadwick': os.path.join(chadwick_path, ''), 'Assemble': ''}
+    table = Table(table_name, Environment(), paths, Shell())
+    table.parse_description()
+    if columns:
+        table.select_columns(columns)
+    for batch in table.stream_year(str(year), batch_size, event_path):
+        yield batch
+
+
+def read_rows(chadwick_path, year, table_name, event_path='.',
+              batch_size=1000, columns=None):
+    """Generate one year's rows of one table, one row at a time.
+
+    The arguments are those of read_batches().
+
+    """
+    for batch in read_batches(chadwick_path, year, table_name, event_path,
+                              batch_size, columns):
+        for row in batch:
+            yield row
+
+
+def read_chunks(connect, db_name, table_name, years=None, columns=None,
+                chunk_size=10000, frame=True, keyed=False):
+    """Generate a loaded table's rows, chunk_size rows at a time, as
+    compactly typed pandas DataFrames or NumPy record arrays.
+
+    connect is the command that starts the MySQL client, such as
+    'mysql --user=me', and db_name is the database the table is in.
+    table_name is 'events', 'subs' or 'games'.
+    years, if given, are the only years (seasons) to read.
+    columns, if given, lists the only columns to read.
+    frame is whether to make DataFrames (pandas required) rather than
+    record arrays (NumPy required).
+    keyed is whether the table was loaded with player and team keys.
+
+    Chunks are typed from the generated schema, as described for
+    Table.typed_arrays(), except that DataFrames make IDs categorical.
+    The client is run with --quick, so the server hands rows over as
+    they are read rather than the client holding the whole result, and
+    only one chunk is held in memory at a time.
+
+    """
+    if table_name not in ('events', 'subs', 'games'):
+        raise ValueError('No such table: ' + str(table_name))
+    numpy, pandas = _import_numpy(), _import_pandas()
+    if numpy is None or (frame and pandas is None):
+        raise ImportError('read_chunks() requires ' +
+                          ('pandas' if frame else 'NumPy'))
+    for name in [db_name] + list(columns or []):
+        if not re.match(r'\w+$', name):
+            raise ValueError('Not a name: ' + str(name))
+    table = Table(table_name, Environment(), shell=Shell())
+    if keyed:
+        table.use_keys()
+    sql = 'SELECT {columns} FROM {table}'.format(
+        columns=', '.join(columns) if columns else '*', table=table_name)
+    if years:
+        sql += ' WHERE year_ct IN ({years})'.format(
+            years=', '.join(str(int(year)) for year in years))
+    command = '{connect} --quick -B -D {db} -e "{sql}"'.format(
+        connect=connect, db=db_name, sql=sql)
+    lines = (line.rstrip('\n').split('\t')
+             for line in table._shell.lines(command))
+    try:
+        names = lines.next()
+    except StopIteration:
+        return
+    for rows in _batches(lines, chunk_size):
+        records = table.typed_arrays(names, rows, numpy)
+        if not frame:
+            yield records
+            continue
+        chunk = pandas.DataFrame.from_records(records)
+        for name in records.dtype.names:
+            if records.dtype[name].kind == 'S':
+                chunk[name] = chunk[name].astype('category')
+        yield chunk
+
+
+def _normalize_sql(sql):
+    # Return SQL text with comments dropped, runs of white space made...
+    # one space and trailing semicolons dropped, all outside quotes. As...
+    # in MySQL, -- starts a comment only if white space follows, so...
+    # 5--3 is arithmetic.
+    def replace(match):
+        return match.group(1) or ' '
+    text = re.sub(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|`[^`]*`)"""
+                  r'|(?:\s+|/\*.*?\*/|--(?=[ \t\r\n]|$)[^\n]*|#[^\n]*)+',
+                  replace, sql, flags=re.DOTALL)
+    return text.strip().rstrip(';').strip()
+
+
+class QueryCache(object):
+    """Keeps the results of queries of a loaded database on disk, so
+    asking the same question again costs a file read, not a table scan.
+
+    connect is the command that starts the MySQL client, such as
+    'mysql --user=me', and db_name is the database to query. path is
+    the folder the results are kept in, and max_bytes the most they
+    may take up; the least recently used are removed to make room.
+
+    query() returns (column names, rows), each row a tuple of strings,
+    None for NULL. A result is found by the query's text, normalized,
+    and the data version of each year (season) it reads, as recorded
+    in the rcs_versions table each time a year is loaded. Reloading a
+    year, or a migration giving its rows new fields, gives it a new
+    version, so results that read it are no longer found, and, no
+    longer used, are the first to be removed. Results
+    of other years are still found. Until a year has been loaded with
+    its version recorded, there is no versions table, and queries are
+    run but not kept.
+
+    hits, misses and bypassed count the queries answered from the
+    cache, run and kept, and run but not kept; evicted counts results
+    removed. stats() returns them, with the results kept and their size.
+
+    """
+
+    versions_table = 'rcs_versions'
+    versions_schema = (
+        'CREATE TABLE IF NOT EXISTS rcs_versions (\n'
+        '  year_ct MEDIUMINT UNSIGNED PRIMARY KEY COMMENT "year",\n'
+        '  version_tx VARCHAR(40) NOT NULL COMMENT "data version",\n'
+        '  loaded_dt DATETIME NOT NULL COMMENT "time loaded");')
+    _suffix = '.result'
+
+    def __init__(self, connect, db_name, path=None, max_bytes=256 << 20):
+        if not re.match(r'\w+$', db_name):
+            raise ValueError('Not a name: ' + str(db_name))
+        self._connect = connect
+        self._db_name = db_name
+        self.path = path or os.path.join(os.path.expanduser('~'),
+                                         '.retrochadsql-cache')
+        self.max_bytes = max_bytes
+        self._shell = Shell()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.bypassed = self.evicted = 0
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+    def query(self, sql, years=None):
+        """Return the (column names, rows) that sql selects. years, if
+        given, are the only years it reads; otherwise it depends on
+        every year loaded.
+
+        """
+        versions = self._versions()
+        if versions is None:
+            with self._lock:
+                self.bypassed += 1
+            return self._run(sql)
+        if years is not None:
+            versions = dict((str(int(year)), versions.get(str(int(year))))
+                            for year in years)
+        text = _normalize_sql(sql)
+        key = hashlib.sha1('\0'.join(
+            [self._db_name, text, json.dumps(sorted(versions.items()))])
+        ).hexdigest()
+        path = os.path.join(self.path, key + self._suffix)
+        try:
+            with closing(open(path, 'rb')) as result_file:
+                result = cPickle.load(result_file)
+            os.utime(path, None)  # Marks it recently used.
+        except (IOError, OSError, EOFError, cPickle.UnpicklingError):
+            pass
+        else:
+            with self._lock:
+                self.hits += 1
+            return result
+        result = self._run(sql)
+        temp_path = '{path}.{pid}.{thread}.part'.format(
+            path=path, pid=os.getpid(),
+            thread=threading.current_thread().ident)
+        with closing(open(temp_path, 'wb')) as result_file:
+            cPickle.dump(result, result_file, cPickle.HIGHEST_PROTOCOL)
+        _replace_file(temp_path, path)
+        with self._lock:
+            self.misses += 1
+        self._evict()
+        return result
+
+    def stats(self):
+        """Return a dict of the counts described above, with entries,
+        the results kept, and bytes, their total size.
+
+        """
+        entries = self._entries()
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'bypassed': self.bypassed, 'evicted': self.evicted,
+                    'entries': len(entries),
+                    'bytes': sum(size for t, size, p in entries)}
+
+    def clear(self):
+        """Remove every result kept."""
+        for mtime, size, path in self._entries():
+            try:
+                os.remove(path)
+            except OSError: pass
+
+    def _command(self, *options):
+        return '{connect} {options} -B -D {db}'.format(
+            connect=self._connect, options=' '.join(options),
+            db=self._db_name)
+
+    def _versions(self):
+        # Return {year: data version}, or None if there is no versions...
+        # table to read.
+        try:
+            output = self._shell.check_output(
+                self._command('-N') + ' -e "SELECT year_ct, version_tx '
+                'FROM {table}"'.format(table=self.versions_table),
+                stderr=subprocess.PIPE)
+        except subprocess.CalledProcessError:
+            return None
+        return dict(line.split('\t')[:2] for line in output.splitlines()
+                    if '\t' in line)
+
+    def _run(self, sql):
+        # Run sql through the client, given on standard input so it...
+        # needs no quoting, and return its (column names, rows).
+        with closing(tempfile.TemporaryFile()) as sql_file:
+            sql_file.write(sql)
+            sql_file.seek(0)
+            lines = [line.rstrip('\n').split('\t') for line in
+                     self._shell.lines(self._command('--quick'),
+                                       stdin=sql_file)]
+        if not lines:
+            return [], []
+        return lines[0], [
+            tuple(None if value == 'NULL' else _batch_text(value)
+                  for value in line) for line in lines[1:]]
+
+    def _entries(self):
+        # Return (time last used, size, path) for each result kept.
+        entries = []
+        for path in glob.glob(os.path.join(self.path, '*' + self._suffix)):
+            try:
+                status = os.stat(path)
+            except OSError:
+                continue  # Removed by another process.
+            entries.append((status.st_mtime, status.st_size, path))
+        return entries
+
+    def _evict(self):
+        # Remove the least recently used results until those left fit...
+        # in max_bytes.
+        entries = sorted(self._entries())
+        total = sum(size for t, size, p in entries)
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self.evicted += 1
+
+
+def _make_tasks():
+    # Return the Tasks, in order, with the gerunds reports use.
+    tasks = Tasks([(name, {'name': name})
+        for name in ['Download', 'Unzip', 'Assemble', 'Define', 'Load']])
+    tasks.set_attr(
+        'gerund',
+        ['downloading', 'unzipping', 'assembling', 'defining', 'loading'])
+    return tasks
+
+
+def _run_headless(kind, config):
+    # Run a kind of worker, such as Processer, without Tk, writing...
+    # reports to standard output. Return the exit status: 1 if a run...
+    # didn't succeed.
+    events = Queue.Queue()
+    worker = kind(Environment(), _make_tasks(), config, events)
+    thread = threading.Thread(target=worker.run)
+    thread.daemon = True
+    thread.start()
+    while True:
+        try:
+            event = events.get(timeout=1)  # Lets Ctrl-C through.
+        except Queue.Empty:
+            continue
+        except KeyboardInterrupt:
+            worker.cancel()
+            continue
+        if event[0] == 'done':
+            return 0 if getattr(worker, 'succeeded', True) else 1
+        if event[0] == 'report' and event[1] <= config['log_level']:
+            sys.stdout.write(''.join(
+                arg if isinstance(arg, basestring) else str(arg)
+                for arg in event[2]) + '\n')
+            sys.stdout.flush()
+
+
+def _restore(folder, path):
+    # Restore every snapshot in folder into the SQLite database at...
+    # path, writing what was done to standard output. Return the exit...
+    # status: 1 if the snapshots weren't as recorded.
+    start = time.time()
+    try:
+        restored = Snapshots(folder).restore(path)
+    except ValueError as e:
+        sys.stderr.write(str(e) + '\n')
+        return 1
+    for year in sorted(restored):
+        sys.stdout.write('{0} restored: {1} rows.\n'.format(
+            year, restored[year]))
+    sys.stdout.write('{0} years restored into {1} in {2}.\n'.format(
+        len(restored), path, _duration(time.time() - start)))
+    return 0
 
 
 class RetroChadSql(object):
@@ -1624,11 +7269,7 @@ class RetroChadSql(object):
         self._envir = Environment()
         self._root = tk.Tk()
         self._root.title('RetroChadSql')
-        self._tasks = Tasks([(name, {'name': name})
-            for name in ['Download', 'Unzip', 'Assemble', 'Define', 'Load']])
-        self._tasks.set_attr(
-            'gerund',
-            ['downloading', 'unzipping', 'assembling', 'defining', 'loading'])
+        self._tasks = _make_tasks()
         constants = {'version': VERSION,
                      'license': LICENSE,
                      'years': AVAILABLE_YEARS}
@@ -1640,11 +7281,28 @@ class RetroChadSql(object):
         self._root.mainloop()
 
     def _process(self, config):
-        processer = Processer(self._root, self._envir, self._tasks, config)
-        processer.process()
+        events = Queue.Queue()
+        worker = (Planner if config.get('plan') else
+                  Watcher if config.get('watch') else
+                  Coordinator if config.get('coordinate') else
+                  Processer)
+        processer = worker(self._envir, self._tasks, config, events)
+        monitor = Monitor(self._root, config['log_level'], processer, events)
+        monitor.start()
 
 
 def main():
+    kinds = {'--run': Processer, '--watch': Watcher,
+             '--coordinate': Coordinator, '--plan': Planner}
+    args = sys.argv[1:]
+    if len(args) == 2 and args[0] in kinds:
+        sys.exit(_run_headless(kinds[args[0]], _load_config(args[1])))
+    if len(args) == 2 and args[0] == '--work':
+        with closing(open(args[1])) as json_file:
+            config = dict({'log_level': 2}, **_encoded(json.load(json_file)))
+        sys.exit(_run_headless(Worker, config))
+    if len(args) == 3 and args[0] == '--restore':
+        sys.exit(_restore(args[1], args[2]))
     rcs = RetroChadSql()
     rcs.go()
 